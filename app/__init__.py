@@ -1,8 +1,18 @@
 from datetime import timezone
-from flask import Flask
+from flask import Flask, g
 from flask_login import LoginManager
 from .config import Config
 from .db import DB
+from .analytics import SellerAnalytics
+from .cache import UserCache
+from .votes import VoteBuffer
+from .ledger import LedgerCompactor
+from .holds import HoldSweeper
+from .flash_sales import FlashSaleGate
+from .checkout_keys import CheckoutKeySweeper
+from .cart_store import GuestCartCookie, make_cart_store
+from .subscriptions import cli as subscriptions_cli
+from .jobs import cli as jobs_cli
 
 
 login = LoginManager()
@@ -16,6 +26,17 @@ def create_app():
     app.config.from_object(Config)
 
     app.db = DB(app)
+    app.analytics = SellerAnalytics(app)
+    app.user_cache = UserCache(ttl=app.config['USER_CACHE_TTL'])
+    app.votes = VoteBuffer(app)
+    app.ledger = LedgerCompactor(app)
+    app.holds = HoldSweeper(app)
+    app.flash_sales = FlashSaleGate(app)
+    app.checkout_keys = CheckoutKeySweeper(app)
+    app.cart_store = make_cart_store(app)
+    app.guest_cart_cookie = GuestCartCookie(app)
+    app.cli.add_command(subscriptions_cli)
+    app.cli.add_command(jobs_cli)
     login.init_app(app)
 
     app.jinja_env.globals['eastern'] = ZoneInfo("America/New_York")
@@ -54,6 +75,15 @@ def create_app():
 
         return f"{month} {day}, {year} at {time_part}"
 
+    @app.after_request
+    def add_server_timing(response):
+        timings = g.get('server_timing')
+        if timings:
+            response.headers['Server-Timing'] = ', '.join(
+                f'{name};dur={duration:.1f}' for name, duration in timings)
+        response.headers['X-DB-Queries'] = str(g.get('db_statements', 0))
+        return response
+
     from .index import bp as index_bp
     app.register_blueprint(index_bp)
 
@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from .models.product_seller import ProductSeller
+
+
+class SellerAnalytics:
+    """Computes seller dashboard analytics on a background worker pool.
+
+    The most recent result for each (seller, window) is kept in memory as a
+    snapshot together with the time it was computed.  Pages never wait for
+    the computation: snapshot() returns whatever is cached and, if that is
+    missing or older than ANALYTICS_SNAPSHOT_TTL seconds, schedules a refresh.
+    Clients poll the JSON endpoint until the refreshed snapshot lands.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.ttl = app.config['ANALYTICS_SNAPSHOT_TTL']
+        self.executor = ThreadPoolExecutor(max_workers=app.config['ANALYTICS_WORKERS'],
+                                           thread_name_prefix='seller-analytics')
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._pending = set()
+        self._timings = {}
+
+    def snapshot(self, seller_id, days=30, limit=6):
+        """Return the cached snapshot for a seller as a dict with keys
+        analytics, computed_at, compute_ms, error and refreshing.
+        analytics is None until the first computation finishes.
+        """
+        key = (seller_id, days, limit)
+        with self._lock:
+            snap = self._snapshots.get(key)
+            stale = snap is None or time.monotonic() - snap['computed_mono'] > self.ttl
+            if stale and key not in self._pending:
+                self._pending.add(key)
+                self.executor.submit(self._compute, key)
+            refreshing = key in self._pending
+            if snap is None:
+                return {"analytics": None, "computed_at": None, "compute_ms": None,
+                        "error": None, "refreshing": refreshing}
+            return {"analytics": snap['analytics'],
+                    "computed_at": snap['computed_at'],
+                    "compute_ms": snap['compute_ms'],
+                    "error": snap['error'],
+                    "refreshing": refreshing}
+
+    def invalidate(self, seller_id):
+        """Mark every cached snapshot for a seller as stale, e.g. after one of
+        their order items changes fulfillment state."""
+        with self._lock:
+            for key, snap in self._snapshots.items():
+                if key[0] == seller_id:
+                    snap['computed_mono'] = float('-inf')
+
+    def timings(self, seller_id):
+        """Return compute-time statistics (in milliseconds) for a seller."""
+        with self._lock:
+            stats = self._timings.get(seller_id)
+            return dict(stats) if stats else None
+
+    def _compute(self, key):
+        seller_id, days, limit = key
+        started = time.perf_counter()
+        analytics = None
+        error = None
+        with self.app.app_context():
+            try:
+                analytics = ProductSeller.analytics_for_seller(seller_id, days=days, limit=limit)
+            except Exception as exc:
+                self.app.logger.exception("Analytics computation failed for seller %s", seller_id)
+                error = str(exc)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.app.logger.info("Analytics for seller %s (%s days) computed in %.1f ms",
+                             seller_id, days, elapsed_ms)
+
+        with self._lock:
+            self._pending.discard(key)
+
+            stats = self._timings.setdefault(seller_id, {
+                "runs": 0, "failures": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0
+            })
+            stats["runs"] += 1
+            stats["last_ms"] = elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["total_ms"] += elapsed_ms
+            stats["avg_ms"] = stats["total_ms"] / stats["runs"]
+            if error:
+                stats["failures"] += 1
+
+            previous = self._snapshots.get(key)
+            if analytics is None and previous is not None:
+                # keep serving the last good numbers, but surface the failure
+                previous['error'] = error
+                previous['computed_mono'] = time.monotonic()
+                return
+            self._snapshots[key] = {
+                "analytics": analytics,
+                "computed_at": datetime.now(timezone.utc),
+                "computed_mono": time.monotonic(),
+                "compute_ms": elapsed_ms,
+                "error": error
+            }
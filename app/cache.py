@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+class UserCache:
+    """A small in-process cache of per-user page fragments.
+
+    Keys are tuples whose first element is the user id, so everything cached
+    for a user can be dropped at once with invalidate(user_id) when that
+    user's data changes (e.g. after checkout).  Entries also expire after
+    `ttl` seconds to bound staleness for changes made by other users.
+    """
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def _evict(self):
+        # drop expired entries first; if still full, drop the oldest half
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._entries.items() if expires < now]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            by_age = sorted(self._entries.items(), key=lambda item: item[1][0])
+            for key, _ in by_age[:len(by_age) // 2]:
+                del self._entries[key]
@@ -1,8 +1,11 @@
 from decimal import Decimal
+import math
+import uuid
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app as app
 from flask_login import login_required, current_user
 
 from .models.cart import Cart
+from .models.checkout_key import CheckoutKey
 from .models.order import Order
 from types import SimpleNamespace
 
@@ -21,6 +24,131 @@ def _handle_error(user_id, message, status_code=400):
     return redirect(url_for('cart.cart', user_id=user_id))
 
 
+def merge_guest_cart(user_id, response):
+    """Move the visitor's guest cart, if any, into user_id's cart and drop
+    the guest cookie from response.  Called right after logging in.  If the
+    merge fails the guest cart is put back and the cookie kept, so the next
+    login merges it instead."""
+    token = app.guest_cart_cookie.token(request)
+    if token is None:
+        return response
+    # popped before merging so two logins racing with one cookie merge it once
+    lines = app.cart_store.pop(token)
+    if lines:
+        try:
+            merged, short = Cart.merge_guest_lines(user_id, lines)
+        except Exception:
+            app.logger.exception("Merging guest cart into user %s's cart failed; keeping it", user_id)
+            for listing_id, quantity in lines.items():
+                try:
+                    app.cart_store.add(token, listing_id, quantity)
+                except ValueError:
+                    # the visitor filled the cart again meanwhile; keep what fits
+                    pass
+            flash("Your cart could not be saved to your account right now; "
+                  "it will be added the next time you log in.", 'warning')
+            return response
+        if short:
+            flash(f"{short} item{'s' if short != 1 else ''} from your cart could not be added in full; "
+                  "they sold out in the meantime.", 'warning')
+        elif merged:
+            flash("Your cart was saved to your account.", 'info')
+    app.guest_cart_cookie.clear(response)
+    return response
+
+
+def _guest_response(response, token):
+    # re-sign on every change so an active cart's cookie does not expire
+    app.guest_cart_cookie.set(response, token)
+    return response
+
+
+@bp.route('/guest', methods=['GET'])
+def guest_cart():
+    if current_user.is_authenticated:
+        return redirect(url_for('cart.cart', user_id=current_user.id))
+
+    token = app.guest_cart_cookie.token(request)
+    items = Cart.describe_guest_lines(app.cart_store.lines(token)) if token else []
+    total_price = sum((item.subtotal for item in items), Decimal("0"))
+    return render_template('guest_cart.html',
+                           title='My Cart',
+                           items=items,
+                           total=total_price)
+
+
+@bp.route('/guest/add', methods=['POST'])
+def guest_add_item():
+    """Add to a logged-out visitor's cart.  Only touches the cart store;
+    the listing is checked when the cart is shown or merged at login."""
+    if current_user.is_authenticated:
+        return add_item(current_user.id)
+
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        listing_id = payload.get('listing_id')
+        quantity = payload.get('quantity', 1)
+    else:
+        listing_id = request.form.get('listing_id')
+        quantity = request.form.get('quantity', 1)
+
+    try:
+        listing_id = int(listing_id)
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return _guest_error("Missing listing_id.")
+    if quantity <= 0:
+        return _guest_error("Quantity must be positive.")
+
+    token = app.guest_cart_cookie.token(request) or app.guest_cart_cookie.new_token()
+    try:
+        app.cart_store.add(token, listing_id, quantity)
+    except ValueError as exc:
+        return _guest_error(str(exc))
+
+    if request.is_json:
+        return _guest_response(jsonify({"ok": True}), token)
+    flash("Added to cart.")
+    return _guest_response(redirect(url_for('cart.guest_cart')), token)
+
+
+@bp.route('/guest/update/<int:listing_id>', methods=['POST'])
+def guest_update_item(listing_id):
+    if current_user.is_authenticated:
+        return redirect(url_for('cart.cart', user_id=current_user.id))
+
+    token = app.guest_cart_cookie.token(request)
+    if token is None:
+        return _guest_error("Cart item not found.")
+    if request.is_json:
+        quantity = (request.get_json(silent=True) or {}).get('quantity')
+    else:
+        quantity = request.form.get('quantity')
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return _guest_error("Quantity must be zero or positive.")
+    if quantity < 0:
+        return _guest_error("Quantity must be zero or positive.")
+
+    try:
+        app.cart_store.set(token, listing_id, quantity)
+    except ValueError as exc:
+        return _guest_error(str(exc))
+
+    if request.is_json:
+        return _guest_response(jsonify({"ok": True}), token)
+    flash("Updated cart item." if quantity else "Removed item from cart.")
+    return _guest_response(redirect(url_for('cart.guest_cart')), token)
+
+
+def _guest_error(message):
+    if request.is_json:
+        return jsonify({"error": message}), 400
+    flash(message)
+    return redirect(url_for('cart.guest_cart'))
+
+
 @bp.route('/<int:user_id>', methods=['GET'])
 @login_required
 def cart(user_id):
@@ -100,6 +228,45 @@ def update_item(user_id, listing_id):
     return redirect(url_for('cart.cart', user_id=user_id))
 
 
+@bp.route('/<int:user_id>/bulk', methods=['POST'])
+@login_required
+def bulk_update(user_id):
+    """Apply many cart changes in one transaction.  Takes JSON
+    {"changes": [{"listing_id": 1, "op": "add"|"set"|"remove", "quantity": 2}, ...],
+     "move_saved": false} and answers {"ok": true, "lines": <lines touched>}
+    or a 400 error naming the first line that could not be applied, in
+    which case nothing was changed."""
+    _ensure_owner(user_id)
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object."}), 400
+    changes = payload.get('changes') or []
+    if not isinstance(changes, list):
+        return jsonify({"error": "changes must be a list."}), 400
+    if len(changes) > app.config['CART_BULK_MAX_CHANGES']:
+        return jsonify({"error": f"At most {app.config['CART_BULK_MAX_CHANGES']} changes per request."}), 400
+
+    try:
+        lines = Cart.apply_changes(user_id, changes, move_saved=bool(payload.get('move_saved')))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"ok": True, "lines": lines}), 200
+
+
+@bp.route('/<int:user_id>/saved/move-all', methods=['POST'])
+@login_required
+def move_all_saved_to_cart(user_id):
+    _ensure_owner(user_id)
+    try:
+        moved = Cart.move_all_saved_to_cart(user_id)
+    except ValueError as exc:
+        flash(str(exc), 'danger')
+    else:
+        flash(f'Moved {moved} saved item{"s" if moved != 1 else ""} to your cart.', 'success')
+    return redirect(url_for('cart.cart', user_id=user_id))
+
+
 @bp.route('/<int:user_id>/remove/<int:listing_id>', methods=['POST'])
 @login_required
 def remove_item(user_id, listing_id):
@@ -154,21 +321,52 @@ def checkout(user_id):
     _ensure_owner(user_id)
 
     shipping_info = None
+    idempotency_key = request.headers.get('Idempotency-Key')
     if request.is_json:
         payload = request.get_json(silent=True) or {}
         potential = payload.get('shipping')
         if isinstance(potential, dict):
             shipping_info = potential
+        idempotency_key = idempotency_key or payload.get('idempotency_key')
     else:
         shipping_fields = ['street', 'city', 'state', 'zip_code', 'apt']
         incoming = {field: request.form.get(field, '').strip() for field in shipping_fields}
         if any(incoming.values()):
             shipping_info = incoming
+        idempotency_key = idempotency_key or request.form.get('idempotency_key')
+
+    try:
+        order_id = Cart.checkout(user_id, shipping_info=shipping_info, idempotency_key=idempotency_key)
+    except ValueError as exc:
+        return _handle_error(user_id, str(exc))
+    app.user_cache.invalidate(user_id)
+
+    flash("Order placed successfully.")
+    if request.is_json:
+        return jsonify({"order_id": order_id}), 200
+    return redirect(url_for('cart.order_detail', user_id=user_id, order_id=order_id))
+
+
+@bp.route('/<int:user_id>/buy/<int:listing_id>', methods=['POST'])
+@login_required
+def buy_now(user_id, listing_id):
+    _ensure_owner(user_id)
+
+    if request.is_json:
+        quantity = request.json.get('quantity', 1)
+    else:
+        quantity = request.form.get('quantity', type=int)
+
+    try:
+        quantity = int(quantity) if quantity is not None else 1
+    except (TypeError, ValueError):
+        quantity = 1
 
     try:
-        order_id = Cart.checkout(user_id, shipping_info=shipping_info)
+        order_id = Cart.buy_now(user_id, listing_id, quantity)
     except ValueError as exc:
         return _handle_error(user_id, str(exc))
+    app.user_cache.invalidate(user_id)
 
     flash("Order placed successfully.")
     if request.is_json:
@@ -181,6 +379,18 @@ def checkout(user_id):
 def payment(user_id):
     _ensure_owner(user_id)
 
+    if request.method == 'POST':
+        # a retry of a payment that already went through finds the cart
+        # empty, so answer it with the original order before looking
+        try:
+            key = CheckoutKey.clean(request.headers.get('Idempotency-Key') or request.form.get('idempotency_key'))
+        except ValueError:
+            key = None
+        order_id = CheckoutKey.completed_order(user_id, key) if key else None
+        if order_id is not None:
+            flash('Payment received! Your order has been placed.', 'success')
+            return redirect(url_for('cart.order_detail', user_id=user_id, order_id=order_id))
+
     items = Cart.get_by_user(user_id)
     if not items:
         flash('Add some items to your cart before checking out.', 'warning')
@@ -190,10 +400,16 @@ def payment(user_id):
 
     fields = ['card_number', 'expiration', 'cvv', 'street', 'city', 'state', 'zip_code', 'apt']
     form_data = {field: '' for field in fields}
+    # one key per rendered form, so a resubmitted or retried payment
+    # returns the order the first submission placed
+    form_data['idempotency_key'] = uuid.uuid4().hex
 
     if request.method == 'POST':
         for field in fields:
             form_data[field] = request.form.get(field, '').strip()
+        form_data['idempotency_key'] = (request.headers.get('Idempotency-Key')
+                                        or request.form.get('idempotency_key')
+                                        or form_data['idempotency_key'])
 
         required_labels = {
             'card_number': 'card number',
@@ -230,10 +446,12 @@ def payment(user_id):
                 "apt": form_data["apt"]
             }
             try:
-                order_id = Cart.checkout(user_id, shipping_info=shipping_info)
+                order_id = Cart.checkout(user_id, shipping_info=shipping_info,
+                                         idempotency_key=form_data['idempotency_key'])
             except ValueError as exc:
                 flash(str(exc), 'danger')
             else:
+                app.user_cache.invalidate(user_id)
                 flash('Payment received! Your order has been placed.', 'success')
                 return redirect(url_for('cart.order_detail', user_id=user_id, order_id=order_id))
 
@@ -248,11 +466,18 @@ def payment(user_id):
 @login_required
 def orders(user_id):
     _ensure_owner(user_id)
-    orders = Order.list_by_user(user_id)
+    per_page = 20
+    total_orders = Order.count_by_user(user_id)
+    total_pages = max(1, math.ceil(total_orders / per_page))
+    page = max(1, min(request.args.get('page', 1, type=int), total_pages))
+    orders = Order.list_by_user(user_id, page=page, per_page=per_page)
     return render_template('orders.html',
                            title='My Orders',
                            user_id=user_id,
-                           orders=orders)
+                           orders=orders,
+                           total_orders=total_orders,
+                           page=page,
+                           total_pages=total_pages)
 
 
 @bp.route('/<int:user_id>/orders/<int:order_id>', methods=['GET'])
@@ -357,10 +582,12 @@ def seller_orders_view(seller_id):
 def fulfill_item(seller_id, item_id):
     _ensure_owner(seller_id)
     try:
-        Order.mark_item_fulfilled(seller_id, item_id)
+        buyer_id = Order.mark_item_fulfilled(seller_id, item_id)
     except ValueError as exc:
         flash(str(exc), 'danger')
     else:
+        app.analytics.invalidate(seller_id)
+        app.user_cache.invalidate(buyer_id)
         flash("Marked item as fulfilled.", 'success')
     return redirect(url_for('cart.seller_orders_view', seller_id=seller_id))
 
@@ -371,10 +598,12 @@ def update_item_status(seller_id, item_id):
     _ensure_owner(seller_id)
     status = request.form.get('status')
     try:
-        Order.update_item_status(seller_id, item_id, status)
+        buyer_id = Order.update_item_status(seller_id, item_id, status)
     except ValueError as exc:
         flash(str(exc), 'danger')
     else:
+        app.analytics.invalidate(seller_id)
+        app.user_cache.invalidate(buyer_id)
         flash(f"Updated status to '{status}'.", 'success')
     q = request.form.get('q')
     status_filter = request.form.get('current_status')
@@ -0,0 +1,169 @@
+import abc
+import atexit
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from itsdangerous import BadSignature, URLSafeSerializer
+
+
+class CartStore(abc.ABC):
+    """Where guest (logged-out) carts live.
+
+    A guest cart is just {listing_id: quantity}, keyed by a random token
+    the visitor carries in a signed cookie (see GuestCartCookie).  Guest
+    carts never touch the database until the visitor logs in and the cart
+    is merged into Cart (Cart.merge_guest_lines); in particular they hold
+    no inventory.  Backends implement the abstract methods below;
+    GUEST_CART_STORE picks one from CART_STORES.
+    """
+    @abc.abstractmethod
+    def lines(self, token):
+        """The cart's {listing_id: quantity} (empty if unknown)."""
+
+    @abc.abstractmethod
+    def add(self, token, listing_id, quantity):
+        """Add quantity to a line; raises ValueError past the cart's limits."""
+
+    @abc.abstractmethod
+    def set(self, token, listing_id, quantity):
+        """Set a line's quantity; 0 removes the line."""
+
+    @abc.abstractmethod
+    def pop(self, token):
+        """Remove the cart and return its lines."""
+
+    def close(self):
+        pass
+
+
+class MemoryCartStore(CartStore):
+    """Guest carts in this process's memory.
+
+    Reads and writes are a dict operation under a lock.  Carts idle for
+    GUEST_CART_IDLE_TTL seconds are evicted by a daemon thread every
+    GUEST_CART_SWEEP_INTERVAL seconds, and beyond GUEST_CART_MAX_CARTS the
+    least recently used cart is dropped at once, so memory stays bounded.
+    Carts are lost on restart and not shared between app processes, so
+    deployments with several processes need sticky sessions for guests.
+    """
+    def __init__(self, app):
+        self.idle_ttl = app.config['GUEST_CART_IDLE_TTL']
+        self.max_carts = app.config['GUEST_CART_MAX_CARTS']
+        self.max_lines = app.config['GUEST_CART_MAX_LINES']
+        self.max_quantity = app.config['GUEST_CART_MAX_QUANTITY']
+        self._lock = threading.Lock()
+        # token -> (last touched, {listing_id: quantity}), least recently used first
+        self._carts = OrderedDict()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(app.config['GUEST_CART_SWEEP_INTERVAL'],),
+                                        name='guest-cart-evictor', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def lines(self, token):
+        with self._lock:
+            entry = self._carts.get(token)
+            return dict(entry[1]) if entry else {}
+
+    def add(self, token, listing_id, quantity):
+        with self._lock:
+            lines = self._touch(token)
+            self._check(lines, listing_id, lines.get(listing_id, 0) + quantity)
+            lines[listing_id] = lines.get(listing_id, 0) + quantity
+
+    def set(self, token, listing_id, quantity):
+        with self._lock:
+            lines = self._touch(token)
+            if quantity <= 0:
+                lines.pop(listing_id, None)
+                return
+            self._check(lines, listing_id, quantity)
+            lines[listing_id] = quantity
+
+    def pop(self, token):
+        with self._lock:
+            entry = self._carts.pop(token, None)
+            return entry[1] if entry else {}
+
+    def evict_idle(self):
+        """Drop carts idle for longer than GUEST_CART_IDLE_TTL; returns how
+        many were dropped."""
+        cutoff = time.monotonic() - self.idle_ttl
+        evicted = 0
+        with self._lock:
+            # least recently used first, so stop at the first fresh cart
+            while self._carts:
+                token, (touched, _) = next(iter(self._carts.items()))
+                if touched > cutoff:
+                    break
+                del self._carts[token]
+                evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._carts)
+
+    def close(self):
+        self._stopped.set()
+
+    def _touch(self, token):
+        entry = self._carts.pop(token, None)
+        lines = entry[1] if entry else {}
+        self._carts[token] = (time.monotonic(), lines)
+        while len(self._carts) > self.max_carts:
+            self._carts.popitem(last=False)
+        return lines
+
+    def _check(self, lines, listing_id, quantity):
+        if listing_id not in lines and len(lines) >= self.max_lines:
+            raise ValueError(f"A cart can hold at most {self.max_lines} different items.")
+        if quantity > self.max_quantity:
+            raise ValueError(f"At most {self.max_quantity} of an item per cart.")
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            self.evict_idle()
+
+
+# GUEST_CART_STORE values and the backends they select
+CART_STORES = {
+    'memory': MemoryCartStore,
+}
+
+
+def make_cart_store(app):
+    name = app.config['GUEST_CART_STORE']
+    if name not in CART_STORES:
+        raise ValueError(f"Unknown GUEST_CART_STORE {name!r}; expected one of {', '.join(CART_STORES)}")
+    return CART_STORES[name](app)
+
+
+class GuestCartCookie:
+    """Reads and writes the signed cookie carrying a guest's cart token."""
+    NAME = 'guest_cart'
+
+    def __init__(self, app):
+        self.serializer = URLSafeSerializer(app.config['SECRET_KEY'], salt='guest-cart')
+        self.max_age = app.config['GUEST_CART_IDLE_TTL']
+
+    def token(self, request):
+        """The request's cart token, or None if it has no valid cookie."""
+        value = request.cookies.get(self.NAME)
+        if not value:
+            return None
+        try:
+            return self.serializer.loads(value)
+        except BadSignature:
+            return None
+
+    def new_token(self):
+        return secrets.token_urlsafe(16)
+
+    def set(self, response, token):
+        response.set_cookie(self.NAME, self.serializer.dumps(token), max_age=int(self.max_age),
+                            httponly=True, samesite='Lax')
+
+    def clear(self, response):
+        response.delete_cookie(self.NAME)
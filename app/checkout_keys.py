@@ -0,0 +1,44 @@
+import atexit
+import threading
+
+from .models.checkout_key import CheckoutKey
+
+
+class CheckoutKeySweeper:
+    """Deletes expired checkout idempotency keys in the background.
+
+    A key only has to outlive the retries of its checkout, so keys are
+    kept CHECKOUT_KEY_TTL seconds (a day by default).  Every
+    CHECKOUT_KEY_SWEEP_INTERVAL seconds a daemon thread deletes expired
+    ones in batches of CHECKOUT_KEY_SWEEP_BATCH until none are left.  An
+    expired key that has not been swept yet is treated as unused.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['CHECKOUT_KEY_SWEEP_INTERVAL']
+        self.batch_size = app.config['CHECKOUT_KEY_SWEEP_BATCH']
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='checkout-key-sweeper', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def sweep(self):
+        """Delete expired keys until none are left; returns how many were
+        deleted."""
+        total = 0
+        with self.app.app_context():
+            while True:
+                deleted = CheckoutKey.sweep(self.batch_size)
+                total += deleted
+                if deleted < self.batch_size:
+                    return total
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                self.app.logger.exception("Deleting expired checkout keys failed; will retry")
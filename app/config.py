@@ -2,15 +2,35 @@ import os
 from urllib.parse import quote_plus
 
 
-class Config(object):
-    SECRET_KEY = os.environ.get('SECRET_KEY')
-                                                                                 
-    SQLALCHEMY_DATABASE_URI = 'postgresql://{}:{}@{}:{}/{}'\
+def _database_uri(host, port):
+    return 'postgresql://{}:{}@{}:{}/{}'\
         .format(os.environ.get('DB_USER'),
                 quote_plus(os.environ.get('DB_PASSWORD') or ''),
-                os.environ.get('DB_HOST'),
-                os.environ.get('DB_PORT'),
+                host,
+                port,
                 os.environ.get('DB_NAME'))
+
+
+def _replica_uris(value):
+    """DB_REPLICAS is a comma-separated list of full URIs or host[:port]
+    entries that share the primary's user, password and database name."""
+    uris = []
+    for entry in (e.strip() for e in (value or '').split(',')):
+        if not entry:
+            continue
+        if '://' in entry:
+            uris.append(entry)
+        else:
+            host, _, port = entry.partition(':')
+            uris.append(_database_uri(host, port or os.environ.get('DB_PORT')))
+    return uris
+
+
+class Config(object):
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+                                                                                 
+    SQLALCHEMY_DATABASE_URI = _database_uri(os.environ.get('DB_HOST'), os.environ.get('DB_PORT'))
+    SQLALCHEMY_REPLICA_URIS = _replica_uris(os.environ.get('DB_REPLICAS'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -18,3 +38,43 @@ class Config(object):
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes')
     MAIL_FROM = os.environ.get('MAIL_FROM', os.environ.get('MAIL_USERNAME'))
+    ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', 2))
+    ANALYTICS_SNAPSHOT_TTL = int(os.environ.get('ANALYTICS_SNAPSHOT_TTL', 60))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    QUERY_FANOUT_WORKERS = int(os.environ.get('QUERY_FANOUT_WORKERS', 8))
+    DB_REQUEST_SCOPE = os.environ.get('DB_REQUEST_SCOPE', 'true').lower() in ('1', 'true', 'yes')
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+    DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 2))
+    DB_PRIMARY_STICKY_SECONDS = float(os.environ.get('DB_PRIMARY_STICKY_SECONDS', 10))
+    VOTE_FLUSH_INTERVAL = float(os.environ.get('VOTE_FLUSH_INTERVAL', 2))
+    VOTE_FLUSH_SIZE = int(os.environ.get('VOTE_FLUSH_SIZE', 500))
+    VOTE_FLUSH_ATTEMPTS = int(os.environ.get('VOTE_FLUSH_ATTEMPTS', 5))
+    BALANCE_COMPACT_INTERVAL = float(os.environ.get('BALANCE_COMPACT_INTERVAL', 10))
+    BALANCE_COMPACT_BATCH = int(os.environ.get('BALANCE_COMPACT_BATCH', 5000))
+    HOLD_TTL = int(os.environ.get('HOLD_TTL', 900))
+    HOLD_SWEEP_INTERVAL = float(os.environ.get('HOLD_SWEEP_INTERVAL', 30))
+    HOLD_SWEEP_BATCH = int(os.environ.get('HOLD_SWEEP_BATCH', 5000))
+    FLASH_SALE_SLOTS = int(os.environ.get('FLASH_SALE_SLOTS', 4))
+    FLASH_SALE_MAX_WAIT = float(os.environ.get('FLASH_SALE_MAX_WAIT', 10))
+    FLASH_SALE_SOLD_OUT_TTL = float(os.environ.get('FLASH_SALE_SOLD_OUT_TTL', 5))
+    CHECKOUT_KEY_TTL = int(os.environ.get('CHECKOUT_KEY_TTL', 86400))
+    CHECKOUT_KEY_SWEEP_INTERVAL = float(os.environ.get('CHECKOUT_KEY_SWEEP_INTERVAL', 300))
+    CHECKOUT_KEY_SWEEP_BATCH = int(os.environ.get('CHECKOUT_KEY_SWEEP_BATCH', 5000))
+    CART_BULK_MAX_CHANGES = int(os.environ.get('CART_BULK_MAX_CHANGES', 500))
+    GUEST_CART_STORE = os.environ.get('GUEST_CART_STORE', 'memory')
+    GUEST_CART_IDLE_TTL = float(os.environ.get('GUEST_CART_IDLE_TTL', 7 * 24 * 3600))
+    GUEST_CART_SWEEP_INTERVAL = float(os.environ.get('GUEST_CART_SWEEP_INTERVAL', 60))
+    GUEST_CART_MAX_CARTS = int(os.environ.get('GUEST_CART_MAX_CARTS', 100000))
+    GUEST_CART_MAX_LINES = int(os.environ.get('GUEST_CART_MAX_LINES', 100))
+    GUEST_CART_MAX_QUANTITY = int(os.environ.get('GUEST_CART_MAX_QUANTITY', 99))
+    SUBSCRIPTION_BATCH = int(os.environ.get('SUBSCRIPTION_BATCH', 1000))
+    SUBSCRIPTION_RETRY_DELAY = float(os.environ.get('SUBSCRIPTION_RETRY_DELAY', 3600))
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_LEASE = float(os.environ.get('JOB_LEASE', 300))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+    JOB_BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 10))
+    JOB_BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', 3600))
+    JOB_METRICS_INTERVAL = float(os.environ.get('JOB_METRICS_INTERVAL', 60))
+    JOB_METRICS_WINDOW = int(os.environ.get('JOB_METRICS_WINDOW', 1000))
+    JOB_SMTP_TIMEOUT = float(os.environ.get('JOB_SMTP_TIMEOUT', 30))
@@ -1,4 +1,16 @@
-from sqlalchemy import create_engine, text
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from flask import g, has_app_context, has_request_context, request, session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from .replicas import ReplicaSet
 
 
 class DB:
@@ -10,17 +22,45 @@ class DB:
     If you want to execute multiple SQL statements in the same
     transaction, use the following pattern:
 
-    >>> with app.db.engine.begin() as conn:
+    >>> with app.db.begin() as conn:
     >>>     # everything in this block executes as one transaction
     >>>     value = conn.execute(text('SELECT...'), bar='foo').first()[0]
     >>>     conn.execute(text('INSERT...'), par=value)
     >>>     conn.execute(text('UPDATE...'), par=value)
     >>>
 
+    Inside a request both go through the request's RequestScope, so the
+    whole request uses one pooled connection; see RequestScope.
+
+    With replicas configured (SQLALCHEMY_REPLICA_URIS), the read-only
+    statements of GET and HEAD requests, including their fan-out calls, go
+    to a healthy replica.  A request that writes switches to the primary
+    for the rest of the request, and the user's session then reads from the
+    primary for DB_PRIMARY_STICKY_SECONDS so they see their own writes.
     """
     def __init__(self, app):
+        self.app = app
         self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'],
                                     execution_options={"isolation_level": "SERIALIZABLE"})
+        # shared by all requests so the number of extra pooled connections
+        # checked out by fan-out queries stays bounded
+        # QUERY_FANOUT_WORKERS=0 turns fan-out off: calls run one after another
+        self.fanout_pool = ThreadPoolExecutor(max_workers=app.config['QUERY_FANOUT_WORKERS'],
+                                              thread_name_prefix='db-fanout') \
+            if app.config['QUERY_FANOUT_WORKERS'] > 0 else None
+        self.queries = NamedQueries(Path(app.root_path).parent / 'sql', reload=app.debug)
+        self.request_scope = app.config['DB_REQUEST_SCOPE']
+        self.replicas = ReplicaSet(app, app.config['SQLALCHEMY_REPLICA_URIS']) \
+            if app.config['SQLALCHEMY_REPLICA_URIS'] else None
+        self.sticky_seconds = app.config['DB_PRIMARY_STICKY_SECONDS']
+        for engine in [self.engine] + [r.engine for r in (self.replicas.replicas if self.replicas else [])]:
+            event.listen(engine, 'before_cursor_execute', self._count_statement)
+        app.teardown_request(self._close_scope)
+
+    def fanout(self):
+        """Return a QueryFanout for running independent queries of the
+        current request concurrently.  See QueryFanout for usage."""
+        return QueryFanout(self.app, self.fanout_pool, replica=self.replica())
 
     def execute(self, sqlstr, **kwargs):
         """Execute a single SQL statement sqlstr.
@@ -38,9 +78,370 @@ class DB:
         for additional details.  See models/*.py for examples of
         calling this function.
         """
+        return self._execute(text(sqlstr), kwargs)
+
+    def begin(self, isolation_level='SERIALIZABLE'):
+        """Context manager for one explicit transaction, SERIALIZABLE unless
+        another isolation_level is given, yielding its connection.
+        execute() calls made inside the block run in the same transaction."""
+        scope = self._scope()
+        if scope is not None:
+            return scope.begin(isolation_level)
+        self.wrote()
+        if isolation_level == 'SERIALIZABLE':
+            return self.engine.begin()
+        return self._begin_with(isolation_level)
+
+    @contextmanager
+    def _begin_with(self, isolation_level):
+        with self.engine.connect() as conn:
+            conn.execution_options(isolation_level=isolation_level)
+            with conn.begin():
+                yield conn
+
+    def replica(self):
+        """The replica that read-only statements of the current request go
+        to, or None when they go to the primary."""
+        if self.replicas is None or not has_app_context():
+            return None
+        if 'db_replica' not in g:
+            replica = None
+            if (has_request_context() and request.method in ('GET', 'HEAD')
+                    and session.get('db_primary_until', 0) < time.time()):
+                replica = self.replicas.choose()
+            g.db_replica = replica
+        return g.db_replica
+
+    def wrote(self):
+        """Send the rest of this request's reads, and the user's reads for
+        DB_PRIMARY_STICKY_SECONDS, to the primary."""
+        if self.replicas is None or not has_app_context():
+            return
+        g.db_replica = None
+        if has_request_context() and not g.get('db_wrote'):
+            # once per request, so the session cookie is rewritten at most once
+            g.db_wrote = True
+            session['db_primary_until'] = time.time() + self.sticky_seconds
+
+    def replica_failed(self, replica, error):
+        self.replicas.mark_down(replica, error)
+        g.db_replica = None
+
+    @contextmanager
+    def unscoped(self):
+        """Run the block's queries on their own connections, outside the
+        request's snapshot; for long-running calls that should not hold the
+        request connection or see a stale snapshot."""
+        previous = g.get('db_unscoped', False)
+        g.db_unscoped = True
+        try:
+            yield
+        finally:
+            g.db_unscoped = previous
+
+    def named(self, name, **kwargs):
+        """Execute the query stored in sql/<name>.sql, with the same
+        parameters and return value as execute().  The files are read once
+        at startup; see NamedQueries."""
+        return self._execute(self.queries.get(name), kwargs)
+
+    @staticmethod
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        # per-request statement count, reported by create_app() in X-DB-Queries
+        if has_app_context():
+            g.db_statements = g.get('db_statements', 0) + 1
+
+    def _scope(self):
+        # fan-out calls and background threads have an app context but no
+        # request context, so they keep using a connection per call
+        if not self.request_scope or not has_request_context() or g.get('db_unscoped'):
+            return None
+        scope = g.get('db_scope')
+        if scope is None:
+            scope = g.db_scope = RequestScope(self, read_only=request.method in ('GET', 'HEAD'))
+        return scope
+
+    def _close_scope(self, exc=None):
+        scope = g.pop('db_scope', None)
+        if scope is not None:
+            scope.close()
+
+    def _execute(self, clause, params):
+        scope = self._scope()
+        if scope is not None:
+            return scope.execute(clause, params)
+        if not _reads_only(clause):
+            self.wrote()
+        else:
+            replica = self.replica()
+            if replica is not None:
+                try:
+                    with replica.engine.begin() as conn:
+                        return _result(conn.execute(clause, params))
+                except OperationalError as exc:
+                    # reads are safe to repeat on the primary
+                    self.replica_failed(replica, exc)
         with self.engine.begin() as conn:
-            result = conn.execute(text(sqlstr), kwargs)
-            if result.returns_rows:
-                return result.fetchall()
+            return _result(conn.execute(clause, params))
+
+
+def _result(result):
+    if result.returns_rows:
+        return result.fetchall()
+    else:
+        return result.rowcount
+
+
+_WRITE_RE = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|CREATE|ALTER|DROP|TRUNCATE|LOCK|NEXTVAL|SETVAL)\b',
+                       re.IGNORECASE)
+
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+
+
+@lru_cache(maxsize=1024)
+def _is_read(sql):
+    # comments are dropped first: a leading header comment would hide the
+    # SELECT, and words like "update" in a comment are not writes
+    sql = _COMMENT_RE.sub(' ', sql)
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH')) and not _WRITE_RE.search(sql)
+
+
+def _reads_only(clause):
+    """Whether clause only reads; NamedQueries classifies its files once,
+    when they are loaded."""
+    read_only = getattr(clause, 'read_only', None)
+    return _is_read(clause.text) if read_only is None else read_only
+
+
+class RequestScope:
+    """The one pooled connection a request runs all of its queries on.
+
+    Without it every DB.execute() checks out a connection and runs its own
+    SERIALIZABLE transaction, eight to ten times for a busy page.  The scope
+    checks the connection out on first use and returns it when the request
+    ends (DB registers close() as a teardown handler).
+
+    GET and HEAD requests read from one READ ONLY, REPEATABLE READ
+    transaction, so every query of the page sees the same snapshot.  A
+    statement that may write (see _is_read) or a begin() block ends that
+    snapshot first and runs in its own transaction; later reads start a new
+    snapshot and see the write.  Other requests run each execute() in its
+    own transaction, as before, but on the shared connection.
+
+    When DB.replica() names a replica, the snapshot is taken on a
+    connection to it instead; if the replica fails, the statement is
+    retried on the primary and the rest of the request reads from there.
+    """
+    def __init__(self, db, read_only):
+        self.db = db
+        self.read_only = read_only
+        self.conn = None
+        self.mode = None
+        self.snapshot = None
+        self.depth = 0
+
+    def execute(self, clause, params):
+        if self.depth:
+            return _result(self.conn.execute(clause, params))
+        reads = _reads_only(clause)
+        if self.read_only and reads:
+            return self._read(clause, params)
+        self._end_snapshot()
+        if not reads:
+            # reads of POST requests run on the primary too, but only
+            # writes pin the user's later reads to it
+            self.db.wrote()
+        conn = self._connection('SERIALIZABLE')
+        with conn.begin():
+            return _result(conn.execute(clause, params))
+
+    @contextmanager
+    def begin(self, isolation_level='SERIALIZABLE'):
+        if self.depth:
+            # nested blocks join the enclosing transaction
+            self.depth += 1
+            try:
+                yield self.conn
+            finally:
+                self.depth -= 1
+            return
+        self._end_snapshot()
+        self.db.wrote()
+        conn = self._connection(isolation_level)
+        self.depth = 1
+        try:
+            with conn.begin():
+                yield conn
+        finally:
+            self.depth = 0
+
+    def close(self):
+        if self.conn is not None:
+            self._end_snapshot()
+            self.conn.close()
+            self.conn = None
+
+    def _read(self, clause, params):
+        if self.snapshot is None:
+            self.snapshot = self._begin_snapshot()
+        conn, _, replica = self.snapshot
+        try:
+            return _result(conn.execute(clause, params))
+        except OperationalError as exc:
+            self._end_snapshot()
+            if replica is None:
+                raise
+            self.db.replica_failed(replica, exc)
+            return self._read(clause, params)
+        except Exception:
+            # a failed statement aborts the transaction; callers that catch
+            # the error expect their next query to work, as it used to
+            self._end_snapshot()
+            raise
+
+    def _begin_snapshot(self):
+        replica = self.db.replica()
+        if replica is not None:
+            try:
+                conn = replica.engine.connect()
+                return conn, conn.begin(), replica
+            except OperationalError as exc:
+                self.db.replica_failed(replica, exc)
+        conn = self._connection('snapshot')
+        return conn, conn.begin(), None
+
+    def _connection(self, mode):
+        """The primary connection, set up for a read-only 'snapshot' or for
+        writes at the isolation level named by mode."""
+        if self.conn is None:
+            self.conn = self.db.engine.connect()
+        if mode != self.mode:
+            # applied by psycopg2 at the next BEGIN, so switching costs no round trip
+            if mode == 'snapshot':
+                self.conn.execution_options(isolation_level='REPEATABLE READ', postgresql_readonly=True)
             else:
-                return result.rowcount
+                self.conn.execution_options(isolation_level=mode, postgresql_readonly=False)
+            self.mode = mode
+        return self.conn
+
+    def _end_snapshot(self):
+        if self.snapshot is not None:
+            conn, transaction, replica = self.snapshot
+            self.snapshot = None
+            try:
+                # nothing to keep from a read-only transaction
+                transaction.rollback()
+            finally:
+                if replica is not None:
+                    conn.close()
+
+
+class QueryFanout:
+    """Runs independent model calls of one request concurrently.
+
+    Each submitted call runs on the shared fan-out pool inside an app
+    context (so app.db works as usual) and checks out its own pooled
+    connection.  Per-call durations are added to g.server_timing, which
+    create_app() reports in the response's Server-Timing header, and the
+    statements the calls ran are added to the request's g.db_statements.
+
+    >>> with app.db.fanout() as fan:
+    >>>     sellers = fan.submit('sellers', ProductSeller.get_active_by_product, pid)
+    >>>     reviews = fan.submit('reviews', ProductReview.get_for_product, pid)
+    >>> sellers.result(), reviews.result()
+
+    Leaving the block waits for every submitted call.
+    """
+    def __init__(self, app, executor, replica=None):
+        self.app = app
+        self.executor = executor
+        self.replica = replica
+        self.futures = []
+        self.timings = []
+        self.statements = []
+
+    def submit(self, name, fn, *args, **kwargs):
+        if self.executor is None:
+            return self._run_inline(name, fn, *args, **kwargs)
+
+        def run():
+            started = time.perf_counter()
+            with self.app.app_context():
+                # reads go to the same replica as the request's own reads
+                g.db_replica = self.replica
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.statements.append(g.get('db_statements', 0))
+                    self.timings.append((name, (time.perf_counter() - started) * 1000))
+        future = self.executor.submit(run)
+        self.futures.append(future)
+        return future
+
+    def _run_inline(self, name, fn, *args, **kwargs):
+        # fan-out turned off: run the call now, on the request's own
+        # connection, and hand back an already finished future
+        future = Future()
+        started = time.perf_counter()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        self.timings.append((name, (time.perf_counter() - started) * 1000))
+        self.futures.append(future)
+        return future
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for future in self.futures:
+            if not future.done():
+                future.exception()
+        timings = g.setdefault('server_timing', [])
+        timings.extend(self.timings)
+        timings.append(('fanout', (time.perf_counter() - self.started) * 1000))
+        g.db_statements = g.get('db_statements', 0) + sum(self.statements)
+        return False
+
+
+class NamedQueries:
+    """SQL statements loaded from the *.sql files of one directory.
+
+    Every file is read once, when the app starts, and kept as a TextClause
+    under its file name without the extension, marked read_only if it only
+    reads (see _is_read).  Reusing the same TextClause object on every call
+    lets SQLAlchemy's compiled-statement cache skip recompiling it.  With reload=True (the app runs in debug mode) a file is
+    re-read whenever its modification time changes, so edits show up
+    without a restart.
+    """
+    def __init__(self, directory, reload=False):
+        self.directory = Path(directory)
+        self.reload = reload
+        self._lock = threading.Lock()
+        self._queries = {}
+        if self.directory.is_dir():
+            for path in self.directory.glob('*.sql'):
+                self._load(path)
+
+    def get(self, name):
+        if self.reload:
+            path = self.directory / f'{name}.sql'
+            with self._lock:
+                entry = self._queries.get(name)
+            if path.exists() and (entry is None or entry[0] != os.path.getmtime(path)):
+                self._load(path)
+        with self._lock:
+            entry = self._queries.get(name)
+        if entry is None:
+            raise KeyError(f'No SQL file named {name}.sql in {self.directory}')
+        return entry[1]
+
+    def _load(self, path):
+        mtime = os.path.getmtime(path)
+        clause = text(path.read_text())
+        clause.read_only = _is_read(clause.text)
+        with self._lock:
+            self._queries[path.stem] = (mtime, clause)
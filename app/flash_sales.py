@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class _Waiter:
+    __slots__ = ('event', 'admitted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class _ListingQueue:
+    __slots__ = ('active', 'waiters')
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+
+class FlashSaleGate:
+    """Admits Buy now purchases of each listing a few at a time, in arrival
+    order.
+
+    A flash sale sends thousands of buyers at one ProductSeller row at
+    once.  Rather than letting them all open transactions that queue on
+    that row's lock (holding a pooled connection each), admit() lets at
+    most FLASH_SALE_SLOTS purchases per listing into the database and
+    parks the rest in a FIFO queue in memory, for up to
+    FLASH_SALE_MAX_WAIT seconds.  Once a purchase finds the listing sold
+    out, every waiting and later buyer is turned away without touching the
+    database for FLASH_SALE_SOLD_OUT_TTL seconds, after which the next
+    buyer checks the stock again (a restock in this process clears it at
+    once).  The gate is per process: with several app processes, up to
+    FLASH_SALE_SLOTS purchases per process reach the database, and their
+    conditional stock updates keep the listing from being oversold.
+    """
+    def __init__(self, app):
+        self.slots = app.config['FLASH_SALE_SLOTS']
+        self.max_wait = app.config['FLASH_SALE_MAX_WAIT']
+        self.sold_out_ttl = app.config['FLASH_SALE_SOLD_OUT_TTL']
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._sold_out = {}
+
+    def is_sold_out(self, listing_id):
+        with self._lock:
+            return self._is_sold_out(listing_id)
+
+    def mark_sold_out(self, listing_id):
+        """Record that the listing has no stock left and turn away everyone
+        waiting for it."""
+        with self._lock:
+            self._sold_out[listing_id] = time.monotonic() + self.sold_out_ttl
+            queue = self._queues.get(listing_id)
+            if queue is not None:
+                while queue.waiters:
+                    queue.waiters.popleft().event.set()
+
+    def restocked(self, listing_id):
+        with self._lock:
+            self._sold_out.pop(listing_id, None)
+
+    @contextmanager
+    def admit(self, listing_id):
+        """Wait for the listing's turn, then run the block as one of at most
+        FLASH_SALE_SLOTS purchases of it.  Raises ValueError if the listing
+        is known to be sold out or the wait is too long."""
+        with self._lock:
+            if self._is_sold_out(listing_id):
+                raise ValueError("Sold out.")
+            queue = self._queues.get(listing_id)
+            if queue is None:
+                queue = self._queues[listing_id] = _ListingQueue()
+            waiter = None
+            if queue.active < self.slots and not queue.waiters:
+                queue.active += 1
+            else:
+                waiter = _Waiter()
+                queue.waiters.append(waiter)
+
+        if waiter is not None:
+            waiter.event.wait(self.max_wait)
+            with self._lock:
+                if not waiter.admitted:
+                    if waiter in queue.waiters:
+                        queue.waiters.remove(waiter)
+                        self._drop_if_idle(listing_id, queue)
+                        raise ValueError("Too many buyers right now; please try again.")
+                    # released by mark_sold_out
+                    self._drop_if_idle(listing_id, queue)
+                    raise ValueError("Sold out.")
+        try:
+            yield
+        finally:
+            with self._lock:
+                queue.active -= 1
+                while queue.waiters and queue.active < self.slots:
+                    waiter = queue.waiters.popleft()
+                    waiter.admitted = True
+                    queue.active += 1
+                    waiter.event.set()
+                self._drop_if_idle(listing_id, queue)
+
+    def _is_sold_out(self, listing_id):
+        until = self._sold_out.get(listing_id)
+        if until is None:
+            return False
+        if until > time.monotonic():
+            return True
+        del self._sold_out[listing_id]
+        return False
+
+    def _drop_if_idle(self, listing_id, queue):
+        if not queue.active and not queue.waiters and self._queues.get(listing_id) is queue:
+            del self._queues[listing_id]
@@ -0,0 +1,45 @@
+import atexit
+import threading
+
+from .models.inventory_hold import InventoryHold
+
+
+class HoldSweeper:
+    """Releases expired inventory holds in the background.
+
+    Every HOLD_SWEEP_INTERVAL seconds a daemon thread releases holds past
+    their expires_at in batches of HOLD_SWEEP_BATCH until none are left,
+    making their units available to other carts again.  The cart lines
+    stay; checkout sells them from whatever stock is left.  Several app
+    processes may each run one: a batch skips holds another sweeper (or a
+    checkout) has locked.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['HOLD_SWEEP_INTERVAL']
+        self.batch_size = app.config['HOLD_SWEEP_BATCH']
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hold-sweeper', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def sweep(self):
+        """Release expired holds until none are left; returns how many
+        were released."""
+        total = 0
+        with self.app.app_context():
+            while True:
+                released = InventoryHold.sweep(self.batch_size)
+                total += released
+                if released < self.batch_size:
+                    return total
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                self.app.logger.exception("Releasing expired inventory holds failed; will retry")
@@ -1,10 +1,9 @@
 from flask import render_template, request, current_app as app
-from flask_login import current_user
-import datetime
+from flask_login import current_user, login_required
 import math
 
 from .models.product import Product
-from .models.purchase import Purchase
+from .models.order import Order
 from .models.product_seller import ProductSeller
 from .models.category import Category
 
@@ -48,16 +47,6 @@ def index():
     start = (page - 1) * per_page
     end = start + per_page
     paginated_products = products[start:end]
-                                                
-    if current_user.is_authenticated:
-        purchases = Purchase.get_all_by_uid_since(
-            current_user.id, datetime.datetime(1980, 9, 14, 0, 0, 0)
-        )
-        from .models.order import Order
-        orders = Order.list_by_user(current_user.id)
-    else:
-        purchases = None
-        orders = None
 
     # rating summary for each product
     rows = app.db.execute("""
@@ -81,9 +70,7 @@ def index():
     # render the page by adding information to the index.html file
     return render_template('index.html',
                            avail_products=paginated_products,
-                           purchase_history=purchases,
                            product_listings=listings_by_product,
-                           orders=orders,
                            page=page,
                            total_pages=total_pages,
                            page_numbers=list(range(1, total_pages + 1)),
@@ -94,3 +81,30 @@ def index():
                            sort=sort,
                            rating_threshold=rating_threshold
                            )
+
+
+@bp.route('/home/orders')
+@login_required
+def orders_panel():
+    """
+    HTML fragment for the home page's Orders tab, fetched after first paint.
+    Rendered pages are cached per user and dropped, in the process that made
+    the change, when the user checks out, a subscription delivery is ordered
+    for them or a seller changes one of their items' status.  The cache is
+    per process, so other processes can show the tab up to USER_CACHE_TTL
+    seconds stale.
+    """
+    per_page = 10
+    page = max(1, request.args.get('page', 1, type=int))
+
+    def render():
+        total_orders = Order.count_by_user(current_user.id)
+        total_pages = max(1, math.ceil(total_orders / per_page))
+        current = min(page, total_pages)
+        orders = Order.list_by_user(current_user.id, page=current, per_page=per_page)
+        return render_template('home_orders.html',
+                               orders=orders,
+                               page=current,
+                               total_pages=total_pages)
+
+    return app.user_cache.get_or_compute((current_user.id, 'home_orders', page), render)
@@ -0,0 +1,260 @@
+import json
+import random
+import select
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+from email.message import EmailMessage
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .models.job import CHANNEL, Job
+from .models.product import Product
+
+
+def send_email(payload):
+    """Send {recipient, subject, body} through MAIL_SERVER, or log it when
+    no mail server is configured."""
+    app = current_app
+    server = app.config.get('MAIL_SERVER')
+    sender = app.config.get('MAIL_FROM')
+    if not server or not sender:
+        app.logger.info("Email to %s\nSubject: %s\n\n%s", payload['recipient'], payload['subject'], payload['body'])
+        return
+    port = app.config.get('MAIL_PORT', 587)
+    username = app.config.get('MAIL_USERNAME')
+    password = app.config.get('MAIL_PASSWORD')
+    msg = EmailMessage()
+    msg['Subject'] = payload['subject']
+    msg['From'] = sender
+    msg['To'] = payload['recipient']
+    msg.set_content(payload['body'])
+    context = ssl.create_default_context()
+    with smtplib.SMTP(server, port, timeout=app.config['JOB_SMTP_TIMEOUT']) as smtp:
+        if app.config.get('MAIL_USE_TLS', True):
+            smtp.starttls(context=context)
+        if username and password:
+            smtp.login(username, password)
+        smtp.send_message(msg)
+
+
+def recompute_availability(payload):
+    """Set {product_id}'s Products.available from its listings."""
+    Product.recompute_available(payload['product_id'])
+
+
+# job kinds and the functions that run them; a handler gets the job's
+# payload and runs inside an app context.  Raising fails the attempt.
+JOB_HANDLERS = {
+    'send_email': send_email,
+    'recompute_availability': recompute_availability,
+}
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+class JobMetrics:
+    """Per-kind throughput and latency of the jobs one worker ran.
+
+    Keeps counts since the worker started and the last JOB_METRICS_WINDOW
+    run and wait times per kind, where run time is how long the handler
+    took and wait time how long the job was runnable before it was
+    claimed.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def record(self, kind, outcome, run_seconds, wait_seconds):
+        """outcome is 'done', 'retried' or 'dead'."""
+        with self._lock:
+            stats = self._kinds.get(kind)
+            if stats is None:
+                stats = self._kinds[kind] = {'done': 0, 'retried': 0, 'dead': 0,
+                                             'run': deque(maxlen=self.window),
+                                             'wait': deque(maxlen=self.window)}
+            stats[outcome] += 1
+            stats['run'].append(run_seconds)
+            stats['wait'].append(wait_seconds)
+
+    def snapshot(self):
+        """{kind: {done, retried, dead, per_second, run_ms: {p50, p95, p99},
+        wait_ms: {...}}}; per_second counts finished jobs since start."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        result = {}
+        with self._lock:
+            for kind, stats in self._kinds.items():
+                run, wait = sorted(stats['run']), sorted(stats['wait'])
+                result[kind] = {
+                    'done': stats['done'],
+                    'retried': stats['retried'],
+                    'dead': stats['dead'],
+                    'per_second': round(stats['done'] / elapsed, 2),
+                    'run_ms': {f'p{p}': round(1000 * _percentile(run, p), 1) for p in (50, 95, 99)},
+                    'wait_ms': {f'p{p}': round(1000 * _percentile(wait, p), 1) for p in (50, 95, 99)},
+                }
+        return result
+
+
+class JobWorker:
+    """Runs queued jobs on a pool of threads until stopped.
+
+    Each thread claims one job at a time with SKIP LOCKED, so any number
+    of threads, processes and hosts can work the same queue.  Idle threads
+    sleep until a LISTEN connection hears enqueue's NOTIFY, or at most
+    JOB_POLL_INTERVAL seconds (which also picks up retries and delayed
+    jobs, which nobody notifies about).  A failed attempt is retried after
+    an exponential backoff of JOB_BACKOFF_BASE * 2^(attempt - 1) seconds,
+    capped at JOB_BACKOFF_MAX and jittered; after max_attempts the job is
+    left as a dead letter (`flask jobs dead`, `flask jobs retry`), as is
+    a job whose last attempt outlived its JOB_LEASE without finishing.
+    Metrics are logged every JOB_METRICS_INTERVAL seconds.
+    """
+    def __init__(self, app, threads=None, kinds=None):
+        self.app = app
+        self.threads = threads or app.config['JOB_WORKER_THREADS']
+        self.kinds = list(kinds or JOB_HANDLERS)
+        unknown = set(self.kinds) - set(JOB_HANDLERS)
+        if unknown:
+            raise ValueError(f"Unknown job kinds: {', '.join(sorted(unknown))}")
+        self.lease = app.config['JOB_LEASE']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.backoff_base = app.config['JOB_BACKOFF_BASE']
+        self.backoff_max = app.config['JOB_BACKOFF_MAX']
+        self.metrics = JobMetrics(app.config['JOB_METRICS_WINDOW'])
+        self._wake = threading.Condition()
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Work the queue until stop() is called."""
+        workers = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                   for i in range(self.threads)]
+        for thread in workers + [threading.Thread(target=self._listen, name='job-listener', daemon=True),
+                                 threading.Thread(target=self._reap, name='job-reaper', daemon=True),
+                                 threading.Thread(target=self._report, name='job-metrics', daemon=True)]:
+            thread.start()
+        try:
+            for thread in workers:
+                thread.join()
+        finally:
+            self.stop()
+            self._log_metrics()
+
+    def stop(self):
+        self._stopped.set()
+        with self._wake:
+            self._wake.notify_all()
+
+    def run_one(self, job):
+        """Run a claimed job and record its outcome."""
+        started = time.perf_counter()
+        try:
+            JOB_HANDLERS[job.kind](job.payload)
+        except Exception as e:
+            self.app.logger.exception("Job %s (%s) failed on attempt %s of %s",
+                                      job.id, job.kind, job.attempts, job.max_attempts)
+            dead = job.fail(f'{type(e).__name__}: {e}'[:2000], self.backoff(job.attempts))
+            outcome = 'dead' if dead else 'retried'
+        else:
+            job.complete()
+            outcome = 'done'
+        self.metrics.record(job.kind, outcome, time.perf_counter() - started, float(job.waited))
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _work(self):
+        with self.app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    job = Job.claim(self.kinds, self.lease)
+                    if job is not None:
+                        self.run_one(job)
+                        continue
+                except Exception:
+                    # the job, if any, runs again once its lease is up
+                    self.app.logger.exception("Claiming or finishing a job failed; will retry")
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                conn = self.app.db.engine.raw_connection()
+                try:
+                    conn.set_session(autocommit=True)
+                    conn.cursor().execute(f'LISTEN {CHANNEL}')
+                    while not self._stopped.is_set():
+                        if select.select([conn], [], [], self.poll_interval)[0]:
+                            conn.poll()
+                            if conn.notifies:
+                                woken = len(conn.notifies)
+                                conn.notifies.clear()
+                                with self._wake:
+                                    self._wake.notify(woken)
+                finally:
+                    conn.close()
+            except Exception:
+                self.app.logger.exception("Listening for new jobs failed; polling every %ss until reconnected",
+                                          self.poll_interval)
+                self._stopped.wait(self.poll_interval)
+
+    def _reap(self):
+        with self.app.app_context():
+            while not self._stopped.wait(self.poll_interval):
+                try:
+                    buried = Job.bury_expired()
+                    if buried:
+                        self.app.logger.warning("%s jobs ran out of attempts with their lease expired; "
+                                                "marked dead", buried)
+                except Exception:
+                    self.app.logger.exception("Marking expired jobs dead failed; will retry")
+
+    def _report(self):
+        while not self._stopped.wait(self.app.config['JOB_METRICS_INTERVAL']):
+            self._log_metrics()
+
+    def _log_metrics(self):
+        snapshot = self.metrics.snapshot()
+        if snapshot:
+            self.app.logger.info("Job metrics: %s", json.dumps(snapshot, sort_keys=True))
+
+
+cli = AppGroup('jobs', help='Background job queue.')
+
+
+@cli.command('stats')
+def stats():
+    """Queued, running, runnable and dead jobs per kind."""
+    click.echo(f'{"kind":<24} {"queued":>8} {"running":>8} {"runnable":>9} {"dead":>6} {"oldest wait":>12}')
+    for kind, queued, running, runnable, dead, oldest in Job.counts():
+        click.echo(f'{kind:<24} {queued:>8} {running:>8} {runnable:>9} {dead:>6} {float(oldest):>11.1f}s')
+
+
+@cli.command('dead')
+@click.option('--kind', help='Only jobs of this kind.')
+@click.option('--limit', default=50, show_default=True)
+def dead(kind, limit):
+    """List dead-letter jobs, most recent first."""
+    for job_id, job_kind, payload, attempts, last_error, run_at in Job.dead(kind, limit):
+        click.echo(f'{job_id} {job_kind} after {attempts} attempts at {run_at:%Y-%m-%d %H:%M:%S}: '
+                   f'{last_error}\n    {json.dumps(payload)}')
+
+
+@cli.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+@click.option('--kind', help='Only jobs of this kind.')
+def retry(ids, kind):
+    """Queue dead jobs (all, or the given IDS) again."""
+    click.echo(f'{Job.retry_dead(kind, list(ids) or None)} jobs queued again')
@@ -0,0 +1,45 @@
+import atexit
+import threading
+
+from .models.balance import BalanceLedger
+
+
+class LedgerCompactor:
+    """Folds balance_ledger entries into Users.balance in the background.
+
+    Every BALANCE_COMPACT_INTERVAL seconds a daemon thread compacts pending
+    entries in batches of BALANCE_COMPACT_BATCH until none are left.  The
+    balance users see never depends on it: reads add the pending entries to
+    Users.balance, so compaction only bounds how many entries those reads
+    sum.  Several app processes may run one each; an advisory lock lets
+    only one compact at a time.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['BALANCE_COMPACT_INTERVAL']
+        self.batch_size = app.config['BALANCE_COMPACT_BATCH']
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ledger-compactor', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def compact(self):
+        """Compact until no pending entries are left; returns how many
+        entries were folded."""
+        total = 0
+        with self.app.app_context():
+            while True:
+                folded = BalanceLedger.compact(self.batch_size)
+                total += folded
+                if folded < self.batch_size:
+                    return total
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.compact()
+            except Exception:
+                self.app.logger.exception("Balance ledger compaction failed; will retry")
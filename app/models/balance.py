@@ -0,0 +1,107 @@
+from flask import current_app as app
+from sqlalchemy import text
+
+
+# Amount of a user's ledger entries not yet folded into Users.balance; use
+# as `balance + PENDING` in queries over Users.
+PENDING = '''COALESCE((SELECT SUM(bl.amount)
+                 FROM balance_ledger bl
+                 WHERE bl.user_id = Users.id AND bl.compacted_at IS NULL), 0)'''
+
+
+class BalanceLedger:
+    """Append-only balance changes; see balance_ledger in db/create.sql."""
+
+    @staticmethod
+    def append(conn, entries):
+        """Insert (user_id, amount, kind, order_id) entries in one statement
+        on conn, inside the caller's transaction."""
+        if not entries:
+            return
+        conn.execute(text('''
+INSERT INTO balance_ledger (user_id, amount, kind, order_id)
+SELECT * FROM unnest(CAST(:users AS INT[]), CAST(:amounts AS DECIMAL[]),
+                     CAST(:kinds AS VARCHAR[]), CAST(:orders AS INT[]))
+'''), {
+            "users": [e[0] for e in entries],
+            "amounts": [e[1] for e in entries],
+            "kinds": [e[2] for e in entries],
+            "orders": [e[3] for e in entries],
+        })
+
+    @staticmethod
+    def lock_users(conn, user_ids):
+        """Lock the users' rows (FOR NO KEY UPDATE, in id order) on conn and
+        return {user_id: (balance including pending entries, address)}.
+
+        At READ COMMITTED the lock and the read must be separate statements:
+        a statement that waits for the lock re-reads the row compaction just
+        updated but keeps its old snapshot for the PENDING subquery, so the
+        entries compaction folded would be counted twice."""
+        user_ids = sorted(set(user_ids))
+        conn.execute(text('''
+SELECT id FROM Users WHERE id = ANY(:user_ids) ORDER BY id FOR NO KEY UPDATE
+'''), {"user_ids": user_ids})
+        return {row[0]: (row[1], row[2]) for row in conn.execute(text(f'''
+SELECT id, balance + {PENDING}, address FROM Users WHERE id = ANY(:user_ids)
+'''), {"user_ids": user_ids})}
+
+    @staticmethod
+    def deposit(user_id, amount):
+        app.db.execute('''
+INSERT INTO balance_ledger (user_id, amount, kind)
+VALUES (:user_id, :amount, 'deposit')
+''', user_id=user_id, amount=amount)
+
+    @staticmethod
+    def withdraw(user_id, amount):
+        """Withdraw amount if the balance covers it; returns whether it did.
+        Locks the user's row so concurrent withdrawals and checkouts by the
+        same user cannot overdraw."""
+        with app.db.begin() as conn:
+            balance = conn.execute(text(f'''
+SELECT balance + {PENDING}
+FROM Users
+WHERE id = :user_id
+FOR NO KEY UPDATE
+'''), {"user_id": user_id}).scalar()
+            if balance is None or balance < amount:
+                return False
+            BalanceLedger.append(conn, [(user_id, -amount, 'withdrawal', None)])
+            return True
+
+    @staticmethod
+    def compact(batch_size=5000):
+        """Fold up to batch_size pending entries into Users.balance, oldest
+        first, and return how many were folded.  Entries still being
+        written by open transactions are not visible yet and are picked up
+        by a later run.  Returns 0 without waiting if another process is
+        compacting."""
+        with app.db.engine.begin() as conn:
+            if not conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext('balance_ledger'))")).scalar():
+                return 0
+            return conn.execute(text('''
+WITH folded AS (
+    UPDATE balance_ledger bl
+    SET compacted_at = now()
+    WHERE bl.entry_id IN (SELECT entry_id
+                          FROM balance_ledger
+                          WHERE compacted_at IS NULL
+                          ORDER BY entry_id
+                          LIMIT :batch_size)
+    RETURNING bl.user_id, bl.amount
+),
+totals AS (
+    SELECT user_id, SUM(amount) AS amount, COUNT(*) AS entries
+    FROM folded
+    GROUP BY user_id
+),
+applied AS (
+    UPDATE Users u
+    SET balance = u.balance + t.amount
+    FROM totals t
+    WHERE u.id = t.user_id
+    RETURNING t.entries
+)
+SELECT COALESCE(SUM(entries), 0) FROM applied
+'''), {"batch_size": batch_size}).scalar()
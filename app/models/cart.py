@@ -2,6 +2,10 @@ from decimal import Decimal
 from flask import current_app as app
 from sqlalchemy import text
 
+from .balance import BalanceLedger
+from .inventory_hold import InventoryHold
+from .checkout_key import CheckoutKey
+
 
 class Cart:
     def __init__(self, user_id, listing_id, product_id, product_name, seller_id,
@@ -37,6 +41,94 @@ ORDER BY p.name
 
         return [Cart(*row) for row in rows]
 
+    @staticmethod
+    def describe_guest_lines(lines):
+        """Cart rows (user_id None) for a guest cart's {listing_id:
+        quantity}, at current prices; lines whose listing is gone,
+        inactive or in a flash sale are left out."""
+        if not lines:
+            return []
+        listing_ids = sorted(lines)
+        rows = app.db.execute("""
+SELECT ps.id,
+       ps.product_id,
+       p.name,
+       ps.seller_id,
+       s.firstname || ' ' || s.lastname AS seller_name,
+       ps.price
+FROM ProductSeller ps
+JOIN Products p ON ps.product_id = p.id
+JOIN Users s ON ps.seller_id = s.id
+WHERE ps.id = ANY(:listing_ids)
+  AND ps.is_active
+  AND NOT ps.flash_sale
+ORDER BY p.name
+""", listing_ids=listing_ids)
+
+        return [Cart(None, listing_id, product_id, name, seller_id, seller_name,
+                     price, lines[listing_id], price * lines[listing_id])
+                for listing_id, product_id, name, seller_id, seller_name, price in rows]
+
+    @staticmethod
+    def merge_guest_lines(user_id, lines):
+        """Add a guest cart's {listing_id: quantity} to the user's cart in
+        one statement, holding the units like add_item does.  Lines are cut
+        down to the stock that can still be held, and skipped if there is
+        none.  Returns (lines merged, lines cut down or skipped)."""
+        if not lines:
+            return 0, 0
+        listing_ids = sorted(lines)
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            merged = conn.execute(text("""
+WITH req AS (
+    SELECT *
+    FROM unnest(CAST(:listing_ids AS INT[]), CAST(:quantities AS INT[])) AS r(listing_id, quantity)
+),
+avail AS (
+    SELECT ps.id, LEAST(r.quantity, ps.quantity - ps.reserved) AS quantity
+    FROM ProductSeller ps
+    JOIN req r ON r.listing_id = ps.id
+    WHERE ps.is_active AND NOT ps.flash_sale AND ps.quantity > ps.reserved AND ps.quantity > 0
+    ORDER BY ps.id
+    FOR NO KEY UPDATE OF ps
+),
+listing AS (
+    UPDATE ProductSeller ps
+    SET reserved = ps.reserved + a.quantity
+    FROM avail a
+    WHERE ps.id = a.id
+    RETURNING ps.id, ps.product_id, ps.seller_id, ps.price, a.quantity
+),
+hold AS (
+    INSERT INTO inventory_holds (listing_id, user_id, quantity, expires_at)
+    SELECT id, :user_id, quantity, now() + make_interval(secs => :ttl)
+    FROM listing
+    ON CONFLICT (listing_id, user_id) DO UPDATE
+    SET quantity = inventory_holds.quantity + EXCLUDED.quantity,
+        expires_at = EXCLUDED.expires_at
+),
+line AS (
+    INSERT INTO Cart (user_id, product_id, listing_id, seller_id, unit_price, quantity)
+    SELECT :user_id, product_id, id, seller_id, price, quantity
+    FROM listing
+    ON CONFLICT (user_id, listing_id) DO UPDATE
+    SET quantity = Cart.quantity + EXCLUDED.quantity,
+        unit_price = EXCLUDED.unit_price,
+        product_id = EXCLUDED.product_id,
+        seller_id = EXCLUDED.seller_id
+)
+SELECT id, quantity FROM listing
+"""), {
+                "user_id": user_id,
+                "listing_ids": listing_ids,
+                "quantities": [lines[i] for i in listing_ids],
+                "ttl": app.config['HOLD_TTL'],
+            }).fetchall()
+
+        merged = dict(merged)
+        short = sum(1 for listing_id in listing_ids if merged.get(listing_id, 0) < lines[listing_id])
+        return len(merged), short
+
     @staticmethod
     def get_saved_by_user(user_id):
         rows = app.db.execute("""
@@ -60,47 +152,199 @@ ORDER BY s.saved_at DESC
 
     @staticmethod
     def add_item(user_id, listing_id, quantity=1):
+        """Add quantity units of the listing to the user's cart, holding
+        them for HOLD_TTL seconds so they cannot sell out before checkout.
+        Checks stock, takes the hold and upserts the cart line in one
+        statement."""
         if quantity is None or quantity <= 0:
             raise ValueError("Quantity must be positive.")
 
-        with app.db.engine.begin() as conn:
-            listing = conn.execute(text("""
-SELECT ps.id, ps.product_id, ps.seller_id, ps.price, ps.quantity, ps.is_active
-FROM ProductSeller ps
-WHERE ps.id = :listing_id
-"""), {"listing_id": listing_id}).first()
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            added = conn.execute(text("""
+WITH listing AS (
+    UPDATE ProductSeller
+    SET reserved = reserved + :quantity
+    WHERE id = :listing_id
+      AND is_active
+      AND NOT flash_sale
+      AND quantity - reserved >= :quantity
+    RETURNING id, product_id, seller_id, price
+),
+hold AS (
+    INSERT INTO inventory_holds (listing_id, user_id, quantity, expires_at)
+    SELECT id, :user_id, :quantity, now() + make_interval(secs => :ttl)
+    FROM listing
+    ON CONFLICT (listing_id, user_id) DO UPDATE
+    SET quantity = inventory_holds.quantity + EXCLUDED.quantity,
+        expires_at = EXCLUDED.expires_at
+),
+line AS (
+    INSERT INTO Cart (user_id, product_id, listing_id, seller_id, unit_price, quantity)
+    SELECT :user_id, product_id, id, seller_id, price, :quantity
+    FROM listing
+    ON CONFLICT (user_id, listing_id) DO UPDATE
+    SET quantity = Cart.quantity + EXCLUDED.quantity,
+        unit_price = EXCLUDED.unit_price,
+        product_id = EXCLUDED.product_id,
+        seller_id = EXCLUDED.seller_id
+)
+SELECT id FROM listing
+"""), {
+                "user_id": user_id,
+                "listing_id": listing_id,
+                "quantity": quantity,
+                "ttl": app.config['HOLD_TTL'],
+            }).first()
 
-            if not listing:
-                raise ValueError("Listing not found.")
+            if not added:
+                raise ValueError(InventoryHold.unavailable(conn, listing_id))
 
-            if not listing[5] or listing[4] <= 0:
-                raise ValueError("Listing is not available.")
+    # operations apply_changes() accepts for a cart line
+    CHANGE_OPS = ('add', 'set', 'remove')
 
-            existing_qty = conn.execute(text("""
-SELECT quantity FROM Cart
-WHERE user_id = :user_id AND listing_id = :listing_id
-"""), {"user_id": user_id, "listing_id": listing_id}).scalar()
+    @staticmethod
+    def apply_changes(user_id, changes=(), move_saved=False):
+        """Apply many cart changes in one transaction: either all of them
+        take effect or, if any line cannot be supplied, none do
+        (ValueError).
+
+        changes is a sequence of {"listing_id", "op", "quantity"} dicts,
+        applied in order: 'add' adds quantity units, 'set' makes the line
+        quantity units (adding the line if needed; 0 removes it) and
+        'remove' drops the line.  With move_saved, every saved-for-later
+        item is also added to the cart and taken off the saved list.  Holds
+        follow the new line quantities.  Returns the number of cart lines
+        touched."""
+        targets = {}
+        for change in changes:
+            if not isinstance(change, dict):
+                raise ValueError("Each change must be an object.")
+            op = change.get('op', 'add')
+            if op not in Cart.CHANGE_OPS:
+                raise ValueError(f"Unknown cart operation {op!r}.")
+            try:
+                listing_id = int(change.get('listing_id'))
+                quantity = int(change.get('quantity', 1 if op == 'add' else 0))
+            except (TypeError, ValueError):
+                raise ValueError("listing_id and quantity must be integers.")
+            if op == 'remove':
+                op, quantity = 'set', 0
+            if quantity < 0 or (op == 'add' and quantity == 0):
+                raise ValueError("Quantity must be positive.")
+            # fold successive changes of a line into one: the first 'set'
+            # fixes the quantity, later ones replace it, 'add's accumulate
+            mode, current = targets.get(listing_id, ('add', 0))
+            targets[listing_id] = ('set', quantity) if op == 'set' else (mode, current + quantity)
+
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            Cart._lock_owner(conn, user_id)
+
+            if move_saved:
+                moved = conn.execute(text("""
+DELETE FROM SavedItems
+WHERE user_id = :user_id
+RETURNING listing_id, quantity
+"""), {"user_id": user_id}).fetchall()
+                for listing_id, quantity in moved:
+                    mode, current = targets.get(listing_id, ('add', 0))
+                    targets[listing_id] = (mode, current + quantity)
 
-            new_qty = quantity + (existing_qty or 0)
-            if new_qty > listing[4]:
-                raise ValueError("Requested quantity exceeds available inventory.")
+            if not targets:
+                return 0
+            return Cart._apply_targets(conn, user_id, targets)
 
-            conn.execute(text("""
-INSERT INTO Cart (user_id, product_id, listing_id, seller_id, unit_price, quantity)
-VALUES (:user_id, :product_id, :listing_id, :seller_id, :unit_price, :quantity)
-ON CONFLICT (user_id, listing_id) DO UPDATE
-SET quantity = EXCLUDED.quantity,
-    unit_price = EXCLUDED.unit_price,
-    product_id = EXCLUDED.product_id,
-    seller_id = EXCLUDED.seller_id
+    @staticmethod
+    def _lock_owner(conn, user_id):
+        # one multi-line cart change per user at a time, as in checkout, so
+        # the lines and holds _apply_targets reads stay current until commit
+        conn.execute(text("""
+SELECT 1 FROM Users WHERE id = :user_id FOR NO KEY UPDATE
+"""), {"user_id": user_id})
+
+    @staticmethod
+    def _apply_targets(conn, user_id, targets):
+        """Bring the user's cart lines to targets ({listing_id: (mode,
+        quantity)}, mode 'add' or 'set') in one statement; the caller must
+        hold _lock_owner."""
+        listing_ids = sorted(targets)
+        applied = conn.execute(text("""
+WITH req AS (
+    SELECT *
+    FROM unnest(CAST(:listing_ids AS INT[]), CAST(:modes AS VARCHAR[]), CAST(:quantities AS INT[]))
+         AS r(listing_id, mode, quantity)
+),
+held AS (
+    SELECT listing_id, quantity
+    FROM inventory_holds
+    WHERE user_id = :user_id AND listing_id = ANY(CAST(:listing_ids AS INT[]))
+    FOR UPDATE
+),
+target AS (
+    SELECT r.listing_id,
+           COALESCE(h.quantity, 0) AS held,
+           CASE WHEN r.mode = 'add' THEN COALESCE(c.quantity, 0) + r.quantity ELSE r.quantity END AS new_qty,
+           CASE WHEN r.mode = 'add' THEN COALESCE(h.quantity, 0) + r.quantity ELSE r.quantity END AS new_held
+    FROM req r
+    LEFT JOIN held h ON h.listing_id = r.listing_id
+    LEFT JOIN Cart c ON c.user_id = :user_id AND c.listing_id = r.listing_id
+),
+listing AS (
+    UPDATE ProductSeller ps
+    SET reserved = ps.reserved - t.held + t.new_held
+    FROM target t
+    WHERE ps.id = t.listing_id
+      AND (t.new_held <= t.held
+           OR (ps.is_active AND NOT ps.flash_sale AND ps.quantity - ps.reserved + t.held >= t.new_held))
+    RETURNING ps.id, ps.product_id, ps.seller_id, ps.price, t.new_qty, t.new_held
+),
+released AS (
+    DELETE FROM inventory_holds h
+    USING listing l
+    WHERE h.user_id = :user_id AND h.listing_id = l.id AND l.new_held = 0
+),
+kept AS (
+    INSERT INTO inventory_holds (listing_id, user_id, quantity, expires_at)
+    SELECT id, :user_id, new_held, now() + make_interval(secs => :ttl)
+    FROM listing
+    WHERE new_held > 0
+    ON CONFLICT (listing_id, user_id) DO UPDATE
+    SET quantity = EXCLUDED.quantity,
+        expires_at = EXCLUDED.expires_at
+),
+removed AS (
+    DELETE FROM Cart c
+    USING listing l
+    WHERE c.user_id = :user_id AND c.listing_id = l.id AND l.new_qty = 0
+),
+upserted AS (
+    INSERT INTO Cart (user_id, product_id, listing_id, seller_id, unit_price, quantity)
+    SELECT :user_id, product_id, id, seller_id, price, new_qty
+    FROM listing
+    WHERE new_qty > 0
+    ON CONFLICT (user_id, listing_id) DO UPDATE
+    SET quantity = EXCLUDED.quantity,
+        unit_price = EXCLUDED.unit_price,
+        product_id = EXCLUDED.product_id,
+        seller_id = EXCLUDED.seller_id
+)
+SELECT id FROM listing
 """), {
-                "user_id": user_id,
-                "product_id": listing[1],
-                "listing_id": listing_id,
-                "seller_id": listing[2],
-                "unit_price": listing[3],
-                "quantity": new_qty
-            })
+            "user_id": user_id,
+            "listing_ids": listing_ids,
+            "modes": [targets[i][0] for i in listing_ids],
+            "quantities": [targets[i][1] for i in listing_ids],
+            "ttl": app.config['HOLD_TTL'],
+        }).fetchall()
+
+        missing = set(listing_ids) - {row[0] for row in applied}
+        if missing:
+            listing_id = min(missing)
+            name = conn.execute(text("""
+SELECT p.name FROM ProductSeller ps JOIN Products p ON p.id = ps.product_id WHERE ps.id = :listing_id
+"""), {"listing_id": listing_id}).scalar()
+            reason = InventoryHold.unavailable(conn, listing_id)
+            raise ValueError(f"{name}: {reason}" if name else reason)
+        return len(applied)
 
     @staticmethod
     def update_quantity(user_id, listing_id, quantity):
@@ -111,24 +355,7 @@ SET quantity = EXCLUDED.quantity,
             Cart.remove_item(user_id, listing_id)
             return
 
-        with app.db.engine.begin() as conn:
-            listing = conn.execute(text("""
-SELECT quantity, is_active
-FROM ProductSeller
-WHERE id = :listing_id
-"""), {"listing_id": listing_id}).first()
-
-            if not listing:
-                raise ValueError("Listing not found.")
-
-            available_qty, is_active = listing
-
-            if not is_active:
-                raise ValueError("Listing is not available.")
-
-            if quantity > available_qty:
-                raise ValueError("Requested quantity exceeds available inventory.")
-
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
             result = conn.execute(text("""
 UPDATE Cart
 SET quantity = :quantity
@@ -138,59 +365,113 @@ WHERE user_id = :user_id AND listing_id = :listing_id
             if result.rowcount == 0:
                 raise ValueError("Cart item not found.")
 
+            # re-hold the whole new quantity; the units held so far count
+            # as available again within this transaction
+            InventoryHold.release(conn, user_id, [listing_id])
+            InventoryHold.reserve(conn, user_id, listing_id, quantity)
+
     @staticmethod
     def remove_item(user_id, listing_id):
-        app.db.execute("""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            conn.execute(text("""
 DELETE FROM Cart
 WHERE user_id = :user_id AND listing_id = :listing_id
-""", user_id=user_id, listing_id=listing_id)
+"""), {"user_id": user_id, "listing_id": listing_id})
+            InventoryHold.release(conn, user_id, [listing_id])
 
     @staticmethod
     def clear(user_id):
-        app.db.execute("""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            conn.execute(text("""
 DELETE FROM Cart
 WHERE user_id = :user_id
-""", user_id=user_id)
+"""), {"user_id": user_id})
+            InventoryHold.release(conn, user_id)
 
     @staticmethod
-    def checkout(user_id, shipping_info=None):
-        with app.db.engine.begin() as conn:
+    def checkout(user_id, shipping_info=None, idempotency_key=None):
+        """Place an order for everything in the user's cart.  Units the cart
+        holds are sold without checking stock again; lines whose hold
+        expired (or that were never held) take whatever is still available.
+        Runs at READ COMMITTED: every listing is updated by one statement
+        that re-checks its stock, so concurrent checkouts of the same
+        listings wait for each other instead of failing to serialize.
+
+        With an idempotency_key, a checkout repeating the key of one that
+        placed an order within CHECKOUT_KEY_TTL seconds returns that order's
+        id and does nothing else; one sent while the first is still running
+        waits for its outcome."""
+        idempotency_key = CheckoutKey.clean(idempotency_key)
+        if idempotency_key:
+            order_id = CheckoutKey.completed_order(user_id, idempotency_key)
+            if order_id is not None:
+                return order_id
+
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            if idempotency_key:
+                order_id = CheckoutKey.claim(conn, user_id, idempotency_key)
+                if order_id is not None:
+                    return order_id
+
+            # NO KEY UPDATE still lets other checkouts credit this user
+            # (their ledger inserts only take a KEY SHARE lock for the foreign key);
+            # it also makes the user's own concurrent checkouts run one at a time
+            balance_row = BalanceLedger.lock_users(conn, [user_id]).get(user_id)
+
+            if not balance_row:
+                raise ValueError("User not found.")
+
+            balance = balance_row[0]
+            fallback_address = balance_row[1]
+
             cart_rows = conn.execute(text("""
-SELECT c.listing_id,
-       c.product_id,
-       c.quantity,
-       ps.seller_id,
-       ps.price AS current_price,
-       ps.quantity AS available_qty,
-       p.name
+SELECT c.listing_id, c.quantity, p.name, ps.flash_sale
 FROM Cart c
-JOIN ProductSeller ps ON c.listing_id = ps.id
 JOIN Products p ON c.product_id = p.id
+JOIN ProductSeller ps ON ps.id = c.listing_id
 WHERE c.user_id = :user_id
-FOR UPDATE
+ORDER BY c.listing_id
+FOR UPDATE OF c
 """), {"user_id": user_id}).fetchall()
 
             if not cart_rows:
                 raise ValueError("Your cart is empty.")
 
-            balance_row = conn.execute(text("""
-SELECT balance, address FROM Users WHERE id = :user_id FOR UPDATE
-"""), {"user_id": user_id}).first()
-
-            if not balance_row:
-                raise ValueError("User not found.")
-
-            balance = balance_row[0]
-            fallback_address = balance_row[1]
+            held = dict(conn.execute(text("""
+DELETE FROM inventory_holds
+WHERE user_id = :user_id
+RETURNING listing_id, quantity
+"""), {"user_id": user_id}).fetchall())
+
+            quantities = {listing_id: qty for listing_id, qty, _, _ in cart_rows}
+            # holds without a cart line are only given back (quantity 0)
+            listing_ids = sorted(quantities.keys() | held.keys())
+            sold = conn.execute(text("""
+UPDATE ProductSeller ps
+SET quantity = ps.quantity - l.quantity,
+    reserved = ps.reserved - l.held
+FROM unnest(CAST(:listing_ids AS INT[]), CAST(:quantities AS INT[]), CAST(:held AS INT[]))
+     AS l(listing_id, quantity, held)
+WHERE ps.id = l.listing_id
+  AND (l.quantity = 0 OR (ps.is_active AND NOT ps.flash_sale AND ps.quantity - ps.reserved + l.held >= l.quantity))
+RETURNING ps.id, ps.product_id, ps.seller_id, ps.price
+"""), {
+                "listing_ids": listing_ids,
+                "quantities": [quantities.get(i, 0) for i in listing_ids],
+                "held": [held.get(i, 0) for i in listing_ids],
+            }).fetchall()
+            sold = {row[0]: row for row in sold}
 
             line_items = []
             total_amount = Decimal("0")
 
-            for row in cart_rows:
-                listing_id, product_id, qty, seller_id, current_price, available_qty, product_name = row
-
-                if qty > available_qty:
+            for listing_id, qty, product_name, flash_sale in cart_rows:
+                if listing_id not in sold:
+                    if flash_sale:
+                        raise ValueError(f"{product_name} is in a flash sale; remove it from your cart "
+                                         "and use Buy now to order it.")
                     raise ValueError(f"Not enough inventory for {product_name}.")
+                _, product_id, seller_id, current_price = sold[listing_id]
 
                 subtotal = Decimal(current_price) * qty
                 line_items.append({
@@ -206,103 +487,162 @@ SELECT balance, address FROM Users WHERE id = :user_id FOR UPDATE
             if balance < total_amount:
                 raise ValueError("Insufficient balance to complete checkout.")
 
-            shipping_payload = shipping_info or {}
-            if not isinstance(shipping_payload, dict):
-                shipping_payload = {}
-
-            def _clean(value):
-                if value is None:
-                    return None
-                if not isinstance(value, str):
-                    value = str(value)
-                value = value.strip()
-                return value or None
-
-            shipping_street = _clean(shipping_payload.get('street'))
-            shipping_city = _clean(shipping_payload.get('city'))
-            shipping_state = _clean(shipping_payload.get('state'))
-            shipping_zip = _clean(shipping_payload.get('zip_code'))
-            shipping_apt = _clean(shipping_payload.get('apt'))
-
-            if not any([shipping_street, shipping_city, shipping_state, shipping_zip, shipping_apt]) and fallback_address:
-                shipping_street = fallback_address
-
-            order_row = conn.execute(text("""
-INSERT INTO Orders (user_id, total_amount, status, shipping_street, shipping_city, shipping_state, shipping_zip, shipping_apt)
-VALUES (:user_id, :total_amount, 'pending', :shipping_street, :shipping_city, :shipping_state, :shipping_zip, :shipping_apt)
-RETURNING id
-"""), {
-                "user_id": user_id,
-                "total_amount": total_amount,
-                "shipping_street": shipping_street,
-                "shipping_city": shipping_city,
-                "shipping_state": shipping_state,
-                "shipping_zip": shipping_zip,
-                "shipping_apt": shipping_apt
-            }).first()
+            order_id = Cart._place_order(conn, user_id, line_items, total_amount,
+                                         shipping_info, fallback_address)
+            if idempotency_key:
+                CheckoutKey.complete(conn, user_id, idempotency_key, order_id)
 
-            order_id = order_row[0]
+            conn.execute(text("""
+DELETE FROM Cart
+WHERE user_id = :user_id
+"""), {"user_id": user_id})
 
-            seller_totals = {}
+            return order_id
 
-            for item in line_items:
-                conn.execute(text("""
-INSERT INTO OrderItems (order_id, listing_id, seller_id, product_id, unit_price, quantity, subtotal)
-VALUES (:order_id, :listing_id, :seller_id, :product_id, :unit_price, :quantity, :subtotal)
-"""), {
-                    "order_id": order_id,
-                    "listing_id": item["listing_id"],
-                    "seller_id": item["seller_id"],
-                    "product_id": item["product_id"],
-                    "unit_price": item["unit_price"],
-                    "quantity": item["quantity"],
-                    "subtotal": item["subtotal"]
-                })
+    @staticmethod
+    def buy_now(user_id, listing_id, quantity=1, shipping_info=None):
+        """Order quantity units of one listing directly, without the cart;
+        the only way to buy a flash-sale listing.  Purchases of the same
+        listing are admitted in arrival order a few at a time (see
+        app/flash_sales.py) and take stock with one conditional UPDATE, so
+        the listing's row is only ever locked by the purchases admitted.
+        Returns the new order's id."""
+        if quantity is None or quantity <= 0:
+            raise ValueError("Quantity must be positive.")
 
-                conn.execute(text("""
+        gate = app.flash_sales
+        with gate.admit(listing_id):
+            with app.db.begin(isolation_level='READ COMMITTED') as conn:
+                # the buyer before the listing, the same order checkout and
+                # subscription fulfillment lock them in
+                balance_row = BalanceLedger.lock_users(conn, [user_id]).get(user_id)
+                if not balance_row:
+                    raise ValueError("User not found.")
+
+                sold = conn.execute(text("""
 UPDATE ProductSeller
 SET quantity = quantity - :quantity
 WHERE id = :listing_id
-"""), {"quantity": item["quantity"], "listing_id": item["listing_id"]})
-
-                seller_totals[item["seller_id"]] = seller_totals.get(item["seller_id"], Decimal("0")) + item["subtotal"]
-                                                                                 
-                                                                                 
-                remaining = conn.execute(text("""
-SELECT 1 FROM ProductSeller
-WHERE product_id = :product_id AND is_active = TRUE AND quantity > 0
-LIMIT 1
-"""), {"product_id": item["product_id"]}).fetchone()
-                if not remaining:
-                    conn.execute(text("""
-UPDATE Products
+  AND is_active
+  AND quantity - reserved >= :quantity
+RETURNING product_id, seller_id, price, quantity - reserved
+"""), {"listing_id": listing_id, "quantity": quantity}).first()
+
+                if not sold:
+                    listing = conn.execute(text("""
+SELECT quantity - reserved, is_active
+FROM ProductSeller
+WHERE id = :listing_id
+"""), {"listing_id": listing_id}).first()
+                    if not listing:
+                        raise ValueError("Listing not found.")
+                    if not listing[1] or listing[0] <= 0:
+                        gate.mark_sold_out(listing_id)
+                        raise ValueError("Sold out.")
+                    raise ValueError("Requested quantity exceeds available inventory.")
+
+                product_id, seller_id, price, remaining = sold
+
+                subtotal = Decimal(price) * quantity
+                if balance_row[0] < subtotal:
+                    raise ValueError("Insufficient balance to complete checkout.")
+
+                order_id = Cart._place_order(conn, user_id, [{
+                    "listing_id": listing_id,
+                    "product_id": product_id,
+                    "seller_id": seller_id,
+                    "quantity": quantity,
+                    "unit_price": price,
+                    "subtotal": subtotal
+                }], subtotal, shipping_info, balance_row[1])
+
+        if remaining <= 0:
+            gate.mark_sold_out(listing_id)
+        return order_id
+
+    @staticmethod
+    def _place_order(conn, user_id, line_items, total_amount, shipping_info, fallback_address):
+        """Insert the order and its items, mark sold-out products
+        unavailable and record the payments, on conn; stock must already
+        have been taken.  Returns the new order's id."""
+        shipping_payload = shipping_info or {}
+        if not isinstance(shipping_payload, dict):
+            shipping_payload = {}
+
+        def _clean(value):
+            if value is None:
+                return None
+            if not isinstance(value, str):
+                value = str(value)
+            value = value.strip()
+            return value or None
+
+        shipping_street = _clean(shipping_payload.get('street'))
+        shipping_city = _clean(shipping_payload.get('city'))
+        shipping_state = _clean(shipping_payload.get('state'))
+        shipping_zip = _clean(shipping_payload.get('zip_code'))
+        shipping_apt = _clean(shipping_payload.get('apt'))
+
+        if not any([shipping_street, shipping_city, shipping_state, shipping_zip, shipping_apt]) and fallback_address:
+            shipping_street = fallback_address
+
+        order_row = conn.execute(text("""
+INSERT INTO Orders (user_id, total_amount, status, shipping_street, shipping_city, shipping_state, shipping_zip, shipping_apt,
+                    item_count, fulfilled_count, fulfillment_status)
+VALUES (:user_id, :total_amount, 'pending', :shipping_street, :shipping_city, :shipping_state, :shipping_zip, :shipping_apt,
+        :item_count, 0, 'Order Placed')
+RETURNING id
+"""), {
+            "user_id": user_id,
+            "total_amount": total_amount,
+            "item_count": len(line_items),
+            "shipping_street": shipping_street,
+            "shipping_city": shipping_city,
+            "shipping_state": shipping_state,
+            "shipping_zip": shipping_zip,
+            "shipping_apt": shipping_apt
+        }).first()
+
+        order_id = order_row[0]
+
+        conn.execute(text("""
+INSERT INTO OrderItems (order_id, listing_id, seller_id, product_id, unit_price, quantity, subtotal)
+SELECT :order_id, *
+FROM unnest(CAST(:listing_ids AS INT[]), CAST(:seller_ids AS INT[]), CAST(:product_ids AS INT[]),
+            CAST(:unit_prices AS DECIMAL[]), CAST(:quantities AS INT[]), CAST(:subtotals AS DECIMAL[]))
+"""), {
+            "order_id": order_id,
+            "listing_ids": [item["listing_id"] for item in line_items],
+            "seller_ids": [item["seller_id"] for item in line_items],
+            "product_ids": [item["product_id"] for item in line_items],
+            "unit_prices": [item["unit_price"] for item in line_items],
+            "quantities": [item["quantity"] for item in line_items],
+            "subtotals": [item["subtotal"] for item in line_items],
+        })
+
+        conn.execute(text("""
+UPDATE Products p
 SET available = FALSE
-WHERE id = :product_id
-"""), {"product_id": item["product_id"]})
+WHERE p.id = ANY(CAST(:product_ids AS INT[]))
+  AND p.available
+  AND NOT EXISTS (SELECT 1 FROM ProductSeller ps
+                  WHERE ps.product_id = p.id AND ps.is_active = TRUE AND ps.quantity > 0)
+"""), {"product_ids": sorted({item["product_id"] for item in line_items})})
 
-            conn.execute(text("""
-UPDATE Users
-SET balance = balance - :amount
-WHERE id = :user_id
-"""), {"amount": total_amount, "user_id": user_id})
-
-            for seller_id, amount in seller_totals.items():
-                conn.execute(text("""
-UPDATE Users
-SET balance = balance + :amount
-WHERE id = :seller_id
-"""), {"amount": amount, "seller_id": seller_id})
-
-                conn.execute(text("""
-DELETE FROM Cart
-WHERE user_id = :user_id
-"""), {"user_id": user_id})
+        seller_totals = {}
+        for item in line_items:
+            seller_totals[item["seller_id"]] = seller_totals.get(item["seller_id"], Decimal("0")) + item["subtotal"]
 
-            return order_id
+        # ledger entries instead of UPDATE Users, so concurrent orders from
+        # the same seller do not all write (and conflict on) that seller's row
+        BalanceLedger.append(conn, [(user_id, -total_amount, 'purchase', order_id)] + [
+            (seller_id, amount, 'sale', order_id) for seller_id, amount in seller_totals.items()])
+
+        return order_id
 
     @staticmethod
     def save_for_later(user_id, listing_id):
-        with app.db.engine.begin() as conn:
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
             item = conn.execute(text("""
 SELECT user_id, product_id, listing_id, seller_id, unit_price, quantity
 FROM Cart
@@ -319,6 +659,7 @@ FOR UPDATE
 DELETE FROM Cart
 WHERE user_id = :user_id AND listing_id = :listing_id
 """), {"user_id": user_id, "listing_id": listing_id})
+            InventoryHold.release(conn, user_id, [listing_id])
 
             conn.execute(text("""
 INSERT INTO SavedItems (user_id, product_id, listing_id, seller_id, unit_price, quantity)
@@ -340,17 +681,22 @@ SET product_id = EXCLUDED.product_id,
 
     @staticmethod
     def move_saved_to_cart(user_id, listing_id):
-        rows = app.db.execute("""
-SELECT quantity
-FROM SavedItems
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            Cart._lock_owner(conn, user_id)
+            quantity = conn.execute(text("""
+DELETE FROM SavedItems
 WHERE user_id = :user_id AND listing_id = :listing_id
-""", user_id=user_id, listing_id=listing_id)
-        quantity = rows[0][0] if rows else None
-        if quantity is None:
-            raise ValueError("Saved item not found.")
+RETURNING quantity
+"""), {"user_id": user_id, "listing_id": listing_id}).scalar()
+            if quantity is None:
+                raise ValueError("Saved item not found.")
+            Cart._apply_targets(conn, user_id, {listing_id: ('add', quantity)})
 
-        Cart.add_item(user_id, listing_id, quantity)
-        Cart.remove_saved_item(user_id, listing_id)
+    @staticmethod
+    def move_all_saved_to_cart(user_id):
+        """Move every saved-for-later item into the cart in one transaction;
+        returns how many lines were moved."""
+        return Cart.apply_changes(user_id, move_saved=True)
 
     @staticmethod
     def remove_saved_item(user_id, listing_id):
@@ -0,0 +1,83 @@
+from flask import current_app as app
+from sqlalchemy import text
+
+
+class CheckoutKey:
+    """Idempotency keys of checkouts; see checkout_keys in db/create.sql."""
+
+    # longest key accepted; longer ones are rejected rather than truncated
+    MAX_LENGTH = 128
+
+    @staticmethod
+    def clean(key):
+        """The key as given by a client, stripped, or None if it is empty.
+        Raises ValueError if it is too long."""
+        if key is None:
+            return None
+        key = str(key).strip()
+        if len(key) > CheckoutKey.MAX_LENGTH:
+            raise ValueError(f"Idempotency key must be at most {CheckoutKey.MAX_LENGTH} characters.")
+        return key or None
+
+    @staticmethod
+    def completed_order(user_id, key):
+        """The order a finished checkout with this key placed, or None."""
+        rows = app.db.execute('''
+SELECT order_id
+FROM checkout_keys
+WHERE user_id = :user_id
+  AND idempotency_key = :key
+  AND order_id IS NOT NULL
+  AND expires_at > now()
+''', user_id=user_id, key=key)
+        return rows[0][0] if rows else None
+
+    @staticmethod
+    def claim(conn, user_id, key, ttl=None):
+        """Claim the key for a checkout running in conn's (READ COMMITTED)
+        transaction.  Returns None if the claim is this checkout's, or the
+        order_id another checkout with the same key already placed.  A
+        checkout still running with the key makes this wait for it; if
+        that one fails, its claim is rolled back and this one takes over."""
+        claimed = conn.execute(text('''
+INSERT INTO checkout_keys (user_id, idempotency_key, expires_at)
+VALUES (:user_id, :key, now() + make_interval(secs => :ttl))
+ON CONFLICT (user_id, idempotency_key) DO UPDATE
+SET order_id = NULL,
+    expires_at = EXCLUDED.expires_at
+WHERE checkout_keys.expires_at <= now()
+RETURNING 1
+'''), {
+            "user_id": user_id,
+            "key": key,
+            "ttl": app.config['CHECKOUT_KEY_TTL'] if ttl is None else ttl,
+        }).first()
+        if claimed:
+            return None
+        return conn.execute(text('''
+SELECT order_id
+FROM checkout_keys
+WHERE user_id = :user_id AND idempotency_key = :key
+'''), {"user_id": user_id, "key": key}).scalar()
+
+    @staticmethod
+    def complete(conn, user_id, key, order_id):
+        conn.execute(text('''
+UPDATE checkout_keys
+SET order_id = :order_id
+WHERE user_id = :user_id AND idempotency_key = :key
+'''), {"user_id": user_id, "key": key, "order_id": order_id})
+
+    @staticmethod
+    def sweep(batch_size=5000):
+        """Delete up to batch_size expired keys and return how many were
+        deleted."""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            return conn.execute(text('''
+DELETE FROM checkout_keys
+WHERE ctid = ANY(ARRAY(SELECT ctid
+                       FROM checkout_keys
+                       WHERE expires_at <= now()
+                       LIMIT :batch_size
+                       FOR UPDATE SKIP LOCKED))
+'''), {"batch_size": batch_size}).rowcount
@@ -0,0 +1,142 @@
+from flask import current_app as app
+from sqlalchemy import text
+
+
+class InventoryHold:
+    """Stock set aside for cart lines; see inventory_holds in db/create.sql.
+
+    ProductSeller.reserved is always the sum of the listing's holds, so
+    quantity - reserved is what can still be added to carts.  The methods
+    taking conn run inside the caller's transaction, which should be READ
+    COMMITTED: each statement checks and changes reserved atomically, and a
+    SERIALIZABLE transaction would instead fail whenever another cart
+    touched the same listing.
+    """
+
+    @staticmethod
+    def reserve(conn, user_id, listing_id, quantity, ttl=None):
+        """Hold quantity more units of the listing for user_id and return the
+        listing's (product_id, seller_id, price).  The user's hold on it
+        is extended to expire ttl seconds (HOLD_TTL by default) from now.
+        Raises ValueError if the listing cannot supply that many units or
+        is in a flash sale (those are only sold through Cart.buy_now)."""
+        row = conn.execute(text('''
+WITH listing AS (
+    UPDATE ProductSeller
+    SET reserved = reserved + :quantity
+    WHERE id = :listing_id
+      AND is_active
+      AND NOT flash_sale
+      AND quantity - reserved >= :quantity
+    RETURNING id, product_id, seller_id, price
+),
+hold AS (
+    INSERT INTO inventory_holds (listing_id, user_id, quantity, expires_at)
+    SELECT id, :user_id, :quantity, now() + make_interval(secs => :ttl)
+    FROM listing
+    ON CONFLICT (listing_id, user_id) DO UPDATE
+    SET quantity = inventory_holds.quantity + EXCLUDED.quantity,
+        expires_at = EXCLUDED.expires_at
+)
+SELECT product_id, seller_id, price FROM listing
+'''), {
+            "user_id": user_id,
+            "listing_id": listing_id,
+            "quantity": quantity,
+            "ttl": app.config['HOLD_TTL'] if ttl is None else ttl,
+        }).first()
+        if row:
+            return row
+        raise ValueError(InventoryHold.unavailable(conn, listing_id))
+
+    @staticmethod
+    def unavailable(conn, listing_id):
+        """Why units of the listing could not be held, as a message for the
+        buyer; call after a reservation matched no row."""
+        listing = conn.execute(text('''
+SELECT quantity - reserved, is_active, flash_sale
+FROM ProductSeller
+WHERE id = :listing_id
+'''), {"listing_id": listing_id}).first()
+        if not listing:
+            return "Listing not found."
+        if listing[2]:
+            return "This listing is in a flash sale; use Buy now to order it."
+        if not listing[1] or listing[0] <= 0:
+            return "Listing is not available."
+        return "Requested quantity exceeds available inventory."
+
+    @staticmethod
+    def release(conn, user_id, listing_ids=None):
+        """Drop the user's holds on listing_ids (all of them by default) and
+        return {listing_id: quantity} of what was released."""
+        rows = conn.execute(text('''
+WITH released AS (
+    DELETE FROM inventory_holds
+    WHERE user_id = :user_id
+      AND (CAST(:listing_ids AS INT[]) IS NULL OR listing_id = ANY(CAST(:listing_ids AS INT[])))
+    RETURNING listing_id, quantity
+),
+applied AS (
+    UPDATE ProductSeller ps
+    SET reserved = ps.reserved - r.quantity
+    FROM released r
+    WHERE ps.id = r.listing_id
+)
+SELECT listing_id, quantity FROM released
+'''), {
+            "user_id": user_id,
+            "listing_ids": None if listing_ids is None else list(listing_ids),
+        }).fetchall()
+        return {listing_id: quantity for listing_id, quantity in rows}
+
+    @staticmethod
+    def release_listing(conn, listing_id):
+        """Drop every hold on the listing, e.g. when it goes into a flash
+        sale, and return how many units were released."""
+        return conn.execute(text('''
+WITH released AS (
+    DELETE FROM inventory_holds
+    WHERE listing_id = :listing_id
+    RETURNING quantity
+)
+UPDATE ProductSeller
+SET reserved = reserved - (SELECT COALESCE(SUM(quantity), 0) FROM released)
+WHERE id = :listing_id
+RETURNING (SELECT COALESCE(SUM(quantity), 0) FROM released)
+'''), {"listing_id": listing_id}).scalar() or 0
+
+    @staticmethod
+    def sweep(batch_size=5000):
+        """Release up to batch_size expired holds, oldest first, and return
+        how many were released.  Holds locked by a checkout or cart change
+        in progress are skipped rather than waited for."""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            return conn.execute(text('''
+WITH expired AS (
+    SELECT listing_id, user_id
+    FROM inventory_holds
+    WHERE expires_at < now()
+    ORDER BY expires_at
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+),
+released AS (
+    DELETE FROM inventory_holds h
+    USING expired e
+    WHERE h.listing_id = e.listing_id AND h.user_id = e.user_id
+    RETURNING h.listing_id, h.quantity
+),
+totals AS (
+    SELECT listing_id, SUM(quantity) AS quantity
+    FROM released
+    GROUP BY listing_id
+),
+applied AS (
+    UPDATE ProductSeller ps
+    SET reserved = ps.reserved - t.quantity
+    FROM totals t
+    WHERE ps.id = t.listing_id
+)
+SELECT COUNT(*) FROM released
+'''), {"batch_size": batch_size}).scalar()
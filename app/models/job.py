@@ -0,0 +1,160 @@
+import json
+
+from flask import current_app as app
+from sqlalchemy import text
+
+# channel the worker LISTENs on; enqueue notifies it with the job's kind
+CHANNEL = 'jobs'
+
+
+class Job:
+    """Queued background work; see jobs in db/create.sql and app/jobs.py."""
+
+    def __init__(self, id, kind, payload, attempts, max_attempts, waited):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        # seconds between the job becoming runnable and being claimed
+        self.waited = waited
+
+    @staticmethod
+    def enqueue(kind, payload=None, conn=None, delay=0, max_attempts=None):
+        """Queue a job and wake a worker; returns its id.  With conn, the
+        job is queued in the caller's transaction and only runs (and only
+        wakes a worker) if that commits."""
+        sql = f'''
+WITH job AS (
+    INSERT INTO jobs (kind, payload, max_attempts, run_at)
+    VALUES (:kind, CAST(:payload AS JSONB), :max_attempts, now() + make_interval(secs => :delay))
+    RETURNING id
+)
+SELECT id, pg_notify('{CHANNEL}', :kind) FROM job
+'''
+        params = {
+            "kind": kind,
+            "payload": json.dumps(payload or {}),
+            "max_attempts": max_attempts or app.config['JOB_MAX_ATTEMPTS'],
+            "delay": delay,
+        }
+        if conn is not None:
+            return conn.execute(text(sql), params).first()[0]
+        return app.db.execute(sql, **params)[0][0]
+
+    @staticmethod
+    def claim(kinds, lease):
+        """Claim the longest-waiting runnable job of one of the given kinds
+        for lease seconds, or return None if there is none.  Runnable means
+        queued and due, or running with its lease expired (its worker died
+        or hung), and with attempts left.  Jobs claimed by other workers
+        are skipped, not waited for."""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            row = conn.execute(text('''
+WITH next AS (
+    SELECT id, run_at
+    FROM jobs
+    WHERE status IN ('queued', 'running')
+      AND run_at <= now()
+      AND attempts < max_attempts
+      AND kind = ANY(:kinds)
+    ORDER BY run_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE jobs j
+SET status = 'running',
+    attempts = j.attempts + 1,
+    run_at = now() + make_interval(secs => :lease)
+FROM next
+WHERE j.id = next.id
+RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts,
+          EXTRACT(EPOCH FROM now() - next.run_at)
+'''), {"kinds": list(kinds), "lease": lease}).first()
+        return Job(*row) if row else None
+
+    @staticmethod
+    def bury_expired():
+        """Mark dead the running jobs whose lease ran out on their last
+        attempt (claim no longer picks them up); returns how many."""
+        return app.db.execute('''
+UPDATE jobs
+SET status = 'dead',
+    last_error = 'Lease expired on attempt ' || attempts || ' of ' || max_attempts
+                 || COALESCE('; before that: ' || last_error, '')
+WHERE status = 'running'
+  AND run_at <= now()
+  AND attempts >= max_attempts
+''')
+
+    def complete(self):
+        """Delete the finished job, unless its lease ran out and another
+        worker has claimed it since."""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            conn.execute(text('''
+DELETE FROM jobs WHERE id = :id AND attempts = :attempts
+'''), {"id": self.id, "attempts": self.attempts})
+
+    def fail(self, error, retry_in):
+        """Record a failed attempt: run the job again in retry_in seconds,
+        or mark it dead if it has no attempts left.  Returns whether it
+        was marked dead."""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            row = conn.execute(text('''
+UPDATE jobs
+SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+    run_at = now() + make_interval(secs => :retry_in),
+    last_error = :error
+WHERE id = :id AND attempts = :attempts
+RETURNING status
+'''), {"id": self.id, "attempts": self.attempts, "error": error, "retry_in": retry_in}).first()
+        return bool(row) and row[0] == 'dead'
+
+    @staticmethod
+    def counts():
+        """Per kind: (kind, queued, running, runnable now, dead, seconds the
+        oldest runnable job has waited).  Running jobs whose lease ran out
+        count as runnable again, not as running."""
+        return app.db.execute('''
+SELECT kind,
+       COUNT(*) FILTER (WHERE status = 'queued'),
+       COUNT(*) FILTER (WHERE status = 'running' AND run_at > now()),
+       COUNT(*) FILTER (WHERE runnable),
+       COUNT(*) FILTER (WHERE status = 'dead'),
+       COALESCE(EXTRACT(EPOCH FROM now() - MIN(run_at) FILTER (WHERE runnable)), 0)
+FROM (
+    SELECT kind, status, run_at,
+           status IN ('queued', 'running') AND run_at <= now() AND attempts < max_attempts AS runnable
+    FROM jobs
+) j
+GROUP BY kind
+ORDER BY kind
+''')
+
+    @staticmethod
+    def dead(kind=None, limit=50):
+        """The most recent dead jobs: (id, kind, payload, attempts,
+        last_error, run_at)."""
+        return app.db.execute('''
+SELECT id, kind, payload, attempts, last_error, run_at
+FROM jobs
+WHERE status = 'dead' AND (CAST(:kind AS VARCHAR) IS NULL OR kind = :kind)
+ORDER BY run_at DESC
+LIMIT :limit
+''', kind=kind, limit=limit)
+
+    @staticmethod
+    def retry_dead(kind=None, ids=None):
+        """Queue dead jobs again with fresh attempts; returns how many."""
+        rows = app.db.execute(f'''
+WITH revived AS (
+    UPDATE jobs
+    SET status = 'queued', attempts = 0, run_at = now()
+    WHERE status = 'dead'
+      AND (CAST(:kind AS VARCHAR) IS NULL OR kind = :kind)
+      AND (CAST(:ids AS BIGINT[]) IS NULL OR id = ANY(CAST(:ids AS BIGINT[])))
+    RETURNING kind
+)
+SELECT COUNT(*), pg_notify('{CHANNEL}', '') FROM revived
+''', kind=kind, ids=ids)
+        return rows[0][0]
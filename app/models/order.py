@@ -44,22 +44,87 @@ class Order:
         return ", ".join(components) if components else None
 
     @staticmethod
-    def list_by_user(user_id):
+    def _record_sale(conn, item_id, sign):
+        """
+        Add (sign=1) or remove (sign=-1) an order item's units and revenue
+        from the seller_daily_sales rollup, inside the caller's transaction.
+        """
+        conn.execute(text("""
+INSERT INTO seller_daily_sales (seller_id, product_id, day, units, revenue)
+SELECT oi.seller_id,
+       oi.product_id,
+       DATE(o.created_at),
+       :sign * oi.quantity,
+       :sign * oi.subtotal
+FROM OrderItems oi
+JOIN Orders o ON oi.order_id = o.id
+WHERE oi.id = :item_id
+ON CONFLICT (seller_id, day, product_id) DO UPDATE
+SET units = seller_daily_sales.units + EXCLUDED.units,
+    revenue = seller_daily_sales.revenue + EXCLUDED.revenue
+"""), {"item_id": item_id, "sign": sign})
+
+    @staticmethod
+    def _refresh_summary(conn, order_id):
+        """
+        Recompute the item_count / fulfilled_count / fulfillment_status summary
+        stored on Orders for one order, inside the caller's transaction.
+        The aggregate status is the MAX() of the item statuses, which is what
+        order history pages have always displayed.
+        """
+        conn.execute(text("""
+UPDATE Orders o
+SET item_count = s.item_count,
+    fulfilled_count = s.fulfilled_count,
+    fulfillment_status = s.fulfillment_status
+FROM (
+    SELECT COUNT(*) AS item_count,
+           COUNT(*) FILTER (WHERE fulfilled) AS fulfilled_count,
+           COALESCE(MAX(fulfillment_status), 'Order Placed') AS fulfillment_status
+    FROM OrderItems
+    WHERE order_id = :order_id
+) s
+WHERE o.id = :order_id
+"""), {"order_id": order_id})
+
+    @staticmethod
+    def count_by_user(user_id):
         rows = app.db.execute("""
-SELECT o.id,
-       o.user_id,
-       o.created_at,
-       o.status,
-       o.total_amount,
-       COALESCE(COUNT(oi.id), 0) AS item_count,
-       COALESCE(SUM(CASE WHEN oi.fulfilled THEN 1 ELSE 0 END), 0) AS fulfilled_count,
-       MAX(oi.fulfillment_status) AS primary_fulfillment_status
-FROM Orders o
-LEFT JOIN OrderItems oi ON o.id = oi.order_id
-WHERE o.user_id = :user_id
-GROUP BY o.id, o.user_id, o.created_at, o.status, o.total_amount
-ORDER BY o.created_at DESC
+SELECT COUNT(*)
+FROM Orders
+WHERE user_id = :user_id
 """, user_id=user_id)
+        return rows[0][0] if rows else 0
+
+    @staticmethod
+    def list_by_user(user_id, page=1, per_page=None):
+        """
+        Return a user's orders, newest first. The item counts and fulfillment
+        status come from the summary columns on Orders, so this only reads the
+        requested page. Pass per_page to paginate.
+        """
+        limit_clause = ""
+        params = {"user_id": user_id}
+        if per_page:
+            safe_page = max(1, int(page or 1))
+            params["limit"] = int(per_page)
+            params["offset"] = (safe_page - 1) * int(per_page)
+            limit_clause = "LIMIT :limit OFFSET :offset"
+
+        rows = app.db.execute(f"""
+SELECT id,
+       user_id,
+       created_at,
+       status,
+       total_amount,
+       item_count,
+       fulfilled_count,
+       fulfillment_status
+FROM Orders
+WHERE user_id = :user_id
+ORDER BY created_at DESC, id DESC
+{limit_clause}
+""", **params)
 
         orders = []
         for row in rows:
@@ -240,7 +305,8 @@ WHERE oi.seller_id = :seller_id
 
     @staticmethod
     def mark_item_fulfilled(seller_id, item_id):
-        with app.db.engine.begin() as conn:
+        """Mark a seller's order item fulfilled; returns the buyer's id."""
+        with app.db.begin() as conn:
             row = conn.execute(text("""
 UPDATE OrderItems
 SET fulfilled = TRUE,
@@ -248,13 +314,15 @@ SET fulfilled = TRUE,
 WHERE id = :item_id
   AND seller_id = :seller_id
   AND fulfilled = FALSE
-RETURNING order_id
+RETURNING order_id, (SELECT o.user_id FROM Orders o WHERE o.id = OrderItems.order_id)
 """), {"item_id": item_id, "seller_id": seller_id}).first()
 
             if not row:
                 raise ValueError("Order item not found or already fulfilled.")
 
-            order_id = row[0]
+            order_id, buyer_id = row
+            Order._record_sale(conn, item_id, 1)
+            Order._refresh_summary(conn, order_id)
 
             remaining = conn.execute(text("""
 SELECT bool_and(fulfilled) AS all_fulfilled
@@ -274,42 +342,64 @@ UPDATE Orders
 SET status = 'partial'
 WHERE id = :order_id AND status <> 'fulfilled'
 """), {"order_id": order_id})
+        return buyer_id
 
     @staticmethod
     def update_item_status(seller_id, item_id, status):
         """
         Update the fulfillment_status for an order item. If status == 'Delivered', mark fulfilled=True and set fulfilled_at.
         After updating, recompute the containing order's aggregate status: 'fulfilled' if all delivered, 'shipped' if any shipped, else 'pending'.
+        Returns the buyer's id.
         """
         valid = ('Order Placed', 'Shipped', 'Delivered')
         if status not in valid:
             raise ValueError('Invalid status')
 
-        with app.db.engine.begin() as conn:
-            # Update the item
+        with app.db.begin() as conn:
+            # Update the item, remembering whether it was already counted as a sale
             if status == 'Delivered':
                 row = conn.execute(text("""
-UPDATE OrderItems
+WITH prev AS (
+    SELECT id, fulfilled
+    FROM OrderItems
+    WHERE id = :item_id AND seller_id = :seller_id
+    FOR UPDATE
+)
+UPDATE OrderItems oi
 SET fulfillment_status = :status,
     fulfilled = TRUE,
     fulfilled_at = now()
-WHERE id = :item_id AND seller_id = :seller_id
-RETURNING order_id
+FROM prev
+WHERE oi.id = prev.id
+RETURNING oi.order_id, prev.fulfilled, (SELECT o.user_id FROM Orders o WHERE o.id = oi.order_id)
 """), {"status": status, "item_id": item_id, "seller_id": seller_id}).first()
             else:
                 row = conn.execute(text("""
-UPDATE OrderItems
+WITH prev AS (
+    SELECT id, fulfilled
+    FROM OrderItems
+    WHERE id = :item_id AND seller_id = :seller_id
+    FOR UPDATE
+)
+UPDATE OrderItems oi
 SET fulfillment_status = :status,
     fulfilled = FALSE,
     fulfilled_at = NULL
-WHERE id = :item_id AND seller_id = :seller_id
-RETURNING order_id
+FROM prev
+WHERE oi.id = prev.id
+RETURNING oi.order_id, prev.fulfilled, (SELECT o.user_id FROM Orders o WHERE o.id = oi.order_id)
 """), {"status": status, "item_id": item_id, "seller_id": seller_id}).first()
 
             if not row:
                 raise ValueError("Order item not found or permission denied.")
 
-            order_id = row[0]
+            order_id, was_fulfilled, buyer_id = row
+            is_fulfilled = status == 'Delivered'
+            if is_fulfilled and not was_fulfilled:
+                Order._record_sale(conn, item_id, 1)
+            elif was_fulfilled and not is_fulfilled:
+                Order._record_sale(conn, item_id, -1)
+            Order._refresh_summary(conn, order_id)
 
             # Recompute aggregate order status
             rows = conn.execute(text("""
@@ -336,6 +426,7 @@ UPDATE Orders SET status = 'shipped' WHERE id = :order_id
                 conn.execute(text("""
 UPDATE Orders SET status = 'pending' WHERE id = :order_id
 """), {"order_id": order_id})
+        return buyer_id
 
     @staticmethod
     def get_user_purchases(user_id, q=None):
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from flask import current_app as app
 
 
@@ -30,7 +31,7 @@ class Product:
 WITH active_prices AS (
     SELECT product_id, MIN(price) AS min_price
     FROM ProductSeller
-    WHERE is_active = TRUE AND quantity > 0
+    WHERE is_active = TRUE AND quantity > reserved AND quantity > 0
     GROUP BY product_id
 )
 SELECT p.id,
@@ -54,6 +55,90 @@ WHERE p.id = :id
         row = rows[0]
         return Product(*row[:-1], listing_price=row[-1])
 
+    @staticmethod
+    def load_detail(product_id, viewer_id=None):
+        """
+        Load everything the product detail and review pages show about a
+        product in one round trip: the product, its active listings, the
+        rating summary and per-star breakdown, and whether the viewer has
+        purchased the product / had an order of it delivered.
+        Returns None if the product does not exist.
+        """
+        rows = app.db.execute(
+            '''
+WITH listings AS (
+    SELECT ps.id AS listing_id,
+           ps.product_id,
+           ps.seller_id,
+           ps.price,
+           ps.quantity - ps.reserved AS quantity,
+           ps.flash_sale,
+           u.firstname || ' ' || u.lastname AS seller_name
+    FROM ProductSeller ps
+    JOIN Users u ON u.id = ps.seller_id
+    WHERE ps.product_id = :id
+      AND ps.is_active = TRUE
+      AND ps.quantity > ps.reserved
+      AND ps.quantity > 0
+),
+ratings AS (
+    SELECT rating, COUNT(*) AS cnt
+    FROM product_reviews
+    WHERE product_id = :id
+    GROUP BY rating
+)
+SELECT p.id,
+       p.category_id,
+       p.category_name,
+       p.name,
+       p.description,
+       p.price,
+       p.available,
+       p.image_link,
+       p.creator_id,
+       (SELECT MIN(price) FROM listings) AS min_price,
+       (SELECT COALESCE(json_agg(json_build_object(
+                   'listing_id', listing_id,
+                   'product_id', product_id,
+                   'seller_id', seller_id,
+                   'price', price::text,
+                   'quantity', quantity,
+                   'flash_sale', flash_sale,
+                   'seller_name', seller_name) ORDER BY price ASC, listing_id ASC), '[]'::json)
+        FROM listings) AS listings,
+       (SELECT SUM(rating * cnt)::numeric / NULLIF(SUM(cnt) FILTER (WHERE rating IS NOT NULL), 0)
+        FROM ratings) AS avg_rating,
+       (SELECT COALESCE(SUM(cnt), 0) FROM ratings) AS num_reviews,
+       (SELECT COALESCE(json_object_agg(rating, cnt) FILTER (WHERE rating IS NOT NULL), '{}'::json)
+        FROM ratings) AS breakdown,
+       EXISTS (SELECT 1 FROM Purchases
+               WHERE uid = :viewer_id AND pid = p.id) AS has_purchased,
+       EXISTS (SELECT 1
+               FROM OrderItems oi
+               JOIN Orders o ON oi.order_id = o.id
+               WHERE o.user_id = :viewer_id
+                 AND oi.product_id = p.id
+                 AND COALESCE(oi.fulfillment_status, 'Order Placed') = 'Delivered') AS has_delivered_order
+FROM Products p
+WHERE p.id = :id
+''',
+            id=product_id,
+            viewer_id=viewer_id)
+        if not rows:
+            return None
+        row = rows[0]
+        listings = row[10] or []
+        for listing in listings:
+            listing["price"] = Decimal(listing["price"])
+        return {
+            "product": Product(*row[:9], listing_price=row[9]),
+            "listings": listings,
+            "rating_summary": {"avg_rating": row[11], "num_reviews": row[12]},
+            "rating_breakdown": {int(star): cnt for star, cnt in (row[13] or {}).items()},
+            "has_purchased": bool(row[14]),
+            "has_delivered_order": bool(row[15])
+        }
+
     @staticmethod
     def get_all(available=True):
         rows = app.db.execute(
@@ -61,7 +146,7 @@ WHERE p.id = :id
 WITH active_prices AS (
     SELECT product_id, MIN(price) AS min_price
     FROM ProductSeller
-    WHERE is_active = TRUE AND quantity > 0
+    WHERE is_active = TRUE AND quantity > reserved AND quantity > 0
     GROUP BY product_id
 )
 SELECT p.id,
@@ -139,6 +224,7 @@ FROM Products p
 LEFT JOIN ProductSeller ps
   ON ps.product_id = p.id
  AND ps.is_active = TRUE
+ AND ps.quantity > ps.reserved
  AND ps.quantity > 0
 LEFT JOIN product_ratings pr
   ON pr.product_id = p.id
@@ -209,6 +295,18 @@ WHERE id = :id
             available=available,
             id=product_id)
 
+    @staticmethod
+    def recompute_available(product_id):
+        """Set available from whether any active listing has stock."""
+        app.db.execute(
+            '''
+UPDATE Products p
+SET available = EXISTS (SELECT 1 FROM ProductSeller ps
+                        WHERE ps.product_id = p.id AND ps.is_active = TRUE AND ps.quantity > 0)
+WHERE p.id = :id
+''',
+            id=product_id)
+
     @staticmethod
     def similar(product, limit=4):
         """
@@ -221,7 +319,7 @@ WHERE id = :id
 WITH active_prices AS (
     SELECT product_id, MIN(price) AS min_price
     FROM ProductSeller
-    WHERE is_active = TRUE AND quantity > 0
+    WHERE is_active = TRUE AND quantity > reserved AND quantity > 0
     GROUP BY product_id
 )
 SELECT p.id,
@@ -1,3 +1,4 @@
+from datetime import datetime
 from flask import current_app as app
 
 
@@ -19,87 +20,31 @@ class ProductReview:
         self.verified = bool(verified)
 
     @staticmethod
-    def get_for_product(product_id, user_id=None, per_page=None, page=1, min_rating=None, sort='helpful'):
+    def cursor_for(review, sort='helpful'):
+        """
+        Return the keyset cursor that continues a listing right after `review`.
+        """
+        return _cursor_for(review, sort)
+
+    @staticmethod
+    def get_for_product(product_id, user_id=None, per_page=None, page=1, min_rating=None, sort='helpful',
+                        cursor=None):
         """
         Fetch reviews for a product, including helpful-vote counts and whether
         the given user has marked each review as helpful.
+        Pages are read straight off the product's review indexes: pass the
+        cursor from cursor_for() on the previous page's last review to continue
+        with a keyset scan, otherwise `page` is used as an offset.
         """
-        uid = user_id or 0
-        limit_clause = ""
-        where_clauses = ["pr.product_id = :product_id"]
-        order_clause = """
-ORDER BY CASE WHEN helpful_rank <= 3 THEN 0 ELSE 1 END,
-         helpful_rank,
-         created_at DESC
-"""
-        params = {"product_id": product_id, "uid": uid}
-
-        if min_rating is not None:
-            where_clauses.append("pr.rating >= :min_rating")
-            params["min_rating"] = min_rating
-
-        sort = (sort or 'helpful').lower()
-        if sort == 'recent':
-            order_clause = "ORDER BY created_at DESC"
-
-        if per_page:
-            safe_page = max(1, int(page or 1))
-            params["limit"] = int(per_page)
-            params["offset"] = (safe_page - 1) * int(per_page)
-            limit_clause = "LIMIT :limit OFFSET :offset"
-        where_clause_str = " AND ".join(where_clauses)
-        query = f'''
-WITH aggregated AS (
-    SELECT pr.product_review_id,
-           pr.product_id,
-           pr.user_id,
-           pr.rating,
-           pr.body,
-           pr.created_at,
-           u.firstname,
-           u.lastname,
-           COALESCE(SUM(rv.vote), 0) AS helpful_count,
-           MAX(CASE WHEN rv.user_id = :uid THEN 1 ELSE 0 END) AS user_voted,
-           MAX(CASE WHEN EXISTS (
-                     SELECT 1 FROM Purchases pu
-                     WHERE pu.uid = pr.user_id AND pu.pid = pr.product_id
-                   ) THEN 1 ELSE 0 END) AS verified
-    FROM product_reviews pr
-    JOIN Users u ON u.id = pr.user_id
-    LEFT JOIN review_votes rv
-           ON rv.review_type = 'product'
-          AND rv.review_id = pr.product_review_id
-    WHERE {where_clause_str}
-    GROUP BY pr.product_review_id, u.firstname, u.lastname
-),
-ranked AS (
-    SELECT *,
-           ROW_NUMBER() OVER (ORDER BY helpful_count DESC, created_at DESC) AS helpful_rank
-    FROM aggregated
-)
-SELECT product_review_id,
-       product_id,
-       user_id,
-       rating,
-       body,
-       created_at,
-       firstname,
-       lastname,
-       helpful_count,
-       COALESCE(user_voted, 0) AS user_voted,
-       helpful_rank,
-       COALESCE(verified, 0) AS verified
-FROM ranked
-{order_clause}
-{limit_clause}
-'''
-
-        rows = app.db.execute(query, **params)
-
+        rows = _review_page('product', product_id, user_id=user_id, per_page=per_page, page=page,
+                            min_rating=min_rating, sort=sort, cursor=cursor)
         return [ProductReview(*row) for row in rows]
 
+
 class SellerReview:
-    def __init__(self, review_id, seller_id, user_id, rating, body, created_at, firstname=None, lastname=None):
+    def __init__(self, review_id, seller_id, user_id, rating, body, created_at,
+                 firstname=None, lastname=None, helpful_count=0, user_voted=False,
+                 helpful_rank=None, verified=False):
         self.review_id = review_id
         self.seller_id = seller_id
         self.user_id = user_id
@@ -108,9 +53,34 @@ class SellerReview:
         self.created_at = created_at
         self.firstname = firstname
         self.lastname = lastname
+        self.helpful_count = helpful_count or 0
+        self.user_voted = bool(user_voted)
+        self.helpful_rank = helpful_rank
+        self.verified = bool(verified)
+
+    @staticmethod
+    def cursor_for(review, sort='helpful'):
+        """
+        Return the keyset cursor that continues a listing right after `review`.
+        """
+        return _cursor_for(review, sort)
 
     @staticmethod
-    def get_for_seller(seller_id):
+    def get_for_seller(seller_id, user_id=None, per_page=None, page=1, min_rating=None, sort='helpful',
+                       cursor=None):
+        """
+        Fetch reviews for a seller with stored helpful counts and verified
+        flags, paginated the same way as ProductReview.get_for_product.
+        """
+        rows = _review_page('seller', seller_id, user_id=user_id, per_page=per_page, page=page,
+                            min_rating=min_rating, sort=sort, cursor=cursor)
+        return [SellerReview(*row) for row in rows]
+
+    @staticmethod
+    def get_by_user(seller_id, user_id):
+        """
+        Return the given user's review of a seller, or None.
+        """
         rows = app.db.execute('''
 SELECT sr.seller_review_id,
        sr.seller_id,
@@ -119,11 +89,189 @@ SELECT sr.seller_review_id,
        sr.body,
        sr.created_at,
        u.firstname,
-       u.lastname
+       u.lastname,
+       sr.helpful_count,
+       FALSE AS user_voted,
+       NULL AS helpful_rank,
+       sr.verified
 FROM seller_reviews sr
 JOIN Users u ON u.id = sr.user_id
-WHERE sr.seller_id = :seller_id
-ORDER BY sr.created_at DESC
+WHERE sr.seller_id = :seller_id AND sr.user_id = :user_id
+''', seller_id=seller_id, user_id=user_id)
+        return SellerReview(*rows[0]) if rows else None
+
+    @staticmethod
+    def summary(seller_id):
+        """
+        Return {"avg_rating", "num_reviews"} for a seller.
+        """
+        rows = app.db.execute('''
+SELECT AVG(rating) AS avg_rating,
+       COUNT(*) AS num_reviews
+FROM seller_reviews
+WHERE seller_id = :seller_id
 ''', seller_id=seller_id)
+        avg_rating, num_reviews = rows[0]
+        return {"avg_rating": float(avg_rating) if avg_rating is not None else None,
+                "num_reviews": num_reviews}
 
-        return [SellerReview(*row) for row in rows]
+
+class ReviewActivity:
+    """The lists shown on a user's My Reviews page."""
+    LISTS = ('product', 'seller', 'feedback')
+
+    @staticmethod
+    def get_for_user(user_id, review_type='all', min_rating=None, include_feedback=False,
+                     per_page=10, cursors=None):
+        """
+        Return {list: {"reviews": [...], "next_cursor": str or None}} for the
+        'product', 'seller' and 'feedback' lists in one query.  `cursors` maps
+        a list name to the next_cursor of the page before it.
+        """
+        params = {"user_id": user_id, "type": review_type, "min_rating": min_rating,
+                  "include_feedback": bool(include_feedback), "limit": int(per_page)}
+        for name in ReviewActivity.LISTS:
+            keyset = _parse_cursor((cursors or {}).get(name) or '', 'recent')
+            params[f"{name}_after"], params[f"{name}_after_id"] = keyset or (None, None)
+
+        rows = app.db.named('get_my_reviews', **params)
+        result = {}
+        for name in ReviewActivity.LISTS:
+            reviews = [row for row in rows if row.list == name]
+            result[name] = {
+                "reviews": reviews,
+                "next_cursor": _cursor_for(reviews[-1], 'recent') if len(reviews) == per_page else None
+            }
+        return result
+
+
+# table, id column and owner column for each review type
+REVIEW_SOURCES = {
+    'product': ('product_reviews', 'product_review_id', 'product_id'),
+    'seller': ('seller_reviews', 'seller_review_id', 'seller_id'),
+}
+
+# ORDER BY columns (all descending) for each supported review ordering; the
+# id column is appended.  Each ordering matches an index on both review
+# tables so pages are index scans.
+ORDERINGS = {
+    'helpful': ('helpful_count', 'created_at'),
+    'recent': ('created_at',),
+}
+
+
+def _cursor_for(review, sort):
+    sort = sort if sort in ORDERINGS else 'helpful'
+    created = review.created_at.isoformat()
+    if sort == 'recent':
+        return f"{created}_{review.review_id}"
+    return f"{review.helpful_count}_{created}_{review.review_id}"
+
+
+def _parse_cursor(cursor, sort):
+    """
+    Turn a cursor from _cursor_for() back into ORDER BY column values,
+    or return None if it is malformed.
+    """
+    try:
+        parts = cursor.split('_')
+        if sort == 'recent':
+            created, review_id = parts
+            return [datetime.fromisoformat(created), int(review_id)]
+        helpful_count, created, review_id = parts
+        return [int(helpful_count), datetime.fromisoformat(created), int(review_id)]
+    except (AttributeError, ValueError):
+        return None
+
+
+def _review_page(review_type, owner_id, user_id=None, per_page=None, page=1, min_rating=None,
+                 sort='helpful', cursor=None):
+    """
+    Run the shared review listing query for one product or seller and return
+    raw rows in the ProductReview / SellerReview constructor order.  The top
+    three reviews by helpful votes carry a helpful_rank.
+    """
+    table, id_col, owner_col = REVIEW_SOURCES[review_type]
+    sort = (sort or 'helpful').lower()
+    if sort not in ORDERINGS:
+        sort = 'helpful'
+    columns = ORDERINGS[sort] + (id_col,)
+    helpful_columns = ORDERINGS['helpful'] + (id_col,)
+
+    filters = [f"r.{owner_col} = :owner_id"]
+    params = {"owner_id": owner_id, "uid": user_id or 0, "review_type": review_type}
+    if min_rating is not None:
+        filters.append("r.rating >= :min_rating")
+        params["min_rating"] = min_rating
+    base_where = " AND ".join(filters)
+
+    page_filters = list(filters)
+    limit_clause = ""
+    keyset = _parse_cursor(cursor, sort) if cursor else None
+    if keyset:
+        names = [f"c{i}" for i in range(len(columns))]
+        page_filters.append("({}) < ({})".format(
+            ", ".join(f"r.{col}" for col in columns),
+            ", ".join(f":{name}" for name in names)))
+        params.update(zip(names, keyset))
+    if per_page:
+        params["limit"] = int(per_page)
+        limit_clause = "LIMIT :limit"
+        if not keyset:
+            safe_page = max(1, int(page or 1))
+            params["offset"] = (safe_page - 1) * int(per_page)
+            limit_clause += " OFFSET :offset"
+
+    def order_by(alias, cols):
+        return ", ".join(f"{alias}.{col} DESC" for col in cols)
+
+    query = f'''
+WITH page AS (
+    SELECT r.{id_col} AS review_id,
+           r.{owner_col} AS owner_id,
+           r.user_id,
+           r.rating,
+           r.body,
+           r.created_at,
+           r.helpful_count,
+           r.verified
+    FROM {table} r
+    WHERE {" AND ".join(page_filters)}
+    ORDER BY {order_by("r", columns)}
+    {limit_clause}
+),
+top_helpful AS (
+    SELECT review_id,
+           ROW_NUMBER() OVER (ORDER BY helpful_count DESC, created_at DESC, review_id DESC) AS helpful_rank
+    FROM (
+        SELECT r.{id_col} AS review_id, r.helpful_count, r.created_at
+        FROM {table} r
+        WHERE {base_where}
+        ORDER BY {order_by("r", helpful_columns)}
+        LIMIT 3
+    ) top3
+)
+SELECT pg.review_id,
+       pg.owner_id,
+       pg.user_id,
+       pg.rating,
+       pg.body,
+       pg.created_at,
+       u.firstname,
+       u.lastname,
+       pg.helpful_count,
+       EXISTS (
+           SELECT 1 FROM review_votes rv
+           WHERE rv.review_type = :review_type
+             AND rv.review_id = pg.review_id
+             AND rv.user_id = :uid
+       ) AS user_voted,
+       th.helpful_rank,
+       pg.verified
+FROM page pg
+JOIN Users u ON u.id = pg.user_id
+LEFT JOIN top_helpful th ON th.review_id = pg.review_id
+ORDER BY {order_by("pg", columns[:-1])}, pg.review_id DESC
+'''
+
+    return app.db.execute(query, **params)
@@ -1,8 +1,13 @@
 from flask import current_app as app
-from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from .inventory_hold import InventoryHold
 
 
 class ProductSeller:
+    # Windows (in days) the seller dashboard can chart from seller_daily_sales.
+    ANALYTICS_WINDOWS = (7, 30, 90, 365)
+
     def __init__(self, id, seller_id, product_id, price, quantity, is_active):
         self.id = id
         self.seller_id = seller_id
@@ -52,7 +57,8 @@ SELECT ps.id AS listing_id,
        ps.price AS seller_price,
        ps.quantity,
        ps.is_active,
-       p.image_link
+       p.image_link,
+       ps.flash_sale
 FROM ProductSeller ps
 JOIN Products p ON ps.product_id = p.id
 WHERE ps.seller_id = :seller_id
@@ -70,7 +76,8 @@ ORDER BY p.name
                 "seller_price": row[5],
                 "quantity": row[6],
                 "is_active": row[7],
-                "image_link": row[8]
+                "image_link": row[8],
+                "flash_sale": row[9]
             })
         return result
 
@@ -140,19 +147,22 @@ WHERE id = :id
     @staticmethod
     def get_active_by_product(product_id):
         """
-        Get active listings for a product with seller name, price, and quantity.
+        Get active listings for a product with seller name, price, and the
+        quantity not held in carts.
         """
         rows = app.db.execute('''
 SELECT ps.id AS listing_id,
        ps.product_id,
        ps.seller_id,
        ps.price,
-       ps.quantity,
-       u.firstname || ' ' || u.lastname AS seller_name
+       ps.quantity - ps.reserved AS quantity,
+       u.firstname || ' ' || u.lastname AS seller_name,
+       ps.flash_sale
 FROM ProductSeller ps
 JOIN Users u ON u.id = ps.seller_id
 WHERE ps.product_id = :product_id
   AND ps.is_active = TRUE
+  AND ps.quantity > ps.reserved
   AND ps.quantity > 0
 ORDER BY ps.price ASC, ps.id ASC
 ''', product_id=product_id)
@@ -165,7 +175,8 @@ ORDER BY ps.price ASC, ps.id ASC
                 "seller_id": row[2],
                 "price": row[3],
                 "quantity": row[4],
-                "seller_name": row[5]
+                "seller_name": row[5],
+                "flash_sale": row[6]
             })
         return listings
 
@@ -180,6 +191,23 @@ SET is_active = TRUE
 WHERE id = :id
 ''', id=id)
 
+    @staticmethod
+    def set_flash_sale(id, enabled):
+        """
+        Turn flash-sale mode on or off for a listing.  Flash-sale listings
+        cannot be added to carts; buyers order them with Buy now.  Turning
+        it on releases the listing's holds; lines already in carts stay,
+        but checkout refuses them.
+        """
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            conn.execute(text('''
+UPDATE ProductSeller
+SET flash_sale = :enabled
+WHERE id = :id
+'''), {"id": id, "enabled": enabled})
+            if enabled:
+                InventoryHold.release_listing(conn, id)
+
     @staticmethod
     def has_active_listings_for_product(product_id):
         """
@@ -200,83 +228,73 @@ LIMIT 1
         - top_products: list of {product_id, product_name, units_sold, revenue}
         - timeseries: list of {date, units} for the last `days` days (inclusive)
         - totals: totals for the last `days` and all-time
+        Everything is read from the seller_daily_sales rollup in a single query,
+        so the cost depends on the seller's rollup rows rather than on OrderItems.
         """
-                                                    
-        cutoff = datetime.utcnow() - timedelta(days=days)
+        if days not in ProductSeller.ANALYTICS_WINDOWS:
+            raise ValueError(f"Unsupported analytics window: {days} days.")
 
-                                    
-        top_rows = app.db.execute('''
-SELECT oi.product_id,
-       p.name,
-       COALESCE(SUM(oi.quantity),0) AS units_sold,
-       COALESCE(SUM(oi.subtotal),0) AS revenue
-FROM OrderItems oi
-JOIN Orders o ON oi.order_id = o.id
-JOIN Products p ON oi.product_id = p.id
-WHERE oi.seller_id = :seller_id
-  AND oi.fulfilled = TRUE
-GROUP BY oi.product_id, p.name
-ORDER BY units_sold DESC
-LIMIT :limit
-''', seller_id=seller_id, limit=limit)
+        rows = app.db.execute('''
+WITH sales AS (
+    SELECT product_id, day, units, revenue
+    FROM seller_daily_sales
+    WHERE seller_id = :seller_id
+),
+top_products AS (
+    SELECT s.product_id,
+           p.name AS product_name,
+           SUM(s.units) AS units_sold,
+           SUM(s.revenue) AS revenue
+    FROM sales s
+    JOIN Products p ON s.product_id = p.id
+    GROUP BY s.product_id, p.name
+    HAVING SUM(s.units) > 0
+    ORDER BY units_sold DESC
+    LIMIT :limit
+),
+series AS (
+    SELECT d.day::date AS day,
+           COALESCE(SUM(s.units), 0) AS units
+    FROM generate_series(CURRENT_DATE - :days, CURRENT_DATE, INTERVAL '1 day') AS d(day)
+    LEFT JOIN sales s ON s.day = d.day::date
+    GROUP BY d.day
+)
+SELECT (SELECT COALESCE(json_agg(json_build_object(
+                   'product_id', product_id,
+                   'product_name', product_name,
+                   'units_sold', units_sold,
+                   'revenue', revenue) ORDER BY units_sold DESC), '[]'::json)
+        FROM top_products) AS top_products,
+       (SELECT json_agg(json_build_object(
+                   'date', to_char(day, 'YYYY-MM-DD'),
+                   'units', units) ORDER BY day)
+        FROM series) AS timeseries,
+       COALESCE(SUM(units) FILTER (WHERE day >= CURRENT_DATE - :days), 0) AS recent_units,
+       COALESCE(SUM(revenue) FILTER (WHERE day >= CURRENT_DATE - :days), 0) AS recent_revenue,
+       COALESCE(SUM(units), 0) AS all_units,
+       COALESCE(SUM(revenue), 0) AS all_revenue
+FROM sales
+''', seller_id=seller_id, days=days, limit=limit)
+
+        top_json, ts_json, recent_units, recent_revenue, all_units, all_revenue = rows[0]
 
         top_products = []
-        for r in top_rows:
+        for r in top_json or []:
             top_products.append({
-                "product_id": r[0],
-                "product_name": r[1],
-                "units_sold": int(r[2]) if r[2] is not None else 0,
-                "revenue": float(r[3]) if r[3] is not None else 0.0
+                "product_id": r["product_id"],
+                "product_name": r["product_name"],
+                "units_sold": int(r["units_sold"] or 0),
+                "revenue": float(r["revenue"] or 0.0)
             })
 
-                                                    
-        ts_rows = app.db.execute('''
-SELECT DATE(o.created_at) AS day,
-       COALESCE(SUM(oi.quantity),0) AS units
-FROM OrderItems oi
-JOIN Orders o ON oi.order_id = o.id
-WHERE oi.seller_id = :seller_id
-  AND o.created_at >= :cutoff
-  AND oi.fulfilled = TRUE
-GROUP BY DATE(o.created_at)
-ORDER BY day
-''', seller_id=seller_id, cutoff=cutoff)
-
-                                                                
-        ts_map = {row[0].isoformat(): int(row[1]) for row in ts_rows}
-        timeseries = []
-        for i in range(days, -1, -1):
-            d = (datetime.utcnow() - timedelta(days=i)).date()
-            key = d.isoformat()
-            timeseries.append({"date": key, "units": ts_map.get(key, 0)})
-
-                               
-        totals_row = app.db.execute('''
-SELECT COALESCE(SUM(oi.quantity),0) AS units,
-       COALESCE(SUM(oi.subtotal),0) AS revenue
-FROM OrderItems oi
-JOIN Orders o ON oi.order_id = o.id
-WHERE oi.seller_id = :seller_id
-  AND o.created_at >= :cutoff
-  AND oi.fulfilled = TRUE
-''', seller_id=seller_id, cutoff=cutoff)
-        totals_recent = totals_row[0] if totals_row else (0, 0.0)
-
-                          
-        all_row = app.db.execute('''
-SELECT COALESCE(SUM(quantity),0) AS units,
-       COALESCE(SUM(subtotal),0) AS revenue
-FROM OrderItems
-WHERE seller_id = :seller_id
-  AND fulfilled = TRUE
-''', seller_id=seller_id)
-        totals_all = all_row[0] if all_row else (0, 0.0)
+        timeseries = [{"date": r["date"], "units": int(r["units"])} for r in ts_json or []]
 
         return {
+            "days": days,
             "top_products": top_products,
             "timeseries": timeseries,
-            "totals_recent": {"units": int(totals_recent[0] or 0), "revenue": float(totals_recent[1] or 0.0)},
-            "totals_all": {"units": int(totals_all[0] or 0), "revenue": float(totals_all[1] or 0.0)}
+            "totals_recent": {"units": int(recent_units), "revenue": float(recent_revenue)},
+            "totals_all": {"units": int(all_units), "revenue": float(all_revenue)}
         }
 
     @staticmethod
@@ -1,24 +1,23 @@
+from decimal import Decimal
 from flask import current_app as app
+from sqlalchemy import text
+
+from .balance import BalanceLedger
+
+
+def _interval(frequency):
+    """SQL for the time between deliveries at the given frequency (an SQL
+    expression)."""
+    return f'''CASE {frequency}
+    WHEN 'weekly' THEN INTERVAL '7 days'
+    WHEN 'quarterly' THEN INTERVAL '3 months'
+    ELSE INTERVAL '1 month'
+END'''
 
 
 class Subscription:
-    TABLE_SQL = '''
-CREATE TABLE IF NOT EXISTS Subscriptions (
-    id SERIAL PRIMARY KEY,
-    user_id INTEGER NOT NULL REFERENCES Users(id) ON DELETE CASCADE,
-    product_id INTEGER NOT NULL REFERENCES Products(id) ON DELETE CASCADE,
-    frequency VARCHAR(20) NOT NULL,
-    active BOOLEAN NOT NULL DEFAULT TRUE,
-    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE (user_id, product_id)
-);
-'''
-
-    INDEX_SQL = '''
-CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON Subscriptions(user_id);
-'''
-
-    def __init__(self, id, user_id, product_id, frequency, active, created_at, product_name=None, category_name=None):
+    def __init__(self, id, user_id, product_id, frequency, active, created_at, product_name=None, category_name=None,
+                 next_due_at=None, last_error=None):
         self.id = id
         self.user_id = user_id
         self.product_id = product_id
@@ -27,24 +26,23 @@ CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON Subscriptions(user_id);
         self.created_at = created_at
         self.product_name = product_name
         self.category_name = category_name
-
-    @classmethod
-    def _ensure_table(cls):
-        app.db.execute(cls.TABLE_SQL)
-        app.db.execute(cls.INDEX_SQL)
+        self.next_due_at = next_due_at
+        self.last_error = last_error
 
     @classmethod
     def create_or_update(cls, user_id, product_id, frequency):
-        cls._ensure_table()
+        # the first delivery is one period out
         rows = app.db.execute(
-            '''
-INSERT INTO Subscriptions (user_id, product_id, frequency, active)
-VALUES (:user_id, :product_id, :frequency, TRUE)
+            f'''
+INSERT INTO Subscriptions (user_id, product_id, frequency, active, next_due_at, last_error)
+VALUES (:user_id, :product_id, :frequency, TRUE, now() + {_interval('CAST(:frequency AS VARCHAR)')}, NULL)
 ON CONFLICT (user_id, product_id)
 DO UPDATE
 SET frequency = EXCLUDED.frequency,
     active = TRUE,
-    created_at = CURRENT_TIMESTAMP
+    created_at = CURRENT_TIMESTAMP,
+    next_due_at = EXCLUDED.next_due_at,
+    last_error = NULL
 RETURNING id
 ''',
             user_id=user_id,
@@ -54,7 +52,6 @@ RETURNING id
 
     @classmethod
     def get_active_for_user_product(cls, user_id, product_id):
-        cls._ensure_table()
         rows = app.db.execute(
             '''
 SELECT id, user_id, product_id, frequency, active, created_at
@@ -70,7 +67,6 @@ LIMIT 1
 
     @classmethod
     def get_active_by_user(cls, user_id):
-        cls._ensure_table()
         rows = app.db.execute(
             '''
 SELECT s.id,
@@ -80,7 +76,9 @@ SELECT s.id,
        s.active,
        s.created_at,
        p.name,
-       p.category_name
+       p.category_name,
+       s.next_due_at,
+       s.last_error
 FROM Subscriptions s
 JOIN Products p ON p.id = s.product_id
 WHERE s.user_id = :user_id
@@ -88,11 +86,11 @@ WHERE s.user_id = :user_id
 ORDER BY s.created_at DESC
 ''',
             user_id=user_id)
-        return [Subscription(*row[:6], product_name=row[6], category_name=row[7]) for row in rows]
+        return [Subscription(*row[:6], product_name=row[6], category_name=row[7],
+                             next_due_at=row[8], last_error=row[9]) for row in rows]
 
     @classmethod
     def cancel(cls, subscription_id, user_id):
-        cls._ensure_table()
         result = app.db.execute(
             '''
 UPDATE Subscriptions
@@ -104,3 +102,152 @@ WHERE id = :sid
             sid=subscription_id,
             uid=user_id)
         return result > 0
+
+    @classmethod
+    def fulfill_due(cls, batch_size, retry_delay):
+        """Order the next delivery of up to batch_size due subscriptions, in
+        one transaction.  Returns (fulfilled, deferred, orders).
+
+        Due subscriptions are claimed with SKIP LOCKED, so any number of
+        workers can run this at once, each on its own batch.  A delivery is
+        one unit of the product from its cheapest in-stock listing; each
+        user gets one order for all of their deliveries in the batch, paid
+        from their balance.  Everything is written set-based: one
+        statement each for the orders, their items, the stock, the ledger
+        and the subscriptions, however big the batch.  Deliveries that
+        find no stock or no money are retried retry_delay seconds later,
+        with the reason in last_error."""
+        with app.db.begin(isolation_level='READ COMMITTED') as conn:
+            due = conn.execute(text('''
+SELECT id, user_id, product_id
+FROM Subscriptions
+WHERE active AND next_due_at <= now()
+ORDER BY next_due_at, id
+LIMIT :batch_size
+FOR UPDATE SKIP LOCKED
+'''), {"batch_size": batch_size}).fetchall()
+            if not due:
+                return 0, 0, 0
+
+            # buyers, then listings, each locked in id order so concurrent
+            # workers (and checkouts, which lock the buyer first) queue
+            # instead of deadlocking
+            buyers = {user_id: list(row) for user_id, row in
+                      BalanceLedger.lock_users(conn, [user_id for _, user_id, _ in due]).items()}
+            listings = {}
+            for listing_id, product_id, seller_id, price, available in conn.execute(text('''
+SELECT id, product_id, seller_id, price, quantity - reserved
+FROM ProductSeller
+WHERE product_id = ANY(:product_ids)
+  AND is_active AND NOT flash_sale AND quantity > reserved AND quantity > 0
+ORDER BY id
+FOR NO KEY UPDATE
+'''), {"product_ids": sorted({product_id for _, _, product_id in due})}):
+                listings.setdefault(product_id, []).append([listing_id, seller_id, Decimal(price), available])
+            for candidates in listings.values():
+                candidates.sort(key=lambda listing: (listing[2], listing[0]))
+
+            orders = {}
+            fulfilled = {}
+            deferred = {}
+            for subscription_id, user_id, product_id in due:
+                listing = next((candidate for candidate in listings.get(product_id, ())
+                                if candidate[3] > 0 and candidate[1] != user_id), None)
+                if listing is None:
+                    deferred[subscription_id] = 'out of stock'
+                    continue
+                if buyers[user_id][0] < listing[2]:
+                    deferred[subscription_id] = 'insufficient balance'
+                    continue
+                listing[3] -= 1
+                buyers[user_id][0] -= listing[2]
+                orders.setdefault(user_id, []).append((listing[0], listing[1], product_id, listing[2]))
+                fulfilled[subscription_id] = user_id
+
+            order_ids = {}
+            if orders:
+                user_ids = list(orders)
+                order_ids = {user_id: order_id for order_id, user_id in conn.execute(text('''
+INSERT INTO Orders (user_id, total_amount, status, shipping_street, item_count, fulfilled_count, fulfillment_status)
+SELECT user_id, total_amount, 'pending', address, item_count, 0, 'Order Placed'
+FROM unnest(CAST(:user_ids AS INT[]), CAST(:totals AS DECIMAL[]), CAST(:addresses AS VARCHAR[]),
+            CAST(:item_counts AS INT[])) AS o(user_id, total_amount, address, item_count)
+RETURNING id, user_id
+'''), {
+                    "user_ids": user_ids,
+                    "totals": [sum(item[3] for item in orders[user_id]) for user_id in user_ids],
+                    "addresses": [buyers[user_id][1] for user_id in user_ids],
+                    "item_counts": [len(orders[user_id]) for user_id in user_ids],
+                })}
+
+                items = [(order_ids[user_id], *item) for user_id in user_ids for item in orders[user_id]]
+                conn.execute(text('''
+INSERT INTO OrderItems (order_id, listing_id, seller_id, product_id, unit_price, quantity, subtotal)
+SELECT order_id, listing_id, seller_id, product_id, unit_price, 1, unit_price
+FROM unnest(CAST(:order_ids AS INT[]), CAST(:listing_ids AS INT[]), CAST(:seller_ids AS INT[]),
+            CAST(:product_ids AS INT[]), CAST(:unit_prices AS DECIMAL[]))
+     AS i(order_id, listing_id, seller_id, product_id, unit_price)
+'''), {
+                    "order_ids": [item[0] for item in items],
+                    "listing_ids": [item[1] for item in items],
+                    "seller_ids": [item[2] for item in items],
+                    "product_ids": [item[3] for item in items],
+                    "unit_prices": [item[4] for item in items],
+                })
+
+                sold = {}
+                for item in items:
+                    sold[item[1]] = sold.get(item[1], 0) + 1
+                conn.execute(text('''
+UPDATE ProductSeller ps
+SET quantity = ps.quantity - s.sold
+FROM unnest(CAST(:listing_ids AS INT[]), CAST(:sold AS INT[])) AS s(listing_id, sold)
+WHERE ps.id = s.listing_id
+'''), {"listing_ids": list(sold), "sold": list(sold.values())})
+                conn.execute(text('''
+UPDATE Products p
+SET available = FALSE
+WHERE p.id = ANY(CAST(:product_ids AS INT[]))
+  AND p.available
+  AND NOT EXISTS (SELECT 1 FROM ProductSeller ps
+                  WHERE ps.product_id = p.id AND ps.is_active = TRUE AND ps.quantity > 0)
+'''), {"product_ids": sorted({item[3] for item in items})})
+
+                sales = {}
+                for order_id, _, seller_id, _, unit_price in items:
+                    sales[order_id, seller_id] = sales.get((order_id, seller_id), Decimal("0")) + unit_price
+                BalanceLedger.append(conn, [
+                    (user_id, -sum(item[3] for item in orders[user_id]), 'purchase', order_ids[user_id])
+                    for user_id in user_ids
+                ] + [(seller_id, amount, 'sale', order_id) for (order_id, seller_id), amount in sales.items()])
+
+                # the next delivery is a period after this one was due, or
+                # after now if the subscription fell more than a period behind
+                conn.execute(text(f'''
+UPDATE Subscriptions
+SET next_due_at = CASE WHEN next_due_at + {_interval('frequency')} > now()
+                       THEN next_due_at + {_interval('frequency')}
+                       ELSE now() + {_interval('frequency')}
+                  END,
+    last_order_id = f.order_id,
+    last_error = NULL
+FROM unnest(CAST(:subscription_ids AS INT[]), CAST(:order_ids AS INT[])) AS f(subscription_id, order_id)
+WHERE id = f.subscription_id
+'''), {
+                    "subscription_ids": list(fulfilled),
+                    "order_ids": [order_ids[user_id] for user_id in fulfilled.values()],
+                })
+
+            if deferred:
+                conn.execute(text('''
+UPDATE Subscriptions
+SET next_due_at = now() + make_interval(secs => CAST(:retry_delay AS DOUBLE PRECISION)),
+    last_error = d.error
+FROM unnest(CAST(:subscription_ids AS INT[]), CAST(:errors AS VARCHAR[])) AS d(subscription_id, error)
+WHERE id = d.subscription_id
+'''), {"subscription_ids": list(deferred), "errors": list(deferred.values()), "retry_delay": retry_delay})
+
+        # the buyers' cached Orders tabs; caches of other processes expire on their own
+        for user_id in order_ids:
+            app.user_cache.invalidate(user_id)
+        return len(fulfilled), len(deferred), len(order_ids)
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 import secrets
 
 from .. import login
+from .balance import BalanceLedger, PENDING
 
 
 class User(UserMixin):
@@ -25,8 +26,8 @@ class User(UserMixin):
 
     @staticmethod
     def get_by_auth(email, password):
-        rows = app.db.execute("""
-SELECT password, id, email, firstname, lastname, address, balance, is_seller,
+        rows = app.db.execute(f"""
+SELECT password, id, email, firstname, lastname, address, balance + {PENDING}, is_seller,
        created_at, email_verified, verification_token, verification_sent_at
 FROM Users
 WHERE email = :email
@@ -111,8 +112,8 @@ WHERE id = :uid
     @staticmethod
     @login.user_loader
     def get(id):
-        rows = app.db.execute("""
-SELECT id, email, firstname, lastname, address, balance, is_seller,
+        rows = app.db.execute(f"""
+SELECT id, email, firstname, lastname, address, balance + {PENDING}, is_seller,
        created_at, email_verified, verification_token, verification_sent_at
 FROM Users
 WHERE id = :id
@@ -133,16 +134,9 @@ WHERE id = :uid
 
     @staticmethod
     def add_balance(uid, amount):
-        app.db.execute("""
-UPDATE Users
-SET balance = balance + :amount
-WHERE id = :uid
-""", amount=amount, uid=uid)
+        BalanceLedger.deposit(uid, amount)
 
     @staticmethod
     def withdraw_balance(uid, amount):
-        app.db.execute("""
-UPDATE Users
-SET balance = balance - :amount
-WHERE id = :uid
-""", amount=amount, uid=uid)
+        """Return False, withdrawing nothing, if the balance is too low."""
+        return BalanceLedger.withdraw(uid, amount)
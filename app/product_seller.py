@@ -1,10 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app as app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app as app
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, DecimalField, IntegerField, SubmitField, SelectField
 from wtforms.validators import DataRequired, NumberRange, ValidationError
 from .models.product_seller import ProductSeller
 from .models.product import Product
+from .models.job import Job
 
 bp = Blueprint('product_seller', __name__, url_prefix='/sellers')
 
@@ -48,38 +49,6 @@ def seller_inventory(seller_id):
                                         
     inventory = ProductSeller.get_all_detailed_by_seller(seller_id)
 
-    # seller basic info 
-    seller_rows = app.db.execute("""
-        SELECT id, firstname, lastname
-        FROM Users
-        WHERE id = :sid
-    """, sid=seller_id)
-    seller = seller_rows[0] if seller_rows else None
-
-    # rating summary for this seller
-    rating_rows = app.db.execute("""
-        SELECT
-            AVG(rating) AS avg_rating,
-            COUNT(*)   AS num_reviews
-        FROM seller_reviews
-        WHERE seller_id = :sid
-    """, sid=seller_id)
-    seller_rating = rating_rows[0] if rating_rows else None
-
-    # full list of reviews for this seller
-    seller_reviews = app.db.execute("""
-        SELECT
-            sr.rating,
-            sr.body,
-            sr.created_at,
-            u.firstname,
-            u.lastname
-        FROM seller_reviews sr
-        JOIN Users u ON u.id = sr.user_id
-        WHERE sr.seller_id = :sid
-        ORDER BY sr.created_at DESC
-    """, sid=seller_id)
-                                                             
     inventory = sorted(inventory, key=lambda itm: itm.get('product_id', 0))
     
     # Get all products grouped by category
@@ -108,12 +77,41 @@ def seller_inventory(seller_id):
     add_form.product_id.choices = choices
 
                                                                               
-    try:
-        analytics = ProductSeller.analytics_for_seller(seller_id, days=30, limit=6)
-    except Exception:
-        analytics = None
+    # analytics come from the last background snapshot; the page polls for fresher numbers
+    window = _analytics_window()
+    snapshot = app.analytics.snapshot(seller_id, days=window)
 
-    return render_template('seller_inventory.html', inventory=inventory, add_form=add_form, analytics=analytics, seller_id=seller_id)
+    return render_template('seller_inventory.html', inventory=inventory, add_form=add_form,
+                           analytics=snapshot['analytics'], analytics_snapshot=snapshot,
+                           seller_id=seller_id, window=window, analytics_windows=ProductSeller.ANALYTICS_WINDOWS)
+
+
+def _analytics_window():
+    window = request.args.get('window', 30, type=int)
+    if window not in ProductSeller.ANALYTICS_WINDOWS:
+        window = 30
+    return window
+
+
+@bp.route('/<int:seller_id>/inventory/analytics.json')
+@login_required
+def seller_analytics(seller_id):
+    """
+    Return the latest analytics snapshot for a seller's dashboard as JSON.
+    """
+    if current_user.id != seller_id:
+        return jsonify({"error": "You do not have permission to access these analytics."}), 403
+
+    snapshot = app.analytics.snapshot(seller_id, days=_analytics_window())
+    computed_at = snapshot['computed_at']
+    return jsonify({
+        "analytics": snapshot['analytics'],
+        "computed_at": computed_at.isoformat() if computed_at else None,
+        "compute_ms": snapshot['compute_ms'],
+        "error": snapshot['error'],
+        "refreshing": snapshot['refreshing'],
+        "timings": app.analytics.timings(seller_id)
+    })
 
 
 @bp.route('/<int:seller_id>/inventory/add', methods=['POST'])
@@ -185,10 +183,10 @@ def update_product(seller_id, listing_id):
     if form.validate_on_submit():
         try:
             ProductSeller.update_quantity(listing_id, form.quantity.data)
+            app.flash_sales.restocked(listing_id)
                                                                                     
                                                                         
-            has_active = ProductSeller.has_active_listings_for_product(listing.product_id)
-            Product.set_available(listing.product_id, has_active)
+            Job.enqueue('recompute_availability', {"product_id": listing.product_id})
             flash('Quantity updated successfully!', 'success')
         except Exception as e:
             flash(f'Error updating quantity: {str(e)}')
@@ -196,6 +194,34 @@ def update_product(seller_id, listing_id):
     return redirect(url_for('product_seller.seller_inventory', seller_id=seller_id))
 
 
+@bp.route('/<int:seller_id>/inventory/<int:listing_id>/flash-sale', methods=['POST'])
+@login_required
+def toggle_flash_sale(seller_id, listing_id):
+    """
+    Turn flash-sale mode on or off for a listing in seller's inventory.
+    """
+    if current_user.id != seller_id:
+        flash('You do not have permission to perform this action.')
+        return redirect(url_for('index.index'))
+
+    listing = ProductSeller.get(listing_id)
+    if not listing or listing.seller_id != seller_id:
+        flash('Listing not found.')
+        return redirect(url_for('product_seller.seller_inventory', seller_id=seller_id))
+
+    form = RemoveProductForm()
+    if form.validate_on_submit():
+        enabled = request.form.get('enabled') == '1'
+        try:
+            ProductSeller.set_flash_sale(listing_id, enabled)
+            app.flash_sales.restocked(listing_id)
+            flash('Flash sale started.' if enabled else 'Flash sale ended.', 'success')
+        except Exception as e:
+            flash(f'Error updating flash sale: {str(e)}')
+
+    return redirect(url_for('product_seller.seller_inventory', seller_id=seller_id))
+
+
 @bp.route('/<int:seller_id>/inventory/<int:listing_id>/remove', methods=['POST'])
 @login_required
 def remove_product(seller_id, listing_id):
@@ -218,8 +244,7 @@ def remove_product(seller_id, listing_id):
             if listing.is_active:
                 ProductSeller.deactivate(listing_id)
                                                                                             
-                if not ProductSeller.has_active_listings_for_product(listing.product_id):
-                    Product.set_available(listing.product_id, False)
+                Job.enqueue('recompute_availability', {"product_id": listing.product_id})
                 flash('Product removed from inventory.', 'success')
             else:
                 ProductSeller.activate(listing_id)
@@ -5,7 +5,6 @@ import math
 from .models.category import Category
 from .models.product import Product
 from .models.product_review import ProductReview
-from .models.product_seller import ProductSeller
 from .models.subscription import Subscription
 
 bp = Blueprint('products', __name__, url_prefix='/products')
@@ -51,62 +50,57 @@ def browse():
 
 @bp.route('/<int:product_id>', methods=['GET'])
 def detail(product_id):
-    product = Product.get(product_id)
-    if not product:
-        abort(404)
     review_page = request.args.get('rpage', 1, type=int)
     review_sort = request.args.get('rsort', 'helpful')
     review_min_rating = request.args.get('rstars', type=int)
+    review_cursor = request.args.get('rcursor')
     per_page = 8
-    sellers = ProductSeller.get_active_by_product(product_id)
     uid = current_user.id if current_user.is_authenticated else None
-    reviews = ProductReview.get_for_product(product_id,
-                                           user_id=uid,
-                                           per_page=per_page,
-                                           page=review_page,
-                                           min_rating=review_min_rating,
-                                           sort=review_sort)
-    rating_summary = app.db.execute(
-        """
-        SELECT AVG(rating) AS avg_rating,
-               COUNT(*)    AS num_reviews
-        FROM product_reviews
-        WHERE product_id = :pid
-        """,
-        pid=product_id
-    )
-    rating_summary = rating_summary[0] if rating_summary else None
-    total_reviews = rating_summary.num_reviews if rating_summary else 0
+
+    # The review page only needs the product id, so it runs concurrently with
+    # the combined detail query; suggestions and the subscription lookup
+    # follow once the product is known.
+    with app.db.fanout() as fan:
+        detail_f = fan.submit('detail', Product.load_detail, product_id, uid)
+        reviews_f = fan.submit('reviews', ProductReview.get_for_product,
+                               product_id,
+                               user_id=uid,
+                               per_page=per_page,
+                               page=review_page,
+                               min_rating=review_min_rating,
+                               sort=review_sort,
+                               cursor=review_cursor)
+
+        data = detail_f.result()
+        if not data:
+            abort(404)
+        product = data["product"]
+
+        suggestions_f = fan.submit('similar', Product.similar, product, limit=4)
+        allow_subscription = bool(product.category_name and product.category_name.lower().startswith('frozen treat'))
+        subscription_f = None
+        if allow_subscription and uid:
+            subscription_f = fan.submit('subscription', Subscription.get_active_for_user_product, uid, product_id)
+
+    sellers = data["listings"]
+    reviews = app.votes.overlay(reviews_f.result(), 'product', uid)
+    rating_summary = data["rating_summary"]
+    total_reviews = rating_summary["num_reviews"]
     total_review_pages = max(1, math.ceil(total_reviews / per_page)) if total_reviews else 1
+    next_review_cursor = ProductReview.cursor_for(reviews[-1], review_sort) if len(reviews) == per_page else None
     # rating breakdown by star
-    breakdown_rows = app.db.execute(
-        """
-        SELECT rating, COUNT(*) AS cnt
-        FROM product_reviews
-        WHERE product_id = :pid
-        GROUP BY rating
-        """,
-        pid=product_id
-    )
-    rating_breakdown = {r.rating: r.cnt for r in breakdown_rows}
-
-    suggestions = Product.similar(product, limit=4)
-    allow_subscription = bool(product.category_name and product.category_name.lower().startswith('frozen treat'))
-    existing_subscription = None
-    if allow_subscription and current_user.is_authenticated:
-        existing_subscription = Subscription.get_active_for_user_product(current_user.id, product_id)
+    rating_breakdown = data["rating_breakdown"]
+
+    suggestions = suggestions_f.result()
+    existing_subscription = subscription_f.result() if subscription_f else None
     frequency_options = [
         ('weekly', 'Every Week'),
         ('monthly', 'Every Month'),
         ('quarterly', 'Every 3 Months')
     ]
-    # Check if user has purchased this product
-    has_purchased = False
-    has_delivered_order = False
-    if current_user.is_authenticated:
-        purchase_rows = ProductSeller.get_user_purchases_for_product(current_user.id, product_id)
-        has_purchased = bool(purchase_rows)
-        has_delivered_order = ProductSeller.get_user_delivered_orders_for_product(current_user.id, product_id)
+    # Whether the viewer has purchased / received this product
+    has_purchased = data["has_purchased"]
+    has_delivered_order = data["has_delivered_order"]
     return render_template('product_detail.html',
                            product=product,
                            sellers=sellers,
@@ -115,6 +109,7 @@ def detail(product_id):
                            rating_breakdown=rating_breakdown,
                            review_page=review_page,
                            total_review_pages=total_review_pages,
+                           next_review_cursor=next_review_cursor,
                            review_sort=review_sort,
                            review_min_rating=review_min_rating,
                            per_page=per_page,
@@ -0,0 +1,102 @@
+import itertools
+import threading
+
+from sqlalchemy import create_engine, text
+
+# Replication lag in seconds; 0 when the standby has replayed everything it
+# received (pg_last_xact_replay_timestamp alone grows while the primary is idle).
+LAG_SQL = '''
+SELECT pg_is_in_recovery(),
+       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+       END
+'''
+
+
+class Replica:
+    def __init__(self, uri):
+        self.uri = uri
+        # standbys only run read-only transactions, and not SERIALIZABLE ones
+        self.engine = create_engine(uri, pool_pre_ping=True,
+                                    execution_options={"isolation_level": "REPEATABLE READ",
+                                                       "postgresql_readonly": True})
+        self.healthy = False
+        self.lag = None
+        self.error = None
+
+    @property
+    def name(self):
+        return self.engine.url.render_as_string(hide_password=True)
+
+
+class ReplicaSet:
+    """Read replicas of the primary database, with background health checks.
+
+    A thread checks every replica each DB_REPLICA_CHECK_INTERVAL seconds and
+    only hands out (round-robin) those that answer, are standbys and lag by
+    at most DB_REPLICA_MAX_LAG seconds.  Replicas start out unhealthy until
+    their first check passes; choose() returns None when none are usable,
+    and callers read from the primary instead.
+    """
+    def __init__(self, app, uris):
+        self.app = app
+        self.max_lag = app.config['DB_REPLICA_MAX_LAG']
+        self.interval = app.config['DB_REPLICA_CHECK_INTERVAL']
+        self.replicas = [Replica(uri) for uri in uris]
+        self._lock = threading.Lock()
+        self._healthy = []
+        self._turn = itertools.count()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='replica-health', daemon=True)
+        self._thread.start()
+
+    def choose(self):
+        with self._lock:
+            if not self._healthy:
+                return None
+            return self._healthy[next(self._turn) % len(self._healthy)]
+
+    def mark_down(self, replica, error=None):
+        """Stop using a replica until its next successful health check."""
+        with self._lock:
+            if replica.healthy:
+                self.app.logger.warning("Replica %s failed, reading from the primary: %s", replica.name, error)
+            replica.healthy = False
+            replica.error = str(error) if error else None
+            self._healthy = [r for r in self.replicas if r.healthy]
+
+    def status(self):
+        with self._lock:
+            return [{"replica": r.name, "healthy": r.healthy, "lag": r.lag, "error": r.error}
+                    for r in self.replicas]
+
+    def check(self):
+        for replica in self.replicas:
+            healthy, lag, error = False, None, None
+            try:
+                with replica.engine.connect() as conn:
+                    in_recovery, lag = conn.execute(text(LAG_SQL)).first()
+                    conn.rollback()
+                lag = float(lag) if lag is not None else None
+                if not in_recovery:
+                    error = 'not a standby'
+                elif lag is None or lag > self.max_lag:
+                    error = f'lagging by {lag if lag is not None else "an unknown time"}s'
+                else:
+                    healthy = True
+            except Exception as exc:
+                error = str(exc).strip().splitlines()[0] if str(exc).strip() else type(exc).__name__
+            with self._lock:
+                if healthy != replica.healthy:
+                    self.app.logger.info("Replica %s is %s%s", replica.name,
+                                         'healthy' if healthy else 'unhealthy', f' ({error})' if error else '')
+                replica.healthy, replica.lag, replica.error = healthy, lag, error
+                self._healthy = [r for r in self.replicas if r.healthy]
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.check()
+            self._stopped.wait(self.interval)
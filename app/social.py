@@ -3,8 +3,8 @@ from flask import (
     request, redirect, url_for, flash
 )
 from flask_login import login_required, current_user
-from pathlib import Path
-from .models.product_review import ProductReview
+from .models.product import Product
+from .models.product_review import ProductReview, SellerReview, ReviewActivity
 import math
 
 bp = Blueprint('social', __name__)
@@ -31,63 +31,28 @@ def public_seller_reviews(seller_id):
     seller = seller_rows[0]
     uid = current_user.id if current_user.is_authenticated else 0
 
-    # 2. All reviews for this seller
-    all_reviews = app.db.execute(
-        """
-        WITH aggregated AS (
-            SELECT sr.seller_review_id,
-                   sr.seller_id,
-                   sr.user_id,
-                   sr.rating,
-                   sr.body,
-                   sr.created_at,
-                   u.firstname,
-                   u.lastname,
-                   COALESCE(SUM(rv.vote), 0) AS helpful_count,
-                   MAX(CASE WHEN rv.user_id = :uid THEN 1 ELSE 0 END) AS user_voted,
-                   MAX(CASE WHEN EXISTS (
-                           SELECT 1
-                           FROM Purchases pu
-                           JOIN ProductSeller ps ON pu.pid = ps.product_id
-                           WHERE pu.uid = sr.user_id
-                             AND ps.seller_id = sr.seller_id
-                       ) THEN 1 ELSE 0 END) AS verified
-            FROM seller_reviews sr
-            JOIN users u ON sr.user_id = u.id
-            LEFT JOIN review_votes rv
-                   ON rv.review_type = 'seller'
-                  AND rv.review_id = sr.seller_review_id
-            WHERE sr.seller_id = :sid
-            GROUP BY sr.seller_review_id, u.firstname, u.lastname
-        ),
-        ranked AS (
-            SELECT *,
-                   ROW_NUMBER() OVER (ORDER BY helpful_count DESC, created_at DESC) AS helpful_rank
-            FROM aggregated
-        )
-        SELECT *
-        FROM ranked
-        ORDER BY CASE WHEN helpful_rank <= 3 THEN 0 ELSE 1 END,
-                 helpful_rank,
-                 created_at DESC
-        """,
-        sid=seller_id,
-        uid=uid
+    # 2. One page of reviews for this seller
+    review_page = request.args.get('page', 1, type=int)
+    per_page = 10
+    all_reviews = SellerReview.get_for_seller(
+        seller_id,
+        user_id=uid,
+        per_page=per_page,
+        page=review_page,
+        cursor=request.args.get('cursor')
     )
+    app.votes.overlay(all_reviews, 'seller', uid)
 
     # 3. Summary (avg + count)
-    summary_rows = app.db.execute(
-        """
-        SELECT AVG(rating) AS avg_rating,
-               COUNT(*)    AS num_reviews
-        FROM seller_reviews
-        WHERE seller_id = :sid
-        """,
-        sid=seller_id
-    )
-    rating_summary = summary_rows[0] if summary_rows else None
+    rating_summary = SellerReview.summary(seller_id)
+    total_review_pages = max(1, math.ceil(rating_summary["num_reviews"] / per_page))
+    next_review_cursor = (SellerReview.cursor_for(all_reviews[-1])
+                          if len(all_reviews) == per_page else None)
 
-    return render_template('seller_reviews_public.html', seller=seller, all_reviews=all_reviews, rating_summary=rating_summary)
+    return render_template('seller_reviews_public.html', seller=seller, all_reviews=all_reviews,
+                           rating_summary=rating_summary, review_page=review_page,
+                           total_review_pages=total_review_pages,
+                           next_review_cursor=next_review_cursor)
 
 @bp.route('/social')
 @login_required
@@ -104,11 +69,7 @@ def social_page():
         limit = 5
     limit = max(1, min(limit, 50))               
 
-    # Load SQL file for recent feedback
-    sql_path = Path(app.root_path).parent / 'sql' / 'get_recent_feedback.sql'
-    sql = sql_path.read_text()
-
-    rows = app.db.execute(sql, user_id=current_user.id, type=ftype, limit=limit)
+    rows = app.db.named('get_recent_feedback', user_id=current_user.id, type=ftype, limit=limit)
 
     return render_template('social.html', rows=rows)
 
@@ -132,42 +93,11 @@ def toggle_helpful_vote():
         flash("Invalid review selection.")
         return redirect(next_url)
 
-    # Validate that the review exists
-    if review_type == 'product':
-        table = 'product_reviews'
-        id_col = 'product_review_id'
-    else:
-        table = 'seller_reviews'
-        id_col = 'seller_review_id'
-
-    exists = app.db.execute(
-        f"SELECT 1 FROM {table} WHERE {id_col} = :rid LIMIT 1",
-        rid=review_id
-    )
-    if not exists:
-        flash("Review not found.")
-        return redirect(next_url)
-
-    if action == 'remove':
-        app.db.execute(
-            """
-            DELETE FROM review_votes
-            WHERE review_type = :rt AND review_id = :rid AND user_id = :uid
-            """,
-            rt=review_type, rid=review_id, uid=current_user.id
-        )
-        flash("Removed your helpful vote.")
-    else:
-        app.db.execute(
-            """
-            INSERT INTO review_votes(review_type, review_id, user_id, vote)
-            VALUES (:rt, :rid, :uid, 1)
-            ON CONFLICT (review_type, review_id, user_id)
-            DO UPDATE SET vote = EXCLUDED.vote, created_at = now()
-            """,
-            rt=review_type, rid=review_id, uid=current_user.id
-        )
-        flash("Marked as helpful.")
+    # Votes are buffered and written in batches (see app.votes.VoteBuffer);
+    # votes for reviews that do not exist are discarded when the batch is flushed.
+    voted = action != 'remove'
+    app.votes.record(review_type, review_id, current_user.id, voted)
+    flash("Marked as helpful." if voted else "Removed your helpful vote.")
 
     return redirect(next_url)
 
@@ -180,20 +110,13 @@ def product_review(product_id):
     One review per user per product.
     """
 
-    # 1. Fetch the product
-    product_rows = app.db.execute(
-        """
-        SELECT id, name, price
-        FROM Products
-        WHERE id = :pid
-        """,
-        pid=product_id
-    )
-    if not product_rows:
+    # 1. Fetch the product with its rating summary and star breakdown
+    data = Product.load_detail(product_id, current_user.id)
+    if not data:
         flash("Product not found.")
         return redirect('/')
 
-    product = product_rows[0]
+    product = data["product"]
 
     # 2. Handle POST: save or delete review
     if request.method == 'POST':
@@ -201,8 +124,15 @@ def product_review(product_id):
         if 'delete' in request.form:
             app.db.execute(
                 """
-                DELETE FROM product_reviews
-                WHERE product_id = :pid AND user_id = :uid
+                WITH deleted AS (
+                    DELETE FROM product_reviews
+                    WHERE product_id = :pid AND user_id = :uid
+                    RETURNING product_id
+                )
+                UPDATE review_counts rc
+                SET review_count = rc.review_count - d.cnt
+                FROM (SELECT product_id, COUNT(*) AS cnt FROM deleted GROUP BY product_id) d
+                WHERE rc.review_type = 'product' AND rc.target_id = d.product_id
                 """,
                 pid=product_id, uid=current_user.id
             )
@@ -236,20 +166,33 @@ def product_review(product_id):
                     UPDATE product_reviews
                     SET rating = :rating,
                         body   = :body,
-                        created_at = now()
+                        created_at = now(),
+                        verified = EXISTS (
+                            SELECT 1 FROM Purchases WHERE uid = :uid AND pid = :pid
+                        )
                     WHERE product_review_id = :rid
                     """,
                     rating=rating,
                     body=body,
+                    uid=current_user.id,
+                    pid=product_id,
                     rid=existing[0].product_review_id
                 )
             else:
                 # Insert new review
                 app.db.execute(
                     """
-                    INSERT INTO product_reviews
-                        (product_id, user_id, rating, body)
-                    VALUES (:pid, :uid, :rating, :body)
+                    WITH inserted AS (
+                        INSERT INTO product_reviews
+                            (product_id, user_id, rating, body, verified)
+                        VALUES (:pid, :uid, :rating, :body,
+                                EXISTS (SELECT 1 FROM Purchases WHERE uid = :uid AND pid = :pid))
+                        RETURNING product_id
+                    )
+                    INSERT INTO review_counts (review_type, target_id, review_count)
+                    SELECT 'product', product_id, 1 FROM inserted
+                    ON CONFLICT (review_type, target_id)
+                    DO UPDATE SET review_count = review_counts.review_count + 1
                     """,
                     pid=product_id,
                     uid=current_user.id,
@@ -264,6 +207,7 @@ def product_review(product_id):
     per_page = 10
     review_sort = request.args.get('sort', 'helpful')
     review_min_rating = request.args.get('stars', type=int)
+    review_cursor = request.args.get('cursor')
     # 3. Load all reviews (with helpful counts); find the current user's review
     all_reviews = ProductReview.get_for_product(
         product_id,
@@ -271,33 +215,19 @@ def product_review(product_id):
         per_page=per_page,
         page=review_page,
         min_rating=review_min_rating,
-        sort=review_sort
+        sort=review_sort,
+        cursor=review_cursor
     )
+    app.votes.overlay(all_reviews, 'product', current_user.id)
     user_review = next((r for r in all_reviews if r.user_id == current_user.id), None)
 
-    # 4. Summary (avg + count)
-    summary_rows = app.db.execute(
-        """
-        SELECT AVG(rating) AS avg_rating,
-               COUNT(*)    AS num_reviews
-        FROM product_reviews
-        WHERE product_id = :pid
-        """,
-        pid=product_id
-    )
-    rating_summary = summary_rows[0] if summary_rows else None
-    total_reviews = rating_summary.num_reviews if rating_summary else 0
+    # 4. Summary (avg + count) and per-star breakdown
+    rating_summary = data["rating_summary"]
+    total_reviews = rating_summary["num_reviews"]
     total_review_pages = max(1, math.ceil(total_reviews / per_page)) if total_reviews else 1
-    breakdown_rows = app.db.execute(
-        """
-        SELECT rating, COUNT(*) AS cnt
-        FROM product_reviews
-        WHERE product_id = :pid
-        GROUP BY rating
-        """,
-        pid=product_id
-    )
-    rating_breakdown = {r.rating: r.cnt for r in breakdown_rows}
+    next_review_cursor = (ProductReview.cursor_for(all_reviews[-1], review_sort)
+                          if len(all_reviews) == per_page else None)
+    rating_breakdown = data["rating_breakdown"]
 
     return render_template(
         'product_review.html',
@@ -309,7 +239,8 @@ def product_review(product_id):
         review_sort=review_sort,
         review_min_rating=review_min_rating,
         review_page=review_page,
-        total_review_pages=total_review_pages
+        total_review_pages=total_review_pages,
+        next_review_cursor=next_review_cursor
     )
 
 
@@ -317,81 +248,38 @@ def product_review(product_id):
 @login_required
 def my_reviews():
     """
-    List all reviews authored by the current user (product + seller),
-    newest first, with links to edit.
+    List the reviews authored by the current user (product + seller),
+    newest first and a page at a time, with links to edit.
     """
     ftype = request.args.get('type', 'all').lower()
     if ftype not in ('all', 'product', 'seller'):
         ftype = 'all'
     min_rating = request.args.get('stars', type=int)
 
-    product_reviews = []
-    if ftype in ('all', 'product'):
-        product_reviews = app.db.execute(
-            """
-            SELECT pr.product_review_id,
-                   pr.product_id,
-                   pr.rating,
-                   pr.body,
-                   pr.created_at,
-                   p.name AS product_name,
-                   (SELECT COUNT(*) FROM product_reviews WHERE product_id = pr.product_id) AS total_reviews_for_product
-            FROM product_reviews pr
-            JOIN products p ON pr.product_id = p.id
-            WHERE pr.user_id = :uid
-              AND (:min_rating IS NULL OR pr.rating >= :min_rating)
-            ORDER BY pr.created_at DESC
-            """,
-            uid=current_user.id,
-            min_rating=min_rating
-        )
-
-    seller_reviews = []
-    if ftype in ('all', 'seller'):
-        seller_reviews = app.db.execute(
-            """
-            SELECT sr.seller_review_id,
-                   sr.seller_id,
-                   sr.rating,
-                   sr.body,
-                   sr.created_at,
-                   u.firstname,
-                   u.lastname,
-                   (SELECT COUNT(*) FROM seller_reviews WHERE seller_id = sr.seller_id) AS total_reviews_for_seller
-            FROM seller_reviews sr
-            JOIN users u ON sr.seller_id = u.id
-            WHERE sr.user_id = :uid
-              AND (:min_rating IS NULL OR sr.rating >= :min_rating)
-            ORDER BY sr.created_at DESC
-            """,
-            uid=current_user.id,
-            min_rating=min_rating
-        )
-
-    seller_feedback = []
-    if current_user.is_seller:
-        seller_feedback = app.db.execute(
-            """
-            SELECT sr.seller_review_id,
-                   sr.user_id,
-                   sr.rating,
-                   sr.body,
-                   sr.created_at,
-                   u.firstname,
-                   u.lastname
-            FROM seller_reviews sr
-            JOIN users u ON sr.user_id = u.id
-            WHERE sr.seller_id = :sid
-            ORDER BY sr.created_at DESC
-            """,
-            sid=current_user.id
-        )
+    cursors = {name: request.args.get(f'{name}_cursor') for name in ReviewActivity.LISTS}
+    lists = ReviewActivity.get_for_user(
+        current_user.id,
+        review_type=ftype,
+        min_rating=min_rating,
+        include_feedback=current_user.is_seller,
+        per_page=10,
+        cursors=cursors
+    )
+
+    # each list pages on its own; the other lists stay where they are
+    older_urls = {}
+    for name in ReviewActivity.LISTS:
+        if lists[name]['next_cursor']:
+            args = {f'{other}_cursor': cursor for other, cursor in cursors.items() if cursor}
+            args[f'{name}_cursor'] = lists[name]['next_cursor']
+            older_urls[name] = url_for('social.my_reviews', type=ftype, stars=min_rating, **args)
 
     return render_template(
         'my_reviews.html',
-        product_reviews=product_reviews,
-        seller_reviews=seller_reviews,
-        seller_feedback=seller_feedback,
+        product_reviews=lists['product']['reviews'],
+        seller_reviews=lists['seller']['reviews'],
+        seller_feedback=lists['feedback']['reviews'],
+        older_urls=older_urls,
         filter_type=ftype,
         filter_min_rating=min_rating
     )
@@ -448,8 +336,15 @@ def seller_review(seller_id):
         if 'delete' in request.form:
             app.db.execute(
                 """
-                DELETE FROM seller_reviews
-                WHERE seller_id = :sid AND user_id = :uid
+                WITH deleted AS (
+                    DELETE FROM seller_reviews
+                    WHERE seller_id = :sid AND user_id = :uid
+                    RETURNING seller_id
+                )
+                UPDATE review_counts rc
+                SET review_count = rc.review_count - d.cnt
+                FROM (SELECT seller_id, COUNT(*) AS cnt FROM deleted GROUP BY seller_id) d
+                WHERE rc.review_type = 'seller' AND rc.target_id = d.seller_id
                 """,
                 sid=seller_id, uid=current_user.id
             )
@@ -481,91 +376,57 @@ def seller_review(seller_id):
                     UPDATE seller_reviews
                     SET rating = :rating,
                         body   = :body,
-                        created_at = now()
+                        created_at = now(),
+                        verified = :verified
                     WHERE seller_review_id = :rid
                     """,
                     rating=rating,
                     body=body,
+                    verified=eligible,
                     rid=existing[0].seller_review_id
                 )
             else:
                 app.db.execute(
                     """
-                    INSERT INTO seller_reviews
-                        (seller_id, user_id, rating, body)
-                    VALUES (:sid, :uid, :rating, :body)
+                    WITH inserted AS (
+                        INSERT INTO seller_reviews
+                            (seller_id, user_id, rating, body, verified)
+                        VALUES (:sid, :uid, :rating, :body, :verified)
+                        RETURNING seller_id
+                    )
+                    INSERT INTO review_counts (review_type, target_id, review_count)
+                    SELECT 'seller', seller_id, 1 FROM inserted
+                    ON CONFLICT (review_type, target_id)
+                    DO UPDATE SET review_count = review_counts.review_count + 1
                     """,
                     sid=seller_id,
                     uid=current_user.id,
                     rating=rating,
-                    body=body
+                    body=body,
+                    verified=eligible
                 )
 
             flash("Seller review saved.")
             return redirect(url_for('social.seller_review', seller_id=seller_id))
 
-    # 3. All reviews for this seller (with helpful counts)
-    all_reviews = app.db.execute(
-        """
-        WITH aggregated AS (
-            SELECT sr.seller_review_id,
-                   sr.seller_id,
-                   sr.user_id,
-                   sr.rating,
-                   sr.body,
-                   sr.created_at,
-                   u.firstname,
-                   u.lastname,
-                   COALESCE(SUM(rv.vote), 0) AS helpful_count,
-                   MAX(CASE WHEN rv.user_id = :uid THEN 1 ELSE 0 END) AS user_voted,
-                   MAX(CASE WHEN EXISTS (
-                           SELECT 1
-                           FROM OrderItems oi2
-                           JOIN Orders o2 ON oi2.order_id = o2.id
-                           WHERE o2.user_id = sr.user_id
-                             AND oi2.seller_id = sr.seller_id
-                             AND COALESCE(
-                                   oi2.fulfillment_status,
-                                   CASE WHEN oi2.fulfilled THEN 'Delivered' ELSE 'Order Placed' END
-                                 ) = 'Delivered'
-                       ) THEN 1 ELSE 0 END) AS verified
-            FROM seller_reviews sr
-            JOIN users u ON sr.user_id = u.id
-            LEFT JOIN review_votes rv
-                   ON rv.review_type = 'seller'
-                  AND rv.review_id = sr.seller_review_id
-            WHERE sr.seller_id = :sid
-            GROUP BY sr.seller_review_id, u.firstname, u.lastname
-        ),
-        ranked AS (
-            SELECT *,
-                   ROW_NUMBER() OVER (ORDER BY helpful_count DESC, created_at DESC) AS helpful_rank
-            FROM aggregated
-        )
-        SELECT *
-        FROM ranked
-        ORDER BY CASE WHEN helpful_rank <= 3 THEN 0 ELSE 1 END,
-                 helpful_rank,
-                 created_at DESC
-        """,
-        sid=seller_id,
-        uid=current_user.id
+    # 3. One page of reviews for this seller, plus the current user's own review
+    review_page = request.args.get('page', 1, type=int)
+    per_page = 10
+    all_reviews = SellerReview.get_for_seller(
+        seller_id,
+        user_id=current_user.id,
+        per_page=per_page,
+        page=review_page,
+        cursor=request.args.get('cursor')
     )
-
-    # Pick out the current user's review (if any)
-    user_review = next((r for r in all_reviews if r.user_id == current_user.id), None)
+    app.votes.overlay(all_reviews, 'seller', current_user.id)
+    user_review = SellerReview.get_by_user(seller_id, current_user.id)
 
     # 4. Summary (avg + count)
-    summary_rows = app.db.execute(
-        """
-        SELECT AVG(rating) AS avg_rating,
-               COUNT(*)    AS num_reviews
-        FROM seller_reviews
-        WHERE seller_id = :sid
-        """,
-        sid=seller_id
-    )
-    rating_summary = summary_rows[0] if summary_rows else None
+    rating_summary = SellerReview.summary(seller_id)
+    total_review_pages = max(1, math.ceil(rating_summary["num_reviews"] / per_page))
+    next_review_cursor = (SellerReview.cursor_for(all_reviews[-1])
+                          if len(all_reviews) == per_page else None)
 
     return render_template(
         'seller_review.html',
@@ -573,5 +434,8 @@ def seller_review(seller_id):
         eligible=eligible,
         user_review=user_review,
         all_reviews=all_reviews,
-        rating_summary=rating_summary
+        rating_summary=rating_summary,
+        review_page=review_page,
+        total_review_pages=total_review_pages,
+        next_review_cursor=next_review_cursor
     )
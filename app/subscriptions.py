@@ -0,0 +1,77 @@
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .models.subscription import Subscription
+
+
+class SubscriptionFulfiller:
+    """Turns due subscriptions into orders, SUBSCRIPTION_BATCH at a time.
+
+    Each batch is one Subscription.fulfill_due transaction.  Batches claim
+    their subscriptions with SKIP LOCKED, so the worker threads here, and
+    fulfillers in other processes or on other hosts, never take the same
+    subscription twice and never wait on each other's batches.
+    """
+    def __init__(self, app, batch_size=None):
+        self.app = app
+        self.batch_size = batch_size or app.config['SUBSCRIPTION_BATCH']
+        self.retry_delay = app.config['SUBSCRIPTION_RETRY_DELAY']
+        self._lock = threading.Lock()
+
+    def run(self, workers=1):
+        """Fulfill batches on `workers` threads until nothing is due;
+        returns (fulfilled, deferred, orders) summed over all batches."""
+        totals = [0, 0, 0]
+        errors = []
+
+        def work():
+            try:
+                with self.app.app_context():
+                    while True:
+                        counts = Subscription.fulfill_due(self.batch_size, self.retry_delay)
+                        with self._lock:
+                            for i, count in enumerate(counts):
+                                totals[i] += count
+                        if counts[0] + counts[1] < self.batch_size:
+                            return
+            except Exception as e:
+                self.app.logger.exception("Fulfilling subscriptions failed")
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, name=f'subscription-fulfiller-{i}') for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return tuple(totals)
+
+
+cli = AppGroup('subscriptions', help='Subscription deliveries.')
+
+
+@cli.command('fulfill')
+@click.option('--workers', default=1, show_default=True, help='Batches fulfilled in parallel.')
+@click.option('--batch-size', type=int, help='Subscriptions per batch [default: SUBSCRIPTION_BATCH].')
+@click.option('--watch', type=float, metavar='SECONDS',
+              help='Keep running, checking for due subscriptions every SECONDS.')
+def fulfill(workers, batch_size, watch):
+    """Order every due subscription delivery.
+
+    Safe to run from cron and from several hosts at once.
+    """
+    fulfiller = SubscriptionFulfiller(current_app._get_current_object(), batch_size)
+    while True:
+        started = time.perf_counter()
+        fulfilled, deferred, orders = fulfiller.run(workers)
+        if fulfilled or deferred or not watch:
+            click.echo(f'{fulfilled} deliveries in {orders} orders, {deferred} deferred '
+                       f'({time.perf_counter() - started:.1f}s)')
+        if not watch:
+            return
+        time.sleep(watch)
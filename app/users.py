@@ -5,13 +5,12 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, RadioField
 from wtforms.validators import ValidationError, DataRequired, Email, EqualTo, Length, Regexp
 from flask import current_app as app
-import smtplib
-import ssl
-from email.message import EmailMessage
 from .models.product_review import SellerReview
 
 from .models.user import User
 from .models.subscription import Subscription
+from .models.job import Job
+from .cart import merge_guest_cart
 
 
 from flask import Blueprint
@@ -66,26 +65,8 @@ def parse_address(address):
 
 
 def _send_email(recipient, subject, body):
-    server = app.config.get('MAIL_SERVER')
-    sender = app.config.get('MAIL_FROM')
-    if not server or not sender:
-        app.logger.info("Email to %s\nSubject: %s\n\n%s", recipient, subject, body)
-        return
-    port = app.config.get('MAIL_PORT', 587)
-    username = app.config.get('MAIL_USERNAME')
-    password = app.config.get('MAIL_PASSWORD')
-    msg = EmailMessage()
-    msg['Subject'] = subject
-    msg['From'] = sender
-    msg['To'] = recipient
-    msg.set_content(body)
-    context = ssl.create_default_context()
-    with smtplib.SMTP(server, port) as smtp:
-        if app.config.get('MAIL_USE_TLS', True):
-            smtp.starttls(context=context)
-        if username and password:
-            smtp.login(username, password)
-        smtp.send_message(msg)
+    # sent by the job worker (worker.py), so a slow mail server never holds up the request
+    Job.enqueue('send_email', {"recipient": recipient, "subject": subject, "body": body})
 
 
 def _send_verification_email(user, token):
@@ -126,7 +107,7 @@ def login():
         if not next_page or url_parse(next_page).netloc != '':
             next_page = url_for('index.index')
 
-        return redirect(next_page)
+        return merge_guest_cart(user.id, redirect(next_page))
     return render_template('login.html', title='Sign In', form=form)
 
 
@@ -291,10 +272,9 @@ def account():
 
                         
         if balance_form.submit_withdraw.data:
-            if amount > current_user.balance:
+            if amount > current_user.balance or not User.withdraw_balance(current_user.id, amount):
                 flash('Not enough balance to withdraw.')
             else:
-                User.withdraw_balance(current_user.id, amount)
                 flash(f'Withdrew ${amount:.2f}.')
 
         return redirect(url_for('users.account'))
@@ -339,8 +319,11 @@ def public_profile(user_id):
         return redirect(url_for('index.index'))
 
     if user.is_seller:
-        reviews = SellerReview.get_for_seller(user_id)
-        return render_template('seller_profile.html', user=user, reviews=reviews)
+        # the profile shows the latest few reviews; the full list lives on the seller reviews page
+        reviews = SellerReview.get_for_seller(user_id, per_page=5, sort='recent')
+        rating_summary = SellerReview.summary(user_id)
+        return render_template('seller_profile.html', user=user, reviews=reviews,
+                               rating_summary=rating_summary)
     else:
         return render_template('user_profile.html', user=user)
 
@@ -0,0 +1,215 @@
+import atexit
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+
+class VoteBuffer:
+    """Write-behind buffer for helpful votes on product and seller reviews.
+
+    Clicking "Helpful" only records the voter's latest intent in memory,
+    keyed by (review_type, review_id, user_id), so repeated toggles of the
+    same vote collapse into one row change.  A background thread flushes the
+    buffer every VOTE_FLUSH_INTERVAL seconds, or as soon as VOTE_FLUSH_SIZE
+    votes are waiting, in a single statement that upserts/deletes the votes
+    and adjusts the stored helpful counts.  Pages call overlay() so voters
+    see their own votes before they are flushed.  The buffer is flushed once
+    more when the process exits; votes newer than the last flush are lost
+    only if the process is killed outright.
+
+    A batch that fails with a transient error (lost connection, deadlock,
+    serialization failure, pool timeout) is retried on the next flush, up
+    to VOTE_FLUSH_ATTEMPTS times per vote.  Any other error means some vote
+    in the batch cannot be written, so the batch is split in halves until
+    the failing votes are isolated.  Votes that fail for good, or run out of
+    attempts, are dropped and logged.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['VOTE_FLUSH_INTERVAL']
+        self.max_pending = app.config['VOTE_FLUSH_SIZE']
+        self.max_attempts = app.config['VOTE_FLUSH_ATTEMPTS']
+        self._lock = threading.Lock()
+        # serializes flushes so the timer and shutdown never write the same batch twice
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}
+        # failed flushes of each vote still waiting to be written
+        self._attempts = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, review_type, review_id, user_id, voted):
+        """Buffer a user's vote (voted=True) or its removal (voted=False)."""
+        with self._lock:
+            key = (review_type, review_id, user_id)
+            self._pending[key] = bool(voted)
+            self._attempts.pop(key, None)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def overlay(self, reviews, review_type, user_id):
+        """Apply the user's unflushed votes to reviews loaded from the database,
+        adjusting user_voted and helpful_count in place."""
+        if not user_id:
+            return reviews
+        with self._lock:
+            for review in reviews:
+                key = (review_type, review.review_id, user_id)
+                voted = self._pending.get(key, self._inflight.get(key))
+                if voted is None or voted == review.user_voted:
+                    continue
+                review.user_voted = voted
+                review.helpful_count = max(0, review.helpful_count + (1 if voted else -1))
+        return reviews
+
+    def flush(self):
+        """Write every buffered vote to the database now."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            try:
+                self._write(batch)
+                failed = {}
+            except Exception as e:
+                if _transient(e):
+                    self.app.logger.warning("Flushing %d helpful votes failed; will retry: %s", len(batch), e)
+                    failed = dict.fromkeys(batch, e)
+                else:
+                    self.app.logger.exception("Flushing %d helpful votes failed; writing them in smaller batches",
+                                              len(batch))
+                    failed = self._write_split(batch)
+            dropped = []
+            with self._lock:
+                for key, error in failed.items():
+                    attempts = self._attempts.get(key, 0) + 1
+                    if key in self._pending:
+                        # a vote cast while the batch was in flight wins over the failed one
+                        continue
+                    if _transient(error) and attempts < self.max_attempts:
+                        self._pending[key] = batch[key]
+                        self._attempts[key] = attempts
+                    else:
+                        self._attempts.pop(key, None)
+                        dropped.append((key, attempts, error))
+                for key in batch.keys() - failed.keys():
+                    self._attempts.pop(key, None)
+                self._inflight = {}
+            for (review_type, review_id, user_id), attempts, error in dropped:
+                self.app.logger.error("Dropped helpful vote %s by user %s on %s review %s after %d attempts: %s",
+                                      'add' if batch[(review_type, review_id, user_id)] else 'removal',
+                                      user_id, review_type, review_id, attempts, error)
+            return len(batch) - len(failed)
+
+    def _write_split(self, batch):
+        """Write batch in halves, recursively, so only the votes that fail on
+        their own are left out; returns {key: error} for those."""
+        if len(batch) == 1:
+            try:
+                self._write(batch)
+                return {}
+            except Exception as e:
+                return dict.fromkeys(batch, e)
+        items = list(batch.items())
+        failed = {}
+        for half in (dict(items[:len(items) // 2]), dict(items[len(items) // 2:])):
+            try:
+                self._write(half)
+            except Exception as e:
+                if _transient(e):
+                    failed.update(dict.fromkeys(half, e))
+                else:
+                    failed.update(self._write_split(half))
+        return failed
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._stopped.is_set():
+                self.flush()
+
+    def _write(self, batch):
+        adds = [key for key, voted in batch.items() if voted]
+        removes = [key for key, voted in batch.items() if not voted]
+        params = {
+            "add_types": [k[0] for k in adds],
+            "add_reviews": [k[1] for k in adds],
+            "add_users": [k[2] for k in adds],
+            "rm_types": [k[0] for k in removes],
+            "rm_reviews": [k[1] for k in removes],
+            "rm_users": [k[2] for k in removes],
+        }
+        # Votes for reviews that no longer exist are dropped; only rows that
+        # were really inserted or deleted move the helpful counts.
+        with self.app.db.engine.begin() as conn:
+            conn.execute(text('''
+WITH add_votes AS (
+    SELECT * FROM unnest(CAST(:add_types AS VARCHAR[]), CAST(:add_reviews AS INT[]),
+                         CAST(:add_users AS INT[])) AS v(review_type, review_id, user_id)
+),
+rm_votes AS (
+    SELECT * FROM unnest(CAST(:rm_types AS VARCHAR[]), CAST(:rm_reviews AS INT[]),
+                         CAST(:rm_users AS INT[])) AS v(review_type, review_id, user_id)
+),
+added AS (
+    INSERT INTO review_votes (review_type, review_id, user_id, vote)
+    SELECT v.review_type, v.review_id, v.user_id, 1
+    FROM add_votes v
+    WHERE (v.review_type = 'product'
+           AND EXISTS (SELECT 1 FROM product_reviews pr WHERE pr.product_review_id = v.review_id))
+       OR (v.review_type = 'seller'
+           AND EXISTS (SELECT 1 FROM seller_reviews sr WHERE sr.seller_review_id = v.review_id))
+    ON CONFLICT (review_type, review_id, user_id) DO NOTHING
+    RETURNING review_type, review_id
+),
+removed AS (
+    DELETE FROM review_votes rv
+    USING rm_votes v
+    WHERE rv.review_type = v.review_type
+      AND rv.review_id = v.review_id
+      AND rv.user_id = v.user_id
+    RETURNING rv.review_type, rv.review_id
+),
+deltas AS (
+    SELECT review_type, review_id, SUM(delta) AS delta
+    FROM (
+        SELECT review_type, review_id, 1 AS delta FROM added
+        UNION ALL
+        SELECT review_type, review_id, -1 AS delta FROM removed
+    ) changes
+    GROUP BY review_type, review_id
+),
+product_counts AS (
+    UPDATE product_reviews pr
+    SET helpful_count = pr.helpful_count + d.delta
+    FROM deltas d
+    WHERE d.review_type = 'product' AND pr.product_review_id = d.review_id
+    RETURNING 1
+)
+UPDATE seller_reviews sr
+SET helpful_count = sr.helpful_count + d.delta
+FROM deltas d
+WHERE d.review_type = 'seller' AND sr.seller_review_id = d.review_id
+'''), params)
+
+
+def _transient(error):
+    """Whether a failed write may succeed if simply tried again: the
+    connection or server went away, the pool was exhausted, or Postgres
+    aborted the transaction for a deadlock or serialization failure
+    (psycopg2 reports all of these as OperationalError)."""
+    return isinstance(error, (OperationalError, PoolTimeoutError))
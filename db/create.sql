@@ -16,6 +16,9 @@ CREATE TABLE Users (
     verification_sent_at TIMESTAMPTZ
 );
 
+CREATE INDEX users_verification_token_idx
+  ON Users(verification_token) WHERE verification_token IS NOT NULL;
+
 CREATE TABLE Categories (
     id INT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
     name VARCHAR(255) UNIQUE NOT NULL
@@ -40,6 +43,8 @@ CREATE TABLE Purchases (
     time_purchased timestamp without time zone NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC')
 );
 
+CREATE INDEX purchases_uid_pid_idx ON Purchases(uid, pid);
+
 CREATE TABLE ProductSeller (
     id INT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
     seller_id INT NOT NULL REFERENCES Users(id),
@@ -47,9 +52,19 @@ CREATE TABLE ProductSeller (
     price DECIMAL(12,2) NOT NULL CHECK (price > 0),
     quantity INT NOT NULL CHECK (quantity >= 0),
     is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    -- units held by inventory_holds; quantity - reserved can still be bought
+    reserved INT NOT NULL DEFAULT 0 CHECK (reserved >= 0),
+    -- hot listing: sold only through Buy now, queued in-process (app/flash_sales.py)
+    flash_sale BOOLEAN NOT NULL DEFAULT FALSE,
     UNIQUE (seller_id, product_id)
 );
 
+-- buyable listings of a product, cheapest first (detail page, search, cart);
+-- queries that filter on quantity > reserved repeat quantity > 0 so the
+-- planner can match this predicate
+CREATE INDEX productseller_active_product_idx
+  ON ProductSeller(product_id, price) WHERE is_active AND quantity > 0;
+
 CREATE TABLE Cart (
   user_id INTEGER NOT NULL REFERENCES Users(id),
   product_id INTEGER NOT NULL REFERENCES Products(id),
@@ -62,6 +77,21 @@ CREATE TABLE Cart (
 
 CREATE INDEX cart_user_idx ON Cart(user_id);
 
+-- Stock set aside for a cart line until expires_at.  Adding to the cart
+-- creates or grows the hold and ProductSeller.reserved with it; checkout
+-- turns holds into sales and the hold sweeper (app/holds.py) releases
+-- expired ones.  A hold never exceeds its cart line's quantity.
+CREATE TABLE inventory_holds (
+    listing_id INT NOT NULL REFERENCES ProductSeller(id),
+    user_id INT NOT NULL REFERENCES Users(id),
+    quantity INT NOT NULL CHECK (quantity > 0),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (listing_id, user_id)
+);
+
+CREATE INDEX inventory_holds_user_idx ON inventory_holds(user_id);
+CREATE INDEX inventory_holds_expires_idx ON inventory_holds(expires_at);
+
 CREATE TABLE SavedItems (
   user_id INTEGER NOT NULL REFERENCES Users(id) ON DELETE CASCADE,
   product_id INTEGER NOT NULL REFERENCES Products(id),
@@ -83,7 +113,12 @@ CREATE TABLE Orders (
     shipping_city VARCHAR(255),
     shipping_state VARCHAR(64),
     shipping_zip VARCHAR(32),
-    shipping_apt VARCHAR(255)
+    shipping_apt VARCHAR(255),
+    -- summary of the order's items, maintained by Cart.checkout and the
+    -- Order fulfillment methods so order lists never aggregate OrderItems
+    item_count INT NOT NULL DEFAULT 0,
+    fulfilled_count INT NOT NULL DEFAULT 0,
+    fulfillment_status VARCHAR(32) NOT NULL DEFAULT 'Order Placed'
 );
 
 CREATE INDEX orders_user_created_idx ON Orders(user_id, created_at DESC);
@@ -104,6 +139,72 @@ CREATE TABLE OrderItems (
 
 CREATE INDEX order_items_order_idx ON OrderItems(order_id);
 CREATE INDEX order_items_seller_idx ON OrderItems(seller_id);
+CREATE INDEX order_items_product_idx ON OrderItems(product_id);
+
+-- Idempotency keys of checkouts (Idempotency-Key header or form token).
+-- A retried checkout with the same key returns order_id instead of placing
+-- another order; order_id is NULL while the first attempt is still running.
+-- Expired keys are deleted by the sweeper in app/checkout_keys.py.
+CREATE TABLE checkout_keys (
+    user_id INT NOT NULL REFERENCES Users(id),
+    idempotency_key VARCHAR(128) NOT NULL,
+    order_id INT REFERENCES Orders(id) ON DELETE CASCADE,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX checkout_keys_expires_idx ON checkout_keys(expires_at);
+
+-- Balance changes not yet folded into Users.balance.  Checkout and the
+-- account page append rows here instead of updating Users, so a popular
+-- seller's row is not written by every order; the ledger compactor
+-- (app/ledger.py) adds entries to Users.balance in batches and stamps
+-- compacted_at.  A user's balance is Users.balance plus the amounts of
+-- their uncompacted entries.
+CREATE TABLE balance_ledger (
+    entry_id BIGINT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    user_id INT NOT NULL REFERENCES Users(id),
+    amount DECIMAL(12,2) NOT NULL,
+    kind VARCHAR(16) NOT NULL CHECK (kind IN ('purchase', 'sale', 'deposit', 'withdrawal')),
+    order_id INT REFERENCES Orders(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    compacted_at TIMESTAMPTZ
+);
+
+CREATE INDEX balance_ledger_pending_idx
+  ON balance_ledger(user_id, amount) WHERE compacted_at IS NULL;
+
+-- Recurring deliveries (Frozen Treats only); also created on demand by
+-- Subscription._ensure_table for databases that predate it.
+CREATE TABLE Subscriptions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES Users(id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL REFERENCES Products(id) ON DELETE CASCADE,
+    frequency VARCHAR(20) NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- when the next delivery is ordered (Subscription.fulfill_due); pushed
+    -- back by SUBSCRIPTION_RETRY_DELAY when it cannot be, with last_error
+    next_due_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_order_id INT REFERENCES Orders(id) ON DELETE SET NULL,
+    last_error VARCHAR(64),
+    UNIQUE (user_id, product_id)
+);
+
+CREATE INDEX idx_subscriptions_user ON Subscriptions(user_id);
+CREATE INDEX idx_subscriptions_due ON Subscriptions(next_due_at) WHERE active;
+
+-- Per-seller, per-product daily rollup of fulfilled order items.
+-- Maintained incrementally by Order.mark_item_fulfilled and
+-- Order.update_item_status; `day` is the date the order was placed.
+CREATE TABLE seller_daily_sales (
+    seller_id INT NOT NULL REFERENCES Users(id),
+    product_id INT NOT NULL REFERENCES Products(id),
+    day DATE NOT NULL,
+    units INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (seller_id, day, product_id)
+);
 
 -- Social / Feedback tables --
 CREATE TABLE IF NOT EXISTS product_reviews (
@@ -112,8 +213,22 @@ CREATE TABLE IF NOT EXISTS product_reviews (
   user_id    INT NOT NULL REFERENCES Users(id),
   rating     INT CHECK (rating BETWEEN 1 AND 5),
   body       TEXT NOT NULL,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  -- number of helpful votes, maintained by social.toggle_helpful_vote
+  helpful_count INT NOT NULL DEFAULT 0,
+  -- whether the reviewer had purchased the product when the review was saved
+  verified   BOOLEAN NOT NULL DEFAULT FALSE
 );
+-- one review per user per product
+CREATE UNIQUE INDEX IF NOT EXISTS product_reviews_product_user_key
+  ON product_reviews(product_id, user_id);
+-- keyset pagination for the "helpful" and "recent" review orderings
+CREATE INDEX IF NOT EXISTS product_reviews_helpful_idx
+  ON product_reviews(product_id, helpful_count DESC, created_at DESC, product_review_id DESC);
+CREATE INDEX IF NOT EXISTS product_reviews_recent_idx
+  ON product_reviews(product_id, created_at DESC, product_review_id DESC);
+CREATE INDEX IF NOT EXISTS product_reviews_user_idx
+  ON product_reviews(user_id, created_at DESC, product_review_id DESC);
 
 CREATE TABLE IF NOT EXISTS seller_reviews (
   seller_review_id SERIAL PRIMARY KEY,
@@ -121,7 +236,29 @@ CREATE TABLE IF NOT EXISTS seller_reviews (
   user_id    INT NOT NULL REFERENCES Users(id),
   rating     INT CHECK (rating BETWEEN 1 AND 5),
   body       TEXT,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  -- number of helpful votes, maintained by social.toggle_helpful_vote
+  helpful_count INT NOT NULL DEFAULT 0,
+  -- whether the reviewer had a delivered item from the seller when the review was saved
+  verified   BOOLEAN NOT NULL DEFAULT FALSE
+);
+-- one review per user per seller
+CREATE UNIQUE INDEX IF NOT EXISTS seller_reviews_seller_user_key
+  ON seller_reviews(seller_id, user_id);
+CREATE INDEX IF NOT EXISTS seller_reviews_helpful_idx
+  ON seller_reviews(seller_id, helpful_count DESC, created_at DESC, seller_review_id DESC);
+CREATE INDEX IF NOT EXISTS seller_reviews_recent_idx
+  ON seller_reviews(seller_id, created_at DESC, seller_review_id DESC);
+CREATE INDEX IF NOT EXISTS seller_reviews_user_idx
+  ON seller_reviews(user_id, created_at DESC, seller_review_id DESC);
+
+-- Number of reviews per product / seller, maintained by the review
+-- create and delete statements in social.py.
+CREATE TABLE IF NOT EXISTS review_counts (
+  review_type  VARCHAR(10) NOT NULL CHECK (review_type IN ('product', 'seller')),
+  target_id    INT NOT NULL,
+  review_count INT NOT NULL DEFAULT 0 CHECK (review_count >= 0),
+  PRIMARY KEY (review_type, target_id)
 );
 
 -- Votes that mark a product/seller review as helpful.
@@ -137,3 +274,24 @@ CREATE TABLE IF NOT EXISTS review_votes (
 );
 CREATE INDEX IF NOT EXISTS review_votes_lookup_idx
   ON review_votes(review_type, review_id);
+
+-- Background jobs (app/jobs.py), run by `python worker.py`.  A queued job
+-- is runnable once run_at has passed.  A worker claims it by marking it
+-- 'running' with run_at pushed out by JOB_LEASE seconds, so a job whose
+-- worker died runs again once the lease is up, as long as it has attempts
+-- left.  Finished jobs are deleted; jobs out of attempts stay behind with
+-- status 'dead' (the dead letters).
+CREATE TABLE jobs (
+    id BIGINT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    kind VARCHAR(64) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(16) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'dead')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT
+);
+
+CREATE INDEX jobs_pending_idx ON jobs(run_at) WHERE status IN ('queued', 'running');
+CREATE INDEX jobs_dead_idx ON jobs(kind) WHERE status = 'dead';
@@ -0,0 +1,176 @@
+"""Report sequential scans in the plans of the app's hot-path queries.
+
+Runs the model calls behind the busiest pages against the database
+configured in .flaskenv, in one transaction that is rolled back so calls
+that write leave nothing behind, records every SQL statement they issue,
+then asks PostgreSQL to EXPLAIN each distinct SELECT, UPDATE and DELETE
+with the same parameters (again in a transaction that is rolled back).  Any Seq Scan on a table with at least --min-rows rows is
+reported.  Load a large dataset first (e.g. `db/setup.sh generated`) so the
+planner's choices reflect production-sized tables.
+
+    python db/explain_audit.py [--min-rows 10000]
+
+Exits with status 1 when a sequential scan is found, so it can gate CI.
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+load_dotenv(ROOT / '.flaskenv')
+
+from app import create_app  # noqa: E402
+from app.models.order import Order  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.product_review import ProductReview, SellerReview, ReviewActivity  # noqa: E402
+from app.models.product_seller import ProductSeller  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+
+# The busiest ids are the worst cases: most reviews, listings and orders.
+SAMPLE_IDS = {
+    "product_id": "SELECT product_id FROM product_reviews GROUP BY product_id ORDER BY COUNT(*) DESC LIMIT 1",
+    "seller_id": "SELECT seller_id FROM ProductSeller GROUP BY seller_id ORDER BY COUNT(*) DESC LIMIT 1",
+    "user_id": "SELECT user_id FROM Orders GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1",
+    "reviewer_id": "SELECT user_id FROM product_reviews GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1",
+}
+
+
+def hot_paths(ids):
+    """(label, callable) pairs covering the queries behind the busiest pages.
+    They run in a transaction that is rolled back, so they may write."""
+    pid, sid, uid, rid = ids["product_id"], ids["seller_id"], ids["user_id"], ids["reviewer_id"]
+    return [
+        ("product detail", lambda: Product.load_detail(pid, uid)),
+        ("product reviews", lambda: ProductReview.get_for_product(pid, uid, per_page=8)),
+        ("product reviews (recent)", lambda: ProductReview.get_for_product(pid, uid, per_page=8, sort='recent')),
+        ("similar products", lambda: Product.similar(Product.get(pid), limit=4)),
+        ("product listings", lambda: ProductSeller.get_active_by_product(pid)),
+        ("seller reviews", lambda: SellerReview.get_for_seller(sid, uid, per_page=10)),
+        ("seller review summary", lambda: SellerReview.summary(sid)),
+        ("seller inventory", lambda: ProductSeller.get_all_detailed_by_seller(sid)),
+        ("seller analytics", lambda: ProductSeller.analytics_for_seller(sid)),
+        ("seller order items", lambda: Order.list_items_for_seller(sid)),
+        ("my reviews", lambda: ReviewActivity.get_for_user(rid, include_feedback=True)),
+        ("order history", lambda: Order.list_by_user(uid, page=1, per_page=20)),
+        ("order count", lambda: Order.count_by_user(uid)),
+        ("purchase history", lambda: Order.get_user_purchases(uid)),
+        ("delivered check", lambda: Order.user_has_delivered_order_with_product(uid, pid)),
+        ("email verification", lambda: User.mark_email_verified(User.issue_verification_token(uid))),
+    ]
+
+
+def fingerprint(statement):
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+class RolledBack(Exception):
+    """Raised to roll back the transaction the audited calls ran in."""
+
+
+def capture(app, calls):
+    """Run each call and return {fingerprint: (label, statement, params)}.
+
+    The calls run inside one request-scoped transaction (execute() and
+    begin() calls made during a request join it), each under its own
+    savepoint so a failing call does not abort the rest, and the whole
+    transaction is rolled back at the end."""
+    seen = {}
+    current = {"label": None}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        key = fingerprint(statement)
+        if key.upper().startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+            return
+        if current["label"] and key not in seen:
+            seen[key] = (current["label"], statement, parameters)
+
+    app.db.request_scope = True
+    event.listen(app.db.engine, 'before_cursor_execute', record)
+    try:
+        with app.test_request_context(method='POST'):
+            with app.db.begin() as conn:
+                for label, call in calls:
+                    current["label"] = label
+                    savepoint = conn.begin_nested()
+                    try:
+                        call()
+                    except Exception as exc:
+                        savepoint.rollback()
+                        print(f"! {label}: {exc}", file=sys.stderr)
+                    else:
+                        savepoint.commit()
+                current["label"] = None
+                raise RolledBack
+    except RolledBack:
+        pass
+    finally:
+        event.remove(app.db.engine, 'before_cursor_execute', record)
+    return seen
+
+
+def seq_scans(plan):
+    """Yield (relation, estimated rows) for every Seq Scan node in a plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name"), plan.get("Plan Rows")
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--min-rows', type=int, default=10000,
+                        help='ignore sequential scans of tables smaller than this (default 10000)')
+    parser.add_argument('--verbose', action='store_true', help='print every statement checked')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        ids = {name: (app.db.execute(sql) or [[None]])[0][0] for name, sql in SAMPLE_IDS.items()}
+        sizes = dict(app.db.execute('''
+SELECT c.relname, c.reltuples::BIGINT
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname = 'public'
+'''))
+    print("sample ids: " + ", ".join(f"{k}={v}" for k, v in ids.items()))
+
+    statements = capture(app, hot_paths(ids))
+    problems = 0
+    raw = app.db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for key, (label, statement, params) in statements.items():
+            if not key.upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+                continue
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            root = plan[0]["Plan"]
+            scans = [(rel, rows) for rel, rows in seq_scans(root)
+                     if sizes.get((rel or '').lower(), 0) >= args.min_rows]
+            if scans or args.verbose:
+                status = "SEQ SCAN" if scans else "ok"
+                print(f"\n[{status}] {label} (cost {root['Total Cost']:.0f})")
+                print("  " + key[:160] + ("..." if len(key) > 160 else ""))
+                for rel, rows in scans:
+                    print(f"  - Seq Scan on {rel} ({sizes.get(rel.lower(), 0)} rows in table, ~{rows} expected)")
+            problems += bool(scans)
+        raw.rollback()
+    finally:
+        raw.close()
+
+    print(f"\n{len(statements)} statements checked, {problems} with sequential scans on tables "
+          f">= {args.min_rows} rows.")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,122 +1,594 @@
-from werkzeug.security import generate_password_hash
+"""Generate a consistent synthetic dataset for every table db/load.sql loads.
+
+    python gen.py                              # ~10k order items, CSVs next to this script
+    python gen.py --order-items 10000000 --workers 8 --out /tmp/big
+    python gen.py --order-items 1000000 --copy --create-schema
+
+Every other table is sized from --order-items (override with --users,
+--products or --sellers).  Product popularity follows a Zipf distribution,
+order counts per user are heavy-tailed, and everything references real rows:
+order totals match their items, purchases and reviews come from delivered
+items, votes never come from the review's author, and unique keys hold.
+
+Users are generated in chunks by a multiprocessing pool with NumPy
+sampling.  Each chunk has its own seeded random streams, so the output
+depends only on --seed and the scale, not on --workers.  A first pass counts
+the rows of every chunk so that ids are contiguous; the second pass formats
+CSV.  With --copy the chunks are streamed straight into COPY ... FROM STDIN
+on the database from .flaskenv and the post-load statements of load.sql
+(sequence resets and backfills) run afterwards; otherwise they are written
+to CSV files that `db/setup.sh <dir>` can load.
+
+All users share one password (--password), hashed once.
+"""
+import argparse
 import csv
+import io
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
 from faker import Faker
+from werkzeug.security import generate_password_hash
+
+HERE = Path(__file__).resolve().parent
+DB_DIR = HERE.parent
+
+# (table, CSV file, columns) in the order db/load.sql loads them
+TABLES = [
+    ('Users', 'Users.csv',
+     'id, email, password, firstname, lastname, address, balance, is_seller, created_at'),
+    ('Categories', 'Categories.csv', 'id, name'),
+    ('Products', 'Products.csv',
+     'id, category_id, category_name, name, description, price, available, image_link'),
+    ('Purchases', 'Purchases.csv', 'id, uid, pid, time_purchased'),
+    ('ProductSeller', 'ProductSeller.csv', 'id, seller_id, product_id, price, quantity, is_active'),
+    ('Cart', 'Cart.csv', 'user_id, product_id, listing_id, seller_id, unit_price, quantity'),
+    ('SavedItems', 'SavedItems.csv', 'user_id, product_id, listing_id, seller_id, unit_price, quantity, saved_at'),
+    ('Orders', 'Orders.csv',
+     'id, user_id, created_at, status, total_amount, shipping_street, shipping_city, shipping_state, '
+     'shipping_zip, shipping_apt'),
+    ('OrderItems', 'OrderItems.csv',
+     'id, order_id, listing_id, seller_id, product_id, unit_price, quantity, subtotal, fulfilled, '
+     'fulfilled_at, fulfillment_status'),
+    ('product_reviews', 'ProductReviews.csv', 'product_review_id, product_id, user_id, rating, body, created_at'),
+    ('seller_reviews', 'SellerReviews.csv', 'seller_review_id, seller_id, user_id, rating, body, created_at'),
+    ('review_votes', 'ReviewVotes.csv', 'vote_id, review_type, review_id, user_id, vote, created_at'),
+    ('Subscriptions', 'Subscriptions.csv', 'id, user_id, product_id, frequency, active, created_at'),
+]
+# tables whose ids are assigned from per-chunk row counts
+COUNTED = ('Orders', 'OrderItems', 'Purchases', 'product_reviews', 'seller_reviews',
+           'review_votes', 'Subscriptions')
+# tables generated per product range rather than per user range
+PRODUCT_TABLES = ('Products', 'ProductSeller')
+
+CATEGORIES = ['Frozen Treats', 'Beverages & Bar', 'Luxury Collectibles', 'Fine Art',
+              'Home Fragrance & Bath', 'Outdoor & Travel', 'Kitchen & Dining', 'Home Decor & Living',
+              'Tools & DIY', 'Tech & Gadgets', 'Fitness & Wellness', 'Stationery & Crafts']
+STATUSES = np.array(['Order Placed', 'Shipped', 'Delivered'], dtype=object)
+ORDER_STATUSES = np.array(['pending', 'shipped', 'fulfilled'], dtype=object)
+FREQUENCIES = np.array(['weekly', 'monthly', 'quarterly'], dtype=object)
+
+AVG_ITEMS_PER_ORDER = 2.2
+MAX_LISTINGS_PER_PRODUCT = 5
+ZIPF_EXPONENT = 1.07
+DAY = np.timedelta64(86400, 's')
+
+# independent random stream per part of a chunk, so each table can be
+# regenerated on its own and still agree with the others
+STREAMS = {'users': 0, 'orders': 1, 'reviews': 2, 'votes': 3, 'cart': 4, 'saved': 5,
+           'subscriptions': 6, 'products': 7}
+
+
+class Scale:
+    def __init__(self, order_items, users=None, products=None, sellers=None, chunk_users=5000):
+        self.order_items = order_items
+        self.users = users or max(200, order_items // 40)
+        self.products = products or max(500, order_items // 25)
+        self.sellers = sellers or max(MAX_LISTINGS_PER_PRODUCT * 2, self.users // 20)
+        if not MAX_LISTINGS_PER_PRODUCT <= self.sellers <= self.users:
+            raise ValueError(f"--sellers must be between {MAX_LISTINGS_PER_PRODUCT} and the number of users")
+        self.orders_per_user = order_items / AVG_ITEMS_PER_ORDER / self.users
+        self.chunk_users = chunk_users
+        self.chunk_products = chunk_users * 4
+
+    def user_chunks(self):
+        return [(lo, min(lo + self.chunk_users, self.users + 1))
+                for lo in range(1, self.users + 1, self.chunk_users)]
+
+    def product_chunks(self):
+        return [(lo, min(lo + self.chunk_products, self.products + 1))
+                for lo in range(1, self.products + 1, self.chunk_products)]
+
+
+def build_world(scale, seed, now, password):
+    """Everything chunks share: text pools, products, listings and popularity."""
+    fake = Faker()
+    Faker.seed(seed)
+    rng = np.random.default_rng([seed, STREAMS['products']])
+    world = {'scale': scale, 'seed': seed, 'now': now,
+             'password_hash': generate_password_hash(password)}
+
+    world['first_names'] = np.array(sorted({fake.first_name() for _ in range(2000)}), dtype=object)
+    world['last_names'] = np.array(sorted({fake.last_name() for _ in range(2000)}), dtype=object)
+    world['streets'] = np.array([fake.street_address() for _ in range(3000)], dtype=object)
+    world['places'] = np.array([(fake.city(), fake.state_abbr(), fake.zipcode()) for _ in range(500)],
+                               dtype=object)
+    world['sentences'] = np.array([fake.sentence(nb_words=12) for _ in range(5000)], dtype=object)
+    words = sorted({fake.word().capitalize() for _ in range(3000)})
+    world['words'] = np.array(words, dtype=object)
+
+    P = scale.products
+    world['product_category'] = rng.integers(1, len(CATEGORIES) + 1, P)
+    world['product_price'] = np.maximum(100, rng.lognormal(np.log(3500), 1.0, P)).astype(np.int64)
+    world['product_available'] = rng.random(P) < 0.9
+    ranks = rng.permutation(P)
+    weights = np.empty(P)
+    weights[ranks] = 1.0 / np.arange(1, P + 1) ** ZIPF_EXPONENT
+    world['popularity_cdf'] = np.cumsum(weights) / weights.sum()
+
+    # listings: 1-5 distinct sellers per product, stored product by product
+    counts = 1 + rng.binomial(MAX_LISTINGS_PER_PRODUCT - 1, 0.35, P)
+    product_of = np.repeat(np.arange(P), counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    slot = np.arange(len(product_of)) - np.repeat(starts, counts)
+    stride = scale.sellers // MAX_LISTINGS_PER_PRODUCT
+    base = rng.integers(0, scale.sellers, P)
+    world['listing_product'] = product_of + 1
+    world['listing_seller'] = (base[product_of] + slot * stride) % scale.sellers + 1
+    world['listing_price'] = (world['product_price'][product_of]
+                              * rng.uniform(0.85, 1.25, len(product_of))).astype(np.int64)
+    world['listing_quantity'] = rng.integers(0, 200, len(product_of))
+    world['listing_active'] = rng.random(len(product_of)) < 0.92
+    world['listing_start'] = starts
+    world['listing_count'] = counts
+    world['frozen_products'] = np.flatnonzero(world['product_category'] == 1) + 1
+    return world
+
+
+# ---------------------------------------------------------------------------
+# worker side
+# ---------------------------------------------------------------------------
+
+WORLD = None
+
+
+def init_worker(world):
+    global WORLD
+    WORLD = world
+
+
+def stream(chunk, name):
+    return np.random.default_rng([WORLD['seed'], chunk, STREAMS[name]])
+
+
+def sample_listings(rng, n):
+    """Pick n listings, choosing the product by Zipf popularity."""
+    product = np.minimum(np.searchsorted(WORLD['popularity_cdf'], rng.random(n), side='right'),
+                         len(WORLD['popularity_cdf']) - 1)
+    offset = (rng.random(n) * WORLD['listing_count'][product]).astype(np.int64)
+    return WORLD['listing_start'][product] + offset
+
+
+def recent_times(rng, n, days, skew=1.5):
+    """n timestamps within the last `days` days, denser towards now."""
+    seconds = (rng.random(n) ** skew * days * 86400).astype(np.int64)
+    return WORLD['now'] - seconds.astype('timedelta64[s]')
+
+
+def cap_now(times):
+    return np.minimum(times, WORLD['now'])
+
+
+class Chunk:
+    """Rows owned by users [lo, hi).  Parts are computed lazily and cached."""
+    def __init__(self, index, lo, hi):
+        self.index, self.lo, self.hi = index, lo, hi
+        self.user_ids = np.arange(lo, hi)
+        self._cache = {}
+
+    def part(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def users(self):
+        def build():
+            rng = stream(self.index, 'users')
+            n = len(self.user_ids)
+            return {
+                'first': rng.integers(0, len(WORLD['first_names']), n),
+                'last': rng.integers(0, len(WORLD['last_names']), n),
+                'street': rng.integers(0, len(WORLD['streets']), n),
+                'place': rng.integers(0, len(WORLD['places']), n),
+                'balance': rng.integers(0, 500000, n),
+                'created_at': recent_times(rng, n, 365, skew=1) - 730 * DAY,
+            }
+        return self.part('users', build)
+
+    @property
+    def orders(self):
+        def build():
+            rng = stream(self.index, 'orders')
+            scale = WORLD['scale']
+            # heavy-tailed orders per user: Poisson with a gamma-distributed mean
+            lam = rng.gamma(0.7, scale.orders_per_user / 0.7, len(self.user_ids))
+            per_user = rng.poisson(lam)
+            owner = np.repeat(np.arange(len(self.user_ids)), per_user)
+            n_orders = len(owner)
+            created = recent_times(rng, n_orders, 730)
+            items_per_order = 1 + rng.poisson(AVG_ITEMS_PER_ORDER - 1, n_orders)
+            item_order = np.repeat(np.arange(n_orders), items_per_order)
+            n_items = len(item_order)
+            listing = sample_listings(rng, n_items)
+            quantity = 1 + rng.binomial(2, 0.25, n_items)
+            price = WORLD['listing_price'][listing]
+            subtotal = price * quantity
+
+            age_days = (WORLD['now'] - created[item_order]) / DAY
+            r = rng.random(n_items)
+            status = np.where(age_days > 10, np.where(r < 0.95, 2, 1),
+                              np.where(age_days > 3, np.where(r < 0.5, 2, np.where(r < 0.85, 1, 0)),
+                                       np.where(r < 0.3, 1, 0)))
+            fulfilled_at = cap_now(created[item_order]
+                                   + (rng.uniform(1, 7, n_items) * 86400).astype('timedelta64[s]'))
+            starts = np.concatenate(([0], np.cumsum(items_per_order)[:-1])) if n_orders else np.array([], int)
+            return {
+                'owner': owner, 'created': created, 'item_order': item_order, 'listing': listing,
+                'quantity': quantity, 'price': price, 'subtotal': subtotal, 'status': status,
+                'fulfilled_at': fulfilled_at,
+                'total': np.add.reduceat(subtotal, starts) if n_orders else np.array([], int),
+                'order_status': np.minimum.reduceat(status, starts) if n_orders else np.array([], int),
+                'delivered': np.flatnonzero(status == 2),
+            }
+        return self.part('orders', build)
+
+    @property
+    def reviews(self):
+        def build():
+            rng = stream(self.index, 'reviews')
+            o = self.orders
+            d = o['delivered']
+            user = self.user_ids[o['owner'][o['item_order'][d]]]
+            listing = o['listing'][d]
+            when = o['fulfilled_at'][d]
+            ratings = np.arange(1, 6)
+            rating_p = [0.05, 0.07, 0.13, 0.3, 0.45]
+
+            def pick(keep, target):
+                key = user[keep].astype(np.int64) * (1 << 32) + target[keep]
+                _, first = np.unique(key, return_index=True)
+                rows = np.flatnonzero(keep)[np.sort(first)]
+                n = len(rows)
+                return {
+                    'user': user[rows], 'target': target[rows],
+                    'rating': rng.choice(ratings, n, p=rating_p),
+                    'body': rng.integers(0, len(WORLD['sentences']), n),
+                    'created': cap_now(when[rows] + (rng.random(n) * 20 * 86400).astype('timedelta64[s]')),
+                }
+
+            return {
+                'product': pick(rng.random(len(d)) < 0.25, WORLD['listing_product'][listing]),
+                'seller': pick(rng.random(len(d)) < 0.10, WORLD['listing_seller'][listing]),
+            }
+        return self.part('reviews', build)
+
+    @property
+    def votes(self):
+        def build():
+            rng = stream(self.index, 'votes')
+            out = {}
+            for kind in ('product', 'seller'):
+                rv = self.reviews[kind]
+                per_review = rng.geometric(0.45, len(rv['user'])) - 1
+                review = np.repeat(np.arange(len(rv['user'])), per_review)
+                voter = rng.integers(1, WORLD['scale'].users + 1, len(review))
+                keep = voter != rv['user'][review]
+                review, voter = review[keep], voter[keep]
+                _, first = np.unique(review.astype(np.int64) * (1 << 32) + voter, return_index=True)
+                first = np.sort(first)
+                review, voter = review[first], voter[first]
+                created = cap_now(rv['created'][review]
+                                  + (rng.random(len(review)) * 30 * 86400).astype('timedelta64[s]'))
+                out[kind] = {'review': review, 'voter': voter, 'created': created}
+            return out
+        return self.part('votes', build)
+
+    def _basket(self, name, share, max_items):
+        rng = stream(self.index, name)
+        per_user = np.where(rng.random(len(self.user_ids)) < share,
+                            rng.integers(1, max_items + 1, len(self.user_ids)), 0)
+        owner = np.repeat(np.arange(len(self.user_ids)), per_user)
+        listing = sample_listings(rng, len(owner))
+        _, first = np.unique(owner.astype(np.int64) * (1 << 32) + listing, return_index=True)
+        first = np.sort(first)
+        owner, listing = owner[first], listing[first]
+        return {'user': self.user_ids[owner], 'listing': listing,
+                'quantity': rng.integers(1, 4, len(owner)),
+                'created': recent_times(rng, len(owner), 60)}
+
+    @property
+    def cart(self):
+        return self.part('cart', lambda: self._basket('cart', 0.3, 4))
+
+    @property
+    def saved(self):
+        return self.part('saved', lambda: self._basket('saved', 0.15, 3))
+
+    @property
+    def subscriptions(self):
+        def build():
+            rng = stream(self.index, 'subscriptions')
+            frozen = WORLD['frozen_products']
+            if not len(frozen):
+                return {'user': np.array([], int), 'product': np.array([], int)}
+            per_user = np.where(rng.random(len(self.user_ids)) < 0.05,
+                                rng.integers(1, 3, len(self.user_ids)), 0)
+            user = np.repeat(self.user_ids, per_user)
+            product = frozen[rng.integers(0, len(frozen), len(user))]
+            _, first = np.unique(user.astype(np.int64) * (1 << 32) + product, return_index=True)
+            first = np.sort(first)
+            n = len(first)
+            return {'user': user[first], 'product': product[first],
+                    'frequency': FREQUENCIES[rng.integers(0, 3, n)],
+                    'active': rng.random(n) < 0.85,
+                    'created': recent_times(rng, n, 365)}
+        return self.part('subscriptions', build)
+
+    def counts(self):
+        o = self.orders
+        return {
+            'Orders': len(o['owner']),
+            'OrderItems': len(o['item_order']),
+            'Purchases': len(o['delivered']),
+            'product_reviews': len(self.reviews['product']['user']),
+            'seller_reviews': len(self.reviews['seller']['user']),
+            'review_votes': len(self.votes['product']['review']) + len(self.votes['seller']['review']),
+            'Subscriptions': len(self.subscriptions['user']),
+        }
+
+
+def money(cents):
+    return [f'{c // 100}.{c % 100:02d}' for c in cents.tolist()]
+
+
+def stamps(times):
+    return np.datetime_as_string(times.astype('datetime64[s]'), unit='s').tolist()
+
+
+def bools(values):
+    return np.where(values, 'TRUE', 'FALSE').tolist()
+
+
+def to_csv(columns):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerows(zip(*columns))
+    return buf.getvalue().encode()
+
+
+def user_rows(table, chunk, offsets):
+    """CSV bytes for one table's rows in a user chunk."""
+    now = WORLD['now']
+    if table == 'Users':
+        u = chunk.users
+        ids = chunk.user_ids
+        places = WORLD['places'][u['place']]
+        address = [f'{s}, {p[0]}, {p[1]}' for s, p in zip(WORLD['streets'][u['street']].tolist(), places.tolist())]
+        first = WORLD['first_names'][u['first']]
+        return to_csv([ids.tolist(), [f'user{i}@example.com' for i in ids.tolist()],
+                       [WORLD['password_hash']] * len(ids), first.tolist(),
+                       WORLD['last_names'][u['last']].tolist(), address, money(u['balance']),
+                       bools(ids <= WORLD['scale'].sellers), stamps(u['created_at'])])
+
+    if table in ('Cart', 'SavedItems'):
+        b = chunk.cart if table == 'Cart' else chunk.saved
+        cols = [b['user'].tolist(), WORLD['listing_product'][b['listing']].tolist(), (b['listing'] + 1).tolist(),
+                WORLD['listing_seller'][b['listing']].tolist(), money(WORLD['listing_price'][b['listing']]),
+                b['quantity'].tolist()]
+        if table == 'SavedItems':
+            cols.append(stamps(b['created']))
+        return to_csv(cols)
+
+    o = chunk.orders
+    if table == 'Orders':
+        u = chunk.users
+        n = len(o['owner'])
+        places = WORLD['places'][u['place'][o['owner']]].tolist()
+        return to_csv([(offsets['Orders'] + np.arange(1, n + 1)).tolist(), chunk.user_ids[o['owner']].tolist(),
+                       stamps(o['created']), ORDER_STATUSES[o['order_status']].tolist(), money(o['total']),
+                       WORLD['streets'][u['street'][o['owner']]].tolist(), [p[0] for p in places],
+                       [p[1] for p in places], [p[2] for p in places], [None] * n])
+    if table == 'OrderItems':
+        n = len(o['item_order'])
+        delivered = o['status'] == 2
+        fulfilled_at = [t if ok else None for t, ok in zip(stamps(o['fulfilled_at']), delivered.tolist())]
+        return to_csv([(offsets['OrderItems'] + np.arange(1, n + 1)).tolist(),
+                       (offsets['Orders'] + o['item_order'] + 1).tolist(), (o['listing'] + 1).tolist(),
+                       WORLD['listing_seller'][o['listing']].tolist(),
+                       WORLD['listing_product'][o['listing']].tolist(), money(o['price']), o['quantity'].tolist(),
+                       money(o['subtotal']), bools(delivered), fulfilled_at, STATUSES[o['status']].tolist()])
+    if table == 'Purchases':
+        d = o['delivered']
+        return to_csv([(offsets['Purchases'] + np.arange(1, len(d) + 1)).tolist(),
+                       chunk.user_ids[o['owner'][o['item_order'][d]]].tolist(),
+                       WORLD['listing_product'][o['listing'][d]].tolist(), stamps(o['fulfilled_at'][d])])
+    if table in ('product_reviews', 'seller_reviews'):
+        rv = chunk.reviews['product' if table == 'product_reviews' else 'seller']
+        n = len(rv['user'])
+        return to_csv([(offsets[table] + np.arange(1, n + 1)).tolist(), rv['target'].tolist(), rv['user'].tolist(),
+                       rv['rating'].tolist(), WORLD['sentences'][rv['body']].tolist(), stamps(rv['created'])])
+    if table == 'review_votes':
+        cols = [[], [], [], [], [], []]
+        vote_id = offsets['review_votes']
+        for kind, table_name in (('product', 'product_reviews'), ('seller', 'seller_reviews')):
+            v = chunk.votes[kind]
+            n = len(v['review'])
+            cols[0] += (vote_id + np.arange(1, n + 1)).tolist()
+            cols[1] += [kind] * n
+            cols[2] += (offsets[table_name] + v['review'] + 1).tolist()
+            cols[3] += v['voter'].tolist()
+            cols[4] += [1] * n
+            cols[5] += stamps(v['created'])
+            vote_id += n
+        return to_csv(cols)
+    if table == 'Subscriptions':
+        s = chunk.subscriptions
+        n = len(s['user'])
+        return to_csv([(offsets['Subscriptions'] + np.arange(1, n + 1)).tolist(), s['user'].tolist(),
+                       s['product'].tolist(), s['frequency'].tolist(), bools(s['active']), stamps(s['created'])])
+    raise ValueError(f'unknown table {table}')
+
+
+def product_rows(table, lo, hi):
+    """CSV bytes for Products or ProductSeller rows of products [lo, hi)."""
+    idx = np.arange(lo - 1, hi - 1)
+    if table == 'Products':
+        rng = np.random.default_rng([WORLD['seed'], lo, STREAMS['products']])
+        category = WORLD['product_category'][idx]
+        words = WORLD['words']
+        w = rng.integers(0, len(words), (len(idx), 2))
+        names = [f'{a} {b} {pid}' for a, b, pid in zip(words[w[:, 0]].tolist(), words[w[:, 1]].tolist(),
+                                                       (idx + 1).tolist())]
+        return to_csv([(idx + 1).tolist(), category.tolist(), [CATEGORIES[c - 1] for c in category.tolist()], names,
+                       WORLD['sentences'][rng.integers(0, len(WORLD['sentences']), len(idx))].tolist(),
+                       money(WORLD['product_price'][idx]), bools(WORLD['product_available'][idx]),
+                       [f'https://picsum.photos/seed/{pid}/200/200' for pid in (idx + 1).tolist()]])
+    start = WORLD['listing_start'][idx[0]]
+    end = WORLD['listing_start'][idx[-1]] + WORLD['listing_count'][idx[-1]]
+    rows = np.arange(start, end)
+    return to_csv([(rows + 1).tolist(), WORLD['listing_seller'][rows].tolist(),
+                   WORLD['listing_product'][rows].tolist(), money(WORLD['listing_price'][rows]),
+                   WORLD['listing_quantity'][rows].tolist(), bools(WORLD['listing_active'][rows])])
+
+
+def count_job(args):
+    index, lo, hi = args
+    return Chunk(index, lo, hi).counts()
+
+
+def table_job(args):
+    table, index, lo, hi, offsets = args
+    if table in PRODUCT_TABLES:
+        return product_rows(table, lo, hi)
+    return user_rows(table, Chunk(index, lo, hi), offsets)
+
+
+# ---------------------------------------------------------------------------
+# main process
+# ---------------------------------------------------------------------------
+
+class ChunkReader(io.RawIOBase):
+    """File-like view over an iterator of byte chunks, for COPY FROM STDIN."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def table_chunks(pool, table, scale, offsets):
+    if table == 'Categories':
+        return [to_csv([list(range(1, len(CATEGORIES) + 1)), CATEGORIES])]
+    if table in PRODUCT_TABLES:
+        jobs = [(table, i, lo, hi, None) for i, (lo, hi) in enumerate(scale.product_chunks())]
+    else:
+        jobs = [(table, i, lo, hi, offsets[i]) for i, (lo, hi) in enumerate(scale.user_chunks())]
+    return pool.imap(table_job, jobs)
+
+
+def connect():
+    import psycopg2
+    from dotenv import load_dotenv
+    load_dotenv(DB_DIR.parent / '.flaskenv')
+    return psycopg2.connect(host=os.environ.get('DB_HOST'), port=os.environ.get('DB_PORT') or 5432,
+                            dbname=os.environ.get('DB_NAME'), user=os.environ.get('DB_USER'),
+                            password=os.environ.get('DB_PASSWORD'))
+
+
+def post_load_statements():
+    """The statements of load.sql other than its \\COPY commands."""
+    lines = [line for line in (DB_DIR / 'load.sql').read_text().splitlines()
+             if not line.startswith('\\COPY') and not line.lstrip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--order-items', type=int, default=10000, help='approximate number of order items')
+    parser.add_argument('--users', type=int, help='number of users (default: order items / 40)')
+    parser.add_argument('--products', type=int, help='number of products (default: order items / 25)')
+    parser.add_argument('--sellers', type=int, help='number of sellers, the lowest user ids (default: users / 20)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='generator processes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--password', default='password', help='password shared by every generated user')
+    parser.add_argument('--out', type=Path, default=HERE, help='directory for the CSV files')
+    parser.add_argument('--copy', action='store_true',
+                        help='stream into the database from .flaskenv instead of writing CSV files')
+    parser.add_argument('--create-schema', action='store_true', help='with --copy, run create.sql first')
+    args = parser.parse_args()
+
+    scale = Scale(args.order_items, users=args.users, products=args.products, sellers=args.sellers)
+    now = np.datetime64('now', 's').astype('datetime64[D]').astype('datetime64[s]')
+    started = time.perf_counter()
+    print(f'{scale.users} users ({scale.sellers} sellers), {scale.products} products, '
+          f'~{scale.order_items} order items; {args.workers} workers', flush=True)
+    world = build_world(scale, args.seed, now, args.password)
+
+    conn = connect() if args.copy else None
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(world,)) as pool:
+        chunks = [(i, lo, hi) for i, (lo, hi) in enumerate(scale.user_chunks())]
+        counts = pool.map(count_job, chunks)
+        offsets, running = [], dict.fromkeys(COUNTED, 0)
+        for c in counts:
+            offsets.append(dict(running))
+            for table in COUNTED:
+                running[table] += c[table]
+
+        if conn and args.create_schema:
+            with conn, conn.cursor() as cur:
+                cur.execute((DB_DIR / 'create.sql').read_text())
+        if not conn:
+            args.out.mkdir(parents=True, exist_ok=True)
+
+        for table, filename, columns in TABLES:
+            table_started = time.perf_counter()
+            data = table_chunks(pool, table, scale, offsets)
+            if conn:
+                with conn, conn.cursor() as cur:
+                    cur.copy_expert(f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)', ChunkReader(data))
+            else:
+                with open(args.out / filename, 'wb') as f:
+                    for chunk in data:
+                        f.write(chunk)
+            rows = running.get(table)
+            print(f'{table:16} {"" if rows is None else rows:>10}  {time.perf_counter() - table_started:6.1f}s',
+                  flush=True)
+
+    if conn:
+        with conn, conn.cursor() as cur:
+            for stmt in post_load_statements():
+                cur.execute(stmt)
+        conn.close()
+        print('post-load statements from load.sql applied')
+    print(f'done in {time.perf_counter() - started:.1f}s')
 
-num_users = 100
-num_products = 2000
-num_purchases = 2500
-
-Faker.seed(0)
-fake = Faker()
-
-
-def get_csv_writer(f):
-    return csv.writer(f, dialect='unix')
-
-
-def gen_users(num_users):
-    with open('Users.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Users...', end=' ', flush=True)
-        for uid in range(num_users):
-            if uid % 10 == 0:
-                print(f'{uid}', end=' ', flush=True)
-            profile = fake.profile()
-            email = profile['mail']
-            plain_password = f'pass{uid}'
-            password = generate_password_hash(plain_password)
-            name_components = profile['name'].split(' ')
-            firstname = name_components[0]
-            lastname = name_components[-1]
-            writer.writerow([uid, email, password, firstname, lastname])
-        print(f'{num_users} generated')
-    return
-
-
-def gen_products(num_products):
-    available_pids = []
-    output_file = 'Products.csv'
-    
-    with open(output_file, 'w', newline='') as f:
-        writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
-        print('Products...', end=' ', flush=True)
-
-        for pid in range(num_products):
-            if pid % 100 == 0:
-                print(f'{pid}', end=' ', flush=True)
-            
-            name = fake.sentence(nb_words=4).rstrip('.')
-            price = round(fake.random_int(min=1, max=500) + fake.random.random(), 2)
-            available_bool = fake.random_element(elements=(True, False))
-            available_str = 'TRUE' if available_bool else 'FALSE'
-            image_link = f'https://picsum.photos/seed/{pid}/200/200'                          
-            
-            if available_bool:
-                available_pids.append(pid)
-            
-                                                                         
-            writer.writerow([pid, name, price, available_str, image_link])
-        
-        print(f'{num_products} generated; {len(available_pids)} available')
-
-    return available_pids
-
-
-
-def gen_purchases(num_purchases, available_pids):
-    with open('Purchases.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Purchases...', end=' ', flush=True)
-        for id in range(num_purchases):
-            if id % 100 == 0:
-                print(f'{id}', end=' ', flush=True)
-            uid = fake.random_int(min=0, max=num_users-1)
-            pid = fake.random_element(elements=available_pids)
-            time_purchased = fake.date_time()
-            writer.writerow([id, uid, pid, time_purchased])
-        print(f'{num_purchases} generated')
-    return
-
-def gen_cart(num_entries, available_pids, num_users):
-    with open('Cart.csv', 'w') as f:
-        writer = get_csv_writer(f)
-        print('Cart...', end=' ', flush=True)
-        for cid in range(num_entries):
-            if cid % 100 == 0:
-                print(f'{cid}', end=' ', flush=True)
-            uid = fake.random_int(min=0, max=num_users - 1)
-            pid = fake.random_element(elements=available_pids)
-            quantity = fake.random_int(min=1, max=5)
-            date_added = fake.date_time_this_year()
-            writer.writerow([cid, uid, pid, quantity, date_added])
-        print(f'{num_entries} generated')
-    return
-
-
-                     
-                                            
-                                             
-
-available_pids = list(range(num_products))                                     
-gen_cart(num_entries=1200, available_pids=available_pids, num_users=num_users)
-
-def gen_product_sellers(num_sellers, available_pids, max_listings_per_seller):
-    with open('ProductSeller.csv', 'w', newline='') as f:
-        writer = csv.writer(f)                                            
-        for seller_id in range(num_sellers):
-            num_listings = fake.random_int(min=5, max=max_listings_per_seller)
-            listed_products = fake.random_elements(elements=available_pids, length=num_listings, unique=True)
-            for product_id in listed_products:
-                price = round(fake.random_int(min=5, max=500) + fake.random.random(), 2)
-                quantity = fake.random_int(min=1, max=100)
-                is_active = 'TRUE' if fake.random_element(elements=(True, False)) else 'FALSE'
-                writer.writerow([seller_id, product_id, price, quantity, is_active])
-
-
-
-
-gen_users(num_users)
-available_pids = gen_products(num_products)
-gen_purchases(num_purchases, available_pids)
-gen_product_sellers(num_sellers=100, available_pids=available_pids, max_listings_per_seller=30)
 
+if __name__ == '__main__':
+    sys.exit(main())
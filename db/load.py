@@ -0,0 +1,287 @@
+"""Recreate the database from create.sql and bulk-load a CSV dataset.
+
+    python db/load.py                 # seed data in db/data/
+    python db/load.py generated       # the generated dataset
+    python db/load.py /tmp/big --workers 8
+
+Does what db/setup.sh used to do with psql, but faster on large datasets:
+
+1. drops and recreates the database named in .flaskenv and runs create.sql;
+2. drops every index and primary-key/unique/foreign-key constraint, keeping
+   their definitions;
+3. loads the files named by the \\COPY lines of load.sql with COPY FROM
+   STDIN on --workers parallel connections; large files are split into
+   record-aligned byte ranges so one table can load on several
+   connections at once;
+4. rebuilds the indexes and keys, then runs the rest of load.sql
+   (sequence resets and backfills) and ANALYZE;
+5. prints rows, megabytes and throughput for every table and phase.
+
+load.sql stays the single list of what is loaded and how; psql can still
+run it directly.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+DB_DIR = Path(__file__).resolve().parent
+COPY_RE = re.compile(r"^\\COPY (\w+)(?: \(([^)]*)\))? FROM '([^']+)' WITH \((.*)\);\s*$", re.MULTILINE)
+READ_SIZE = 1 << 20
+
+
+def connect(dbname=None):
+    return psycopg2.connect(host=os.environ.get('DB_HOST'), port=os.environ.get('DB_PORT') or 5432,
+                            user=os.environ.get('DB_USER'), password=os.environ.get('DB_PASSWORD'),
+                            dbname=dbname or os.environ.get('DB_NAME'))
+
+
+def parse_load_sql(text):
+    """Split load.sql into its COPY commands and the remaining statements."""
+    copies = [{"table": m.group(1), "columns": m.group(2), "file": m.group(3), "options": m.group(4)}
+              for m in COPY_RE.finditer(text)]
+    lines = [line for line in text.splitlines()
+             if not line.startswith('\\COPY') and not line.lstrip().startswith('--')]
+    statements = [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+    return copies, statements
+
+
+def recreate_database():
+    name = os.environ.get('DB_NAME')
+    conn = connect('postgres')
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        cur.execute(f'CREATE DATABASE "{name}"')
+    conn.close()
+
+
+def detach_keys_and_indexes(conn):
+    """Drop all indexes and PK/unique/FK constraints in the public schema and
+    return the statements that recreate them, in the order they must run."""
+    with conn, conn.cursor() as cur:
+        cur.execute('''
+SELECT conrelid::regclass::text, conname, contype, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE connamespace = 'public'::regnamespace AND contype IN ('p', 'u', 'f')
+''')
+        constraints = cur.fetchall()
+        cur.execute('''
+SELECT i.tablename, i.indexname, i.indexdef
+FROM pg_indexes i
+WHERE i.schemaname = 'public'
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                  WHERE c.conname = i.indexname AND c.connamespace = 'public'::regnamespace)
+''')
+        indexes = cur.fetchall()
+
+        foreign = [c for c in constraints if c[2] == 'f']
+        keys = [c for c in constraints if c[2] != 'f']
+        for table, name, _, _ in foreign + keys:
+            cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+        for _, name, _ in indexes:
+            cur.execute(f'DROP INDEX "{name}"')
+
+    # keys and indexes are independent per table and can build in parallel;
+    # foreign keys need the referenced keys and lock two tables, so they run last
+    build = {}
+    for table, name, _, definition in keys:
+        build.setdefault(table, []).append(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+    for table, _, definition in indexes:
+        build.setdefault(table, []).append(definition)
+    references = [f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'
+                  for table, name, _, definition in foreign]
+    return build, references
+
+
+def split_points(path, parts):
+    """Byte offsets that cut a CSV file into about `parts` ranges, each ending
+    on a record boundary (a newline outside quotes)."""
+    size = path.stat().st_size
+    if parts <= 1 or size < READ_SIZE:
+        return [0, size]
+    targets = [size * k // parts for k in range(1, parts)]
+    points = [0]
+    quotes = 0
+    offset = 0
+    with open(path, 'rb') as f:
+        while targets:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            pos = 0
+            while targets and offset + len(block) > targets[0]:
+                start = max(pos, targets[0] - offset)
+                quotes += block.count(b'"', pos, start)
+                pos = start
+                newline = block.find(b'\n', pos)
+                # newlines inside a quoted field follow an odd number of quotes
+                while newline != -1 and (quotes + block.count(b'"', pos, newline)) % 2:
+                    newline = block.find(b'\n', newline + 1)
+                if newline == -1:
+                    break
+                quotes += block.count(b'"', pos, newline)
+                pos = newline + 1
+                if offset + pos > points[-1]:
+                    points.append(offset + pos)
+                while targets and targets[0] < offset + pos:
+                    targets.pop(0)
+            quotes += block.count(b'"', pos)
+            offset += len(block)
+    points.append(size)
+    return points
+
+
+class FileRange:
+    """Read-only view of bytes [start, end) of a file, for COPY FROM STDIN."""
+    def __init__(self, path, start, end):
+        self.f = open(path, 'rb')
+        self.f.seek(start)
+        self.remaining = end - start
+
+    def read(self, size=READ_SIZE):
+        if self.remaining <= 0:
+            return b''
+        data = self.f.read(min(size if size and size > 0 else READ_SIZE, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def copy_range(copy, path, start, end):
+    columns = f" ({copy['columns']})" if copy['columns'] else ''
+    conn = connect()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute('SET synchronous_commit = off')
+            source = FileRange(path, start, end)
+            try:
+                cur.copy_expert(f"COPY {copy['table']}{columns} FROM STDIN WITH ({copy['options']})", source)
+            finally:
+                source.close()
+            return cur.rowcount
+    finally:
+        conn.close()
+
+
+def timed(fn, *args):
+    """Call fn(*args) and return (its result, start time, end time)."""
+    began = time.perf_counter()
+    result = fn(*args)
+    return result, began, time.perf_counter()
+
+
+def run_statements(statements, maintenance_work_mem):
+    conn = connect()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f"SET maintenance_work_mem = '{maintenance_work_mem}'")
+            for stmt in statements:
+                cur.execute(stmt)
+    finally:
+        conn.close()
+
+
+def report(label, seconds, rows=None, size=None):
+    parts = [f'{label:18}', f'{seconds:7.2f}s']
+    if rows is not None:
+        parts.append(f'{rows:>11,} rows  {rows / max(seconds, 1e-6):>11,.0f} rows/s')
+    if size is not None:
+        parts.append(f'{size / 1e6:8.1f} MB  {size / 1e6 / max(seconds, 1e-6):7.1f} MB/s')
+    print('  '.join(parts), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('datadir', nargs='?', default='data', help='CSV directory, relative to db/ (default: data)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='parallel connections')
+    parser.add_argument('--split-mb', type=int, default=64,
+                        help='split files larger than this across connections (default: 64)')
+    parser.add_argument('--maintenance-work-mem', default='256MB', help='memory per index build')
+    args = parser.parse_args()
+
+    load_dotenv(DB_DIR.parent / '.flaskenv')
+    datadir = (DB_DIR / args.datadir).resolve()
+    if not datadir.is_dir():
+        print(f'{datadir} does not exist', file=sys.stderr)
+        return 1
+    copies, post_load = parse_load_sql((DB_DIR / 'load.sql').read_text())
+
+    started = time.perf_counter()
+    recreate_database()
+    conn = connect()
+    with conn, conn.cursor() as cur:
+        cur.execute((DB_DIR / 'create.sql').read_text())
+    build, references = detach_keys_and_indexes(conn)
+    conn.close()
+    report('create schema', time.perf_counter() - started)
+
+    # load: one task per file range, largest first so the pool stays busy
+    tasks = []
+    for copy in copies:
+        path = datadir / copy['file']
+        if not path.exists():
+            print(f"skipping {copy['table']}: {path.name} not found", file=sys.stderr)
+            continue
+        parts = max(1, min(args.workers, path.stat().st_size // (args.split_mb << 20)))
+        points = split_points(path, parts)
+        tasks += [(copy, path, a, b) for a, b in zip(points, points[1:]) if b > a]
+    tasks.sort(key=lambda t: t[3] - t[2], reverse=True)
+
+    load_started = time.perf_counter()
+    totals = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for copy, path, a, b in tasks:
+            futures[pool.submit(timed, copy_range, copy, path, a, b)] = (copy['table'], b - a)
+            totals.setdefault(copy['table'], {"rows": 0, "bytes": 0, "started": None, "done": None})
+        for future, (table, size) in futures.items():
+            rows, began, ended = future.result()
+            t = totals[table]
+            t["rows"] += rows
+            t["bytes"] += size
+            # a table's time runs from its first chunk starting to its last finishing
+            t["started"] = began if t["started"] is None else min(t["started"], began)
+            t["done"] = ended if t["done"] is None else max(t["done"], ended)
+    for table, t in totals.items():
+        report(table, t["done"] - t["started"], t["rows"], t["bytes"])
+    report('load (all)', time.perf_counter() - load_started,
+           sum(t["rows"] for t in totals.values()), sum(t["bytes"] for t in totals.values()))
+
+    phase = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for future in [pool.submit(run_statements, stmts, args.maintenance_work_mem) for stmts in build.values()]:
+            future.result()
+    report('keys + indexes', time.perf_counter() - phase)
+
+    phase = time.perf_counter()
+    run_statements(references, args.maintenance_work_mem)
+    report('foreign keys', time.perf_counter() - phase)
+
+    phase = time.perf_counter()
+    run_statements(post_load, args.maintenance_work_mem)
+    report('post-load sql', time.perf_counter() - phase)
+
+    phase = time.perf_counter()
+    conn = connect()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute('ANALYZE')
+    conn.close()
+    report('analyze', time.perf_counter() - phase)
+
+    report('total', time.perf_counter() - started)
+    print(f"Database {os.environ.get('DB_NAME')} has been recreated and seeded from {datadir}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -41,13 +41,41 @@ SELECT pg_catalog.setval('public.orderitems_id_seq',
                          COALESCE((SELECT MAX(id)+1 FROM OrderItems), 1),
                          false);
 
+\COPY Subscriptions (id, user_id, product_id, frequency, active, created_at) FROM 'Subscriptions.csv' WITH (FORMAT csv, DELIMITER ',', NULL '', HEADER false);
+SELECT pg_catalog.setval('public.subscriptions_id_seq',
+                         COALESCE((SELECT MAX(id)+1 FROM Subscriptions), 1),
+                         false);
+
+-- fill in the per-order item summary columns for the orders loaded above
+UPDATE Orders o
+SET item_count = s.item_count,
+    fulfilled_count = s.fulfilled_count,
+    fulfillment_status = s.fulfillment_status
+FROM (
+    SELECT order_id,
+           COUNT(*) AS item_count,
+           COUNT(*) FILTER (WHERE fulfilled) AS fulfilled_count,
+           COALESCE(MAX(fulfillment_status), 'Order Placed') AS fulfillment_status
+    FROM OrderItems
+    GROUP BY order_id
+) s
+WHERE o.id = s.order_id;
+
+-- seed the seller analytics rollup from the fulfilled items loaded above
+INSERT INTO seller_daily_sales (seller_id, product_id, day, units, revenue)
+SELECT oi.seller_id, oi.product_id, DATE(o.created_at), SUM(oi.quantity), SUM(oi.subtotal)
+FROM OrderItems oi
+JOIN Orders o ON oi.order_id = o.id
+WHERE oi.fulfilled = TRUE
+GROUP BY oi.seller_id, oi.product_id, DATE(o.created_at);
+
 
-\COPY product_reviews FROM 'ProductReviews.csv' WITH (FORMAT csv, DELIMITER ',', NULL '', HEADER false);
+\COPY product_reviews (product_review_id, product_id, user_id, rating, body, created_at) FROM 'ProductReviews.csv' WITH (FORMAT csv, DELIMITER ',', NULL '', HEADER false);
 SELECT pg_catalog.setval('public.product_reviews_product_review_id_seq',
                          (SELECT COALESCE(MAX(product_review_id)+1, 1) FROM product_reviews),
                          false);
 
-\COPY seller_reviews FROM 'SellerReviews.csv' WITH (FORMAT csv, DELIMITER ',', NULL '', HEADER false);
+\COPY seller_reviews (seller_review_id, seller_id, user_id, rating, body, created_at) FROM 'SellerReviews.csv' WITH (FORMAT csv, DELIMITER ',', NULL '', HEADER false);
 SELECT pg_catalog.setval('public.seller_reviews_seller_review_id_seq',
                          (SELECT COALESCE(MAX(seller_review_id)+1, 1) FROM seller_reviews),
                          false);
@@ -57,4 +85,43 @@ SELECT pg_catalog.setval('public.review_votes_vote_id_seq',
                          (SELECT COALESCE(MAX(vote_id)+1, 1) FROM review_votes),
                          false);
 
-                         
+-- derive the stored helpful counts and verified flags for the reviews loaded above
+UPDATE product_reviews pr
+SET helpful_count = v.cnt
+FROM (
+    SELECT review_id, SUM(vote) AS cnt
+    FROM review_votes
+    WHERE review_type = 'product'
+    GROUP BY review_id
+) v
+WHERE pr.product_review_id = v.review_id;
+
+UPDATE product_reviews pr
+SET verified = TRUE
+WHERE EXISTS (SELECT 1 FROM Purchases pu WHERE pu.uid = pr.user_id AND pu.pid = pr.product_id);
+
+UPDATE seller_reviews sr
+SET helpful_count = v.cnt
+FROM (
+    SELECT review_id, SUM(vote) AS cnt
+    FROM review_votes
+    WHERE review_type = 'seller'
+    GROUP BY review_id
+) v
+WHERE sr.seller_review_id = v.review_id;
+
+UPDATE seller_reviews sr
+SET verified = TRUE
+WHERE EXISTS (
+    SELECT 1
+    FROM OrderItems oi
+    JOIN Orders o ON oi.order_id = o.id
+    WHERE o.user_id = sr.user_id
+      AND oi.seller_id = sr.seller_id
+      AND oi.fulfillment_status = 'Delivered'
+);
+
+INSERT INTO review_counts (review_type, target_id, review_count)
+SELECT 'product', product_id, COUNT(*) FROM product_reviews GROUP BY product_id
+UNION ALL
+SELECT 'seller', seller_id, COUNT(*) FROM seller_reviews GROUP BY seller_id;
@@ -0,0 +1,21 @@
+-- Migration: add the balance_ledger table that checkout, deposits and
+-- withdrawals append to instead of updating Users.balance.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_balance_ledger.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS balance_ledger (
+    entry_id BIGINT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    user_id INT NOT NULL REFERENCES Users(id),
+    amount DECIMAL(12,2) NOT NULL,
+    kind VARCHAR(16) NOT NULL CHECK (kind IN ('purchase', 'sale', 'deposit', 'withdrawal')),
+    order_id INT REFERENCES Orders(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    compacted_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS balance_ledger_pending_idx
+    ON balance_ledger(user_id, amount) WHERE compacted_at IS NULL;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Migration: add checkout_keys for idempotent checkout retries.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_checkout_keys.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS checkout_keys (
+    user_id INT NOT NULL REFERENCES Users(id),
+    idempotency_key VARCHAR(128) NOT NULL,
+    order_id INT REFERENCES Orders(id) ON DELETE CASCADE,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS checkout_keys_expires_idx ON checkout_keys(expires_at);
+
+COMMIT;
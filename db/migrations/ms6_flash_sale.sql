@@ -0,0 +1,10 @@
+-- Migration: add ProductSeller.flash_sale for flash-sale (hot) listings.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_flash_sale.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+ALTER TABLE ProductSeller
+    ADD COLUMN IF NOT EXISTS flash_sale BOOLEAN NOT NULL DEFAULT FALSE;
+
+COMMIT;
@@ -0,0 +1,79 @@
+-- Migration: indexes for the hot query predicates found by
+-- db/explain_audit.py, and the one-review-per-user rule the review pages
+-- already assume, enforced with unique indexes.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_index_audit.sql
+-- Safe to run multiple times.
+--
+-- Not added because an existing index already leads with the column:
+--   ProductSeller(seller_id)     - UNIQUE (seller_id, product_id)
+--   product_reviews(product_id)  - product_reviews_recent_idx
+--   product_reviews(user_id)     - product_reviews_user_idx
+--   seller_reviews(seller_id)    - seller_reviews_recent_idx
+
+BEGIN;
+
+-- ------------------------------------------------------------------
+-- Reviews: keep only each user's newest review per product / seller
+-- before enforcing uniqueness, along with the votes on the survivors.
+-- ------------------------------------------------------------------
+WITH ranked AS (
+    SELECT product_review_id,
+           ROW_NUMBER() OVER (PARTITION BY product_id, user_id
+                              ORDER BY created_at DESC, product_review_id DESC) AS rn
+    FROM product_reviews
+),
+dropped AS (
+    DELETE FROM product_reviews pr
+    USING ranked r
+    WHERE pr.product_review_id = r.product_review_id AND r.rn > 1
+    RETURNING pr.product_review_id
+)
+DELETE FROM review_votes rv
+USING dropped d
+WHERE rv.review_type = 'product' AND rv.review_id = d.product_review_id;
+
+WITH ranked AS (
+    SELECT seller_review_id,
+           ROW_NUMBER() OVER (PARTITION BY seller_id, user_id
+                              ORDER BY created_at DESC, seller_review_id DESC) AS rn
+    FROM seller_reviews
+),
+dropped AS (
+    DELETE FROM seller_reviews sr
+    USING ranked r
+    WHERE sr.seller_review_id = r.seller_review_id AND r.rn > 1
+    RETURNING sr.seller_review_id
+)
+DELETE FROM review_votes rv
+USING dropped d
+WHERE rv.review_type = 'seller' AND rv.review_id = d.seller_review_id;
+
+DELETE FROM review_counts;
+
+INSERT INTO review_counts (review_type, target_id, review_count)
+SELECT 'product', product_id, COUNT(*) FROM product_reviews GROUP BY product_id
+UNION ALL
+SELECT 'seller', seller_id, COUNT(*) FROM seller_reviews GROUP BY seller_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS product_reviews_product_user_key
+    ON product_reviews(product_id, user_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS seller_reviews_seller_user_key
+    ON seller_reviews(seller_id, user_id);
+
+-- ------------------------------------------------------------------
+-- Indexes for hot predicates.
+-- ------------------------------------------------------------------
+CREATE INDEX IF NOT EXISTS productseller_active_product_idx
+    ON ProductSeller(product_id, price) WHERE is_active AND quantity > 0;
+
+CREATE INDEX IF NOT EXISTS purchases_uid_pid_idx
+    ON Purchases(uid, pid);
+
+CREATE INDEX IF NOT EXISTS order_items_product_idx
+    ON OrderItems(product_id);
+
+CREATE INDEX IF NOT EXISTS users_verification_token_idx
+    ON Users(verification_token) WHERE verification_token IS NOT NULL;
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- Migration: add add-to-cart inventory holds (inventory_holds and
+-- ProductSeller.reserved).  Existing cart lines start without holds;
+-- checkout reserves their stock when the order is placed.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_inventory_holds.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+ALTER TABLE ProductSeller
+    ADD COLUMN IF NOT EXISTS reserved INT NOT NULL DEFAULT 0 CHECK (reserved >= 0);
+
+CREATE TABLE IF NOT EXISTS inventory_holds (
+    listing_id INT NOT NULL REFERENCES ProductSeller(id),
+    user_id INT NOT NULL REFERENCES Users(id),
+    quantity INT NOT NULL CHECK (quantity > 0),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (listing_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS inventory_holds_user_idx ON inventory_holds(user_id);
+CREATE INDEX IF NOT EXISTS inventory_holds_expires_idx ON inventory_holds(expires_at);
+
+-- keep reserved equal to the holds on re-runs
+UPDATE ProductSeller ps
+SET reserved = COALESCE((SELECT SUM(h.quantity) FROM inventory_holds h WHERE h.listing_id = ps.id), 0);
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- Migration: add the jobs table for the background job worker (worker.py).
+-- Run with: psql $DB_NAME -f db/migrations/ms6_jobs.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    kind VARCHAR(64) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(16) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'dead')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT
+);
+
+-- claimed jobs are marked 'running' (earlier versions left them 'queued')
+ALTER TABLE jobs DROP CONSTRAINT IF EXISTS jobs_status_check;
+ALTER TABLE jobs ADD CONSTRAINT jobs_status_check CHECK (status IN ('queued', 'running', 'dead'));
+
+DROP INDEX IF EXISTS jobs_runnable_idx;
+CREATE INDEX IF NOT EXISTS jobs_pending_idx ON jobs(run_at) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_dead_idx ON jobs(kind) WHERE status = 'dead';
+
+COMMIT;
@@ -0,0 +1,32 @@
+-- Migration: store each order's item count, fulfilled count and aggregate
+-- fulfillment status on Orders so order history pages don't have to
+-- aggregate OrderItems per request.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_order_summary.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+ALTER TABLE Orders
+    ADD COLUMN IF NOT EXISTS item_count INT NOT NULL DEFAULT 0;
+
+ALTER TABLE Orders
+    ADD COLUMN IF NOT EXISTS fulfilled_count INT NOT NULL DEFAULT 0;
+
+ALTER TABLE Orders
+    ADD COLUMN IF NOT EXISTS fulfillment_status VARCHAR(32) NOT NULL DEFAULT 'Order Placed';
+
+UPDATE Orders o
+SET item_count = s.item_count,
+    fulfilled_count = s.fulfilled_count,
+    fulfillment_status = s.fulfillment_status
+FROM (
+    SELECT order_id,
+           COUNT(*) AS item_count,
+           COUNT(*) FILTER (WHERE fulfilled) AS fulfilled_count,
+           COALESCE(MAX(fulfillment_status), 'Order Placed') AS fulfillment_status
+    FROM OrderItems
+    GROUP BY order_id
+) s
+WHERE o.id = s.order_id;
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- Migration: store helpful-vote counts and the verified-purchase flag on
+-- product_reviews, and index the two review orderings for keyset pagination.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_product_review_counts.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+ALTER TABLE product_reviews
+    ADD COLUMN IF NOT EXISTS helpful_count INT NOT NULL DEFAULT 0;
+
+ALTER TABLE product_reviews
+    ADD COLUMN IF NOT EXISTS verified BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE product_reviews pr
+SET helpful_count = COALESCE((
+    SELECT SUM(rv.vote)
+    FROM review_votes rv
+    WHERE rv.review_type = 'product'
+      AND rv.review_id = pr.product_review_id
+), 0);
+
+UPDATE product_reviews pr
+SET verified = EXISTS (
+    SELECT 1 FROM Purchases pu
+    WHERE pu.uid = pr.user_id AND pu.pid = pr.product_id
+);
+
+CREATE INDEX IF NOT EXISTS product_reviews_helpful_idx
+    ON product_reviews(product_id, helpful_count DESC, created_at DESC, product_review_id DESC);
+
+CREATE INDEX IF NOT EXISTS product_reviews_recent_idx
+    ON product_reviews(product_id, created_at DESC, product_review_id DESC);
+
+COMMIT;
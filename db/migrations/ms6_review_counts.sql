@@ -0,0 +1,29 @@
+-- Migration: add the review_counts table (reviews per product / seller)
+-- and the per-author review indexes used by the My Reviews page.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_review_counts.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS review_counts (
+    review_type  VARCHAR(10) NOT NULL CHECK (review_type IN ('product', 'seller')),
+    target_id    INT NOT NULL,
+    review_count INT NOT NULL DEFAULT 0 CHECK (review_count >= 0),
+    PRIMARY KEY (review_type, target_id)
+);
+
+-- Rebuild from scratch so re-running the script never double counts.
+DELETE FROM review_counts;
+
+INSERT INTO review_counts (review_type, target_id, review_count)
+SELECT 'product', product_id, COUNT(*) FROM product_reviews GROUP BY product_id
+UNION ALL
+SELECT 'seller', seller_id, COUNT(*) FROM seller_reviews GROUP BY seller_id;
+
+CREATE INDEX IF NOT EXISTS product_reviews_user_idx
+    ON product_reviews(user_id, created_at DESC, product_review_id DESC);
+
+CREATE INDEX IF NOT EXISTS seller_reviews_user_idx
+    ON seller_reviews(user_id, created_at DESC, seller_review_id DESC);
+
+COMMIT;
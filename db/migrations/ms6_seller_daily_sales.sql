@@ -0,0 +1,31 @@
+-- Migration: add the seller_daily_sales rollup used by seller analytics
+-- and backfill it from the fulfilled order items already on record.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_seller_daily_sales.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS seller_daily_sales (
+    seller_id INT NOT NULL REFERENCES Users(id),
+    product_id INT NOT NULL REFERENCES Products(id),
+    day DATE NOT NULL,
+    units INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (seller_id, day, product_id)
+);
+
+-- Rebuild from scratch so re-running the script never double counts.
+DELETE FROM seller_daily_sales;
+
+INSERT INTO seller_daily_sales (seller_id, product_id, day, units, revenue)
+SELECT oi.seller_id,
+       oi.product_id,
+       DATE(o.created_at),
+       SUM(oi.quantity),
+       SUM(oi.subtotal)
+FROM OrderItems oi
+JOIN Orders o ON oi.order_id = o.id
+WHERE oi.fulfilled = TRUE
+GROUP BY oi.seller_id, oi.product_id, DATE(o.created_at);
+
+COMMIT;
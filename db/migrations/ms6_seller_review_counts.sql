@@ -0,0 +1,40 @@
+-- Migration: store helpful-vote counts and the verified flag on
+-- seller_reviews, and index the two review orderings for keyset pagination.
+-- A seller review is verified when the reviewer has a delivered item from
+-- that seller, the same rule that gates writing one.
+-- Run with: psql $DB_NAME -f db/migrations/ms6_seller_review_counts.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+ALTER TABLE seller_reviews
+    ADD COLUMN IF NOT EXISTS helpful_count INT NOT NULL DEFAULT 0;
+
+ALTER TABLE seller_reviews
+    ADD COLUMN IF NOT EXISTS verified BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE seller_reviews sr
+SET helpful_count = COALESCE((
+    SELECT SUM(rv.vote)
+    FROM review_votes rv
+    WHERE rv.review_type = 'seller'
+      AND rv.review_id = sr.seller_review_id
+), 0);
+
+UPDATE seller_reviews sr
+SET verified = EXISTS (
+    SELECT 1
+    FROM OrderItems oi
+    JOIN Orders o ON oi.order_id = o.id
+    WHERE o.user_id = sr.user_id
+      AND oi.seller_id = sr.seller_id
+      AND oi.fulfillment_status = 'Delivered'
+);
+
+CREATE INDEX IF NOT EXISTS seller_reviews_helpful_idx
+    ON seller_reviews(seller_id, helpful_count DESC, created_at DESC, seller_review_id DESC);
+
+CREATE INDEX IF NOT EXISTS seller_reviews_recent_idx
+    ON seller_reviews(seller_id, created_at DESC, seller_review_id DESC);
+
+COMMIT;
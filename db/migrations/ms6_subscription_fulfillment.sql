@@ -0,0 +1,30 @@
+-- Migration: schedule subscription deliveries (Subscriptions.next_due_at,
+-- last_order_id, last_error) for `flask subscriptions fulfill`.
+-- Existing subscriptions become due one period after they were created,
+-- so the first run orders every delivery that is already overdue (once
+-- per subscription, not once per missed period).
+-- Run with: psql $DB_NAME -f db/migrations/ms6_subscription_fulfillment.sql
+-- Safe to run multiple times.
+
+BEGIN;
+
+ALTER TABLE Subscriptions
+    ADD COLUMN IF NOT EXISTS next_due_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS last_order_id INT REFERENCES Orders(id) ON DELETE SET NULL,
+    ADD COLUMN IF NOT EXISTS last_error VARCHAR(64);
+
+UPDATE Subscriptions
+SET next_due_at = created_at + CASE frequency
+                                   WHEN 'weekly' THEN INTERVAL '7 days'
+                                   WHEN 'quarterly' THEN INTERVAL '3 months'
+                                   ELSE INTERVAL '1 month'
+                               END
+WHERE next_due_at IS NULL;
+
+ALTER TABLE Subscriptions
+    ALTER COLUMN next_due_at SET DEFAULT now(),
+    ALTER COLUMN next_due_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_subscriptions_due ON Subscriptions(next_due_at) WHERE active;
+
+COMMIT;
@@ -0,0 +1,81 @@
+#!/bin/bash
+# Local primary + streaming replica for trying out read-replica routing.
+#
+#   db/replica_cluster.sh start [datadir]   # data under /tmp/amazon-replicas by default
+#   db/replica_cluster.sh status
+#   db/replica_cluster.sh stop
+#
+# start creates two PostgreSQL instances owned by the current user: a
+# primary on $PRIMARY_PORT (5433) loaded with db/data/ through db/load.py,
+# and a hot standby of it on $REPLICA_PORT (5434) made with pg_basebackup.
+# Then run the app against them with
+#
+#   DB_HOST=localhost DB_PORT=5433 DB_REPLICAS=localhost:5434 poetry run flask run
+#
+# Stop the replica (pg_ctl -D <datadir>/replica stop) to watch reads fall
+# back to the primary, or load the primary to watch the lag check.
+
+set -euo pipefail
+
+mypath=$(realpath "$0")
+mybase=$(dirname "$mypath")
+
+action="${1:-start}"
+root="${2:-/tmp/amazon-replicas}"
+PRIMARY_PORT="${PRIMARY_PORT:-5433}"
+REPLICA_PORT="${REPLICA_PORT:-5434}"
+
+if [ -z "${PG_BIN:-}" ] ; then
+    if command -v initdb >/dev/null 2>&1 ; then
+        PG_BIN=$(dirname "$(command -v initdb)")
+    else
+        PG_BIN=$(ls -d /usr/lib/postgresql/*/bin 2>/dev/null | sort -V | tail -1)
+    fi
+fi
+[ -x "$PG_BIN/initdb" ] || { echo "initdb not found; set PG_BIN to PostgreSQL's bin directory" >&2; exit 1; }
+
+set -a
+source "$mybase/../.flaskenv"
+set +a
+
+case "$action" in
+start)
+    mkdir -p "$root"
+    if [ ! -d "$root/primary" ] ; then
+        "$PG_BIN/initdb" -D "$root/primary" -U "$DB_USER" --auth=trust >/dev/null
+        cat >> "$root/primary/postgresql.conf" <<EOF
+port = $PRIMARY_PORT
+listen_addresses = 'localhost'
+unix_socket_directories = '$root'
+wal_level = replica
+max_wal_senders = 4
+hot_standby = on
+EOF
+        echo "host replication $DB_USER 127.0.0.1/32 trust" >> "$root/primary/pg_hba.conf"
+    fi
+    "$PG_BIN/pg_ctl" -D "$root/primary" status >/dev/null 2>&1 || "$PG_BIN/pg_ctl" -D "$root/primary" -l "$root/primary.log" -w start >/dev/null
+    if [ ! -d "$root/replica" ] ; then
+        python=python3
+        command -v poetry >/dev/null 2>&1 && python="poetry run python"
+        DB_HOST=localhost DB_PORT=$PRIMARY_PORT $python "$mybase/load.py" data
+        "$PG_BIN/pg_basebackup" -h localhost -p "$PRIMARY_PORT" -U "$DB_USER" -D "$root/replica" -R -X stream
+        echo "port = $REPLICA_PORT" >> "$root/replica/postgresql.conf"
+    fi
+    "$PG_BIN/pg_ctl" -D "$root/replica" status >/dev/null 2>&1 || "$PG_BIN/pg_ctl" -D "$root/replica" -l "$root/replica.log" -w start >/dev/null
+    echo "primary on localhost:$PRIMARY_PORT, replica on localhost:$REPLICA_PORT"
+    echo "DB_HOST=localhost DB_PORT=$PRIMARY_PORT DB_REPLICAS=localhost:$REPLICA_PORT"
+    ;;
+status)
+    "$PG_BIN/psql" -h localhost -p "$PRIMARY_PORT" -U "$DB_USER" -d postgres -c \
+        "SELECT application_name, state, replay_lag FROM pg_stat_replication"
+    ;;
+stop)
+    for instance in replica primary ; do
+        [ -d "$root/$instance" ] && "$PG_BIN/pg_ctl" -D "$root/$instance" -m fast stop || true
+    done
+    ;;
+*)
+    echo "usage: $0 start|status|stop [datadir]" >&2
+    exit 1
+    ;;
+esac
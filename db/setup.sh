@@ -19,11 +19,10 @@ set +a
 createdb --version >/dev/null 2>&1 || { echo "PostgreSQL client utilities not found" >&2; exit 1; }
 pg_isready -h "$DB_HOST" -p "${DB_PORT:-5432}" >/dev/null 2>&1 || { echo "PostgreSQL server not reachable at $DB_HOST:${DB_PORT:-5432}" >&2; exit 1; }
 
-PGPASSWORD="$DB_PASSWORD" psql -h "$DB_HOST" -p "${DB_PORT:-5432}" -U "$DB_USER" -d postgres -c "DROP DATABASE IF EXISTS \"$DB_NAME\"" >/dev/null
-PGPASSWORD="$DB_PASSWORD" psql -h "$DB_HOST" -p "${DB_PORT:-5432}" -U "$DB_USER" -d postgres -c "CREATE DATABASE \"$DB_NAME\"" >/dev/null
-
-PGPASSWORD="$DB_PASSWORD" psql -h "$DB_HOST" -p "${DB_PORT:-5432}" -U "$DB_USER" -d "$DB_NAME" -f create.sql >/dev/null
-cd "$datadir"
-PGPASSWORD="$DB_PASSWORD" psql -h "$DB_HOST" -p "${DB_PORT:-5432}" -U "$DB_USER" -d "$DB_NAME" -f "$mybase/load.sql" >/dev/null
-
-echo "Database $DB_NAME has been recreated and seeded."
+# db/load.py recreates the database, loads the CSVs named in load.sql in
+# parallel and rebuilds keys and indexes afterwards; extra arguments
+# (e.g. --workers 8) are passed through.
+if command -v poetry >/dev/null 2>&1 ; then
+    exec poetry run python "$mybase/load.py" "$datadir" "${@:2}"
+fi
+exec python3 "$mybase/load.py" "$datadir" "${@:2}"
@@ -0,0 +1,16 @@
+"""Load-test harness that drives the app through realistic user journeys.
+
+    python -m loadtest --users 20 --duration 60
+    python -m loadtest --target http://localhost:8080 --users 50 --save before
+    python -m loadtest --mix browse=6,search=3,buy=1 --compare before
+
+Virtual users loop over weighted journeys (see journeys.py) either against
+the app in-process, through Flask's test client, or against a running
+server over HTTP.  Every request is recorded under the endpoint it hits;
+the report gives throughput, latency percentiles, database statements per
+request (the X-DB-Queries header) and error rates per endpoint.  Results can
+be saved under loadtest/results/ and compared with an earlier run.
+
+The buy and seller journeys place orders and change fulfillment statuses,
+so run against a disposable database (e.g. `db/setup.sh generated`).
+"""
@@ -0,0 +1,95 @@
+import argparse
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from . import __doc__ as package_doc
+from .clients import HttpClient, InProcessClient
+from .journeys import DEFAULT_MIX, JOURNEYS, sample_data
+from .runner import compare, format_report, load, run, save, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in JOURNEYS:
+            raise argparse.ArgumentTypeError(f"unknown journey '{name}' (choose from {', '.join(JOURNEYS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description=package_doc.split('\n')[0])
+    parser.add_argument('--target', default='inprocess',
+                        help="'inprocess' (Flask test client, default) or a server URL such as http://localhost:8080")
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users (default: 10)')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds (default: 30)')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before that (default: 5)')
+    parser.add_argument('--think', type=float, default=0.0,
+                        help='mean pause between journeys in seconds (default: 0, closed loop)')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='journey weights, e.g. browse=50,search=30,buy=15,seller=5 (the default)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--password', default='password',
+                        help='password of the sampled accounts, for --target URLs (default: the generator\'s)')
+    parser.add_argument('--verify-users', action='store_true',
+                        help='mark the sampled accounts as email-verified so they can log in over HTTP')
+    parser.add_argument('--save', metavar='NAME', help='store the results as loadtest/results/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare with a saved run (name or path)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p95/queries growth reported as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    app = create_app()
+
+    data = sample_data(app, args.users, args.password, verify=args.verify_users)
+    required = {"browse": 'product_ids', "search": 'product_ids', "buy": 'listings', "seller": 'sellers'}
+    mix = {}
+    for name, weight in args.mix.items():
+        if not data[required[name]] or (name == 'buy' and not data['buyers']):
+            print(f'skipping the {name} journey: the database has no suitable rows', file=sys.stderr)
+        elif weight > 0:
+            mix[name] = weight
+    if not mix:
+        print('nothing to run; load a dataset first (db/setup.sh generated)', file=sys.stderr)
+        return 1
+
+    if args.target == 'inprocess':
+        def make_client():
+            return InProcessClient(app)
+    else:
+        def make_client():
+            return HttpClient(args.target)
+
+    print(f"{args.users} users for {args.duration:g}s (+{args.warmup:g}s warmup) against {args.target}, "
+          f"mix {', '.join(f'{k}={v:g}' for k, v in mix.items())}", flush=True)
+    recorder = run(make_client, data, JOURNEYS, mix, args.users, args.duration,
+                   warmup=args.warmup, seed=args.seed, think=args.think)
+    config = {key: value for key, value in vars(args).items() if key not in ('password', 'save', 'compare')}
+    config['mix'] = mix
+    result = summarize(recorder, config)
+    print(format_report(result))
+    for failure in recorder.failures[:5]:
+        print(f'  failed journey: {failure}', file=sys.stderr)
+
+    if args.save:
+        print(f'saved {save(result, args.save)}')
+    if args.compare:
+        lines, regressions = compare(load(args.compare), result, args.threshold)
+        print('\n' + '\n'.join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} endpoint(s) regressed by more than {100 * args.threshold:.0f}%: "
+                  + ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
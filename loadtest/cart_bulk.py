@@ -0,0 +1,102 @@
+"""Latency of cart changes made one line at a time vs in bulk.
+
+    python -m loadtest.cart_bulk --lines 1 50 --rounds 20
+
+For each line count N, a buyer repeatedly fills an empty cart with N
+listings (one unit each) and moves N saved-for-later items back to the
+cart, first one line per call (Cart.add_item / Cart.move_saved_to_cart)
+and then in a single Cart.apply_changes call.  Prints the median and p90
+of each round's total time, so the per-call cost shows as the gap
+between the two.  Uses in-stock listings and leaves the buyer's cart
+empty; run it on a disposable database.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.cart_bulk',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 50], help='line counts (default: 1 50)')
+    parser.add_argument('--rounds', type=int, default=20, help='rounds per measurement (default: 20)')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.cart import Cart
+    app = create_app()
+
+    with app.app_context():
+        most = max(args.lines)
+        listings = [r[0] for r in app.db.execute('''
+SELECT id FROM ProductSeller
+WHERE is_active AND NOT flash_sale AND quantity - reserved >= 10
+ORDER BY id
+LIMIT :n
+''', n=most)]
+        if len(listings) < most:
+            print(f'need {most} in-stock listings; load db/generated first', file=sys.stderr)
+            return 1
+        buyer = app.db.execute('''
+SELECT id FROM Users
+WHERE id NOT IN (SELECT seller_id FROM ProductSeller WHERE id = ANY(:listings))
+ORDER BY id
+LIMIT 1
+''', listings=listings)[0][0]
+
+        def reset():
+            Cart.clear(buyer)
+            app.db.execute('DELETE FROM SavedItems WHERE user_id = :user_id', user_id=buyer)
+
+        def save(ids):
+            app.db.execute('''
+INSERT INTO SavedItems (user_id, product_id, listing_id, seller_id, unit_price, quantity)
+SELECT :user_id, product_id, id, seller_id, price, 1
+FROM ProductSeller
+WHERE id = ANY(:ids)
+''', user_id=buyer, ids=ids)
+
+        def measure(prepare, run):
+            times = []
+            for _ in range(args.rounds):
+                reset()
+                prepare()
+                started = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - started)
+            reset()
+            times.sort()
+            return times
+
+        print(f'buyer {buyer}, {args.rounds} rounds each; total ms per round (p50 / p90)')
+        print(f'{"lines":>5}  {"operation":<10} {"one call per line":>20} {"one bulk call":>16}')
+        for n in args.lines:
+            ids = listings[:n]
+            rows = {
+                'add': (
+                    measure(lambda: None, lambda: [Cart.add_item(buyer, i, 1) for i in ids]),
+                    measure(lambda: None, lambda: Cart.apply_changes(
+                        buyer, [{"listing_id": i, "op": "add", "quantity": 1} for i in ids])),
+                ),
+                'move saved': (
+                    measure(lambda: save(ids), lambda: [Cart.move_saved_to_cart(buyer, i) for i in ids]),
+                    measure(lambda: save(ids), lambda: Cart.move_all_saved_to_cart(buyer)),
+                ),
+            }
+            for name, (single, bulk) in rows.items():
+                print(f'{n:>5}  {name:<10} '
+                      f'{1000 * percentile(single, 50):>9.1f} / {1000 * percentile(single, 90):<8.1f}'
+                      f'{1000 * percentile(bulk, 50):>7.1f} / {1000 * percentile(bulk, 90):.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
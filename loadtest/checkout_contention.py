@@ -0,0 +1,117 @@
+"""Checkout throughput when every order pays the same seller.
+
+    python -m loadtest.checkout_contention --buyers 32 --duration 20
+
+Picks the seller with the most in-stock listings and `--buyers` buyers,
+tops the buyers up, then has each buyer repeatedly put one unit of a
+random listing of that seller in their cart and check out, all buyers at
+once.  Only Cart.checkout is timed.  Reports completed checkouts per
+second, latency percentiles and how many checkouts failed with a
+serialization or lock error.  Run it at two commits to compare how seller
+balance updates scale; it places real orders, so use a disposable
+database.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import DBAPIError
+
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.checkout_contention',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--buyers', type=int, default=32, help='concurrent buyers (default: 32)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run (default: 20)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.cart import Cart
+    from app.models.user import User
+    app = create_app()
+
+    with app.app_context():
+        row = app.db.execute('''
+SELECT seller_id, ARRAY_AGG(id)
+FROM ProductSeller
+WHERE is_active AND quantity >= 1000
+GROUP BY seller_id
+ORDER BY COUNT(*) DESC
+LIMIT 1
+''')
+        if not row:
+            print('no seller has listings with 1000+ units; load db/generated first', file=sys.stderr)
+            return 1
+        seller_id, listings = row[0]
+        buyers = [r[0] for r in app.db.execute('''
+SELECT id FROM Users WHERE id <> :seller_id ORDER BY id LIMIT :n
+''', seller_id=seller_id, n=args.buyers)]
+        for buyer in buyers:
+            Cart.clear(buyer)
+            User.add_balance(buyer, 10000)
+    print(f'{len(buyers)} buyers checking out from seller {seller_id} ({len(listings)} listings) '
+          f'for {args.duration:g}s', flush=True)
+
+    lock = threading.Lock()
+    latencies = []
+    failures = {"conflict": 0, "other": 0}
+    stop = threading.Event()
+
+    def buyer_loop(buyer, rng):
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    Cart.add_item(buyer, rng.choice(listings), 1)
+                except ValueError:
+                    continue
+                started = time.perf_counter()
+                try:
+                    Cart.checkout(buyer)
+                except DBAPIError as exc:
+                    kind = 'conflict' if getattr(exc.orig, 'pgcode', None) in ('40001', '40P01', '55P03') else 'other'
+                    with lock:
+                        failures[kind] += 1
+                    Cart.clear(buyer)
+                    continue
+                except ValueError:
+                    with lock:
+                        failures['other'] += 1
+                    Cart.clear(buyer)
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=buyer_loop, args=(buyer, random.Random(args.seed * 7919 + i)))
+               for i, buyer in enumerate(buyers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    attempts = len(latencies) + failures['conflict'] + failures['other']
+    print(f'checkouts: {len(latencies)} ok, {failures["conflict"]} serialization/lock failures, '
+          f'{failures["other"]} other failures ({attempts} attempts)')
+    print(f'throughput: {len(latencies) / elapsed:.1f} checkouts/s; conflict rate '
+          f'{100 * failures["conflict"] / max(attempts, 1):.1f}%')
+    print('latency ms: ' + ', '.join(f'p{p} {1000 * percentile(latencies, p):.1f}' for p in (50, 90, 95, 99)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
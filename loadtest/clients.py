@@ -0,0 +1,95 @@
+import http.client
+import json
+import re
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+class Response:
+    def __init__(self, status, headers, body=b''):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def queries(self):
+        value = self.headers.get('X-DB-Queries')
+        return int(value) if value is not None else None
+
+
+class InProcessClient:
+    """Talks to the app through Flask's test client; logs in by writing the
+    flask_login session directly, so no password or email check is needed."""
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def login(self, user):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user['id'])
+            session['_fresh'] = True
+
+    def request(self, method, path, form=None, json_body=None, headers=None):
+        response = self.client.open(path, method=method, data=form, json=json_body, headers=headers)
+        return Response(response.status_code, response.headers, response.get_data())
+
+
+class HttpClient:
+    """Talks to a running server over one keep-alive connection, keeping
+    cookies like a browser; logs in through the real login form."""
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.https = parts.scheme == 'https'
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.cookies = {}
+        self.conn = None
+
+    def login(self, user):
+        page = self.request('GET', '/login')
+        match = CSRF_RE.search(page.body.decode('utf-8', 'replace'))
+        form = {"email": user['email'], "password": user['password']}
+        if match:
+            form['csrf_token'] = match.group(1)
+        response = self.request('POST', '/login', form=form)
+        if response.status != 302 or '/login' in response.headers.get('Location', ''):
+            raise RuntimeError(f"could not log in as {user['email']} (is the email verified and the password right?)")
+
+    def request(self, method, path, form=None, json_body=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body = urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                raw = conn.getresponse()
+                data = raw.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed an idle keep-alive connection; retry once on a fresh one
+                self.conn = None
+                if attempt:
+                    raise
+                time.sleep(0.01)
+        for header in raw.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return Response(raw.status, raw.headers, data)
+
+    def _connection(self):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=self.timeout)
+        return self.conn
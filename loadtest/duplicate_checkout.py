@@ -0,0 +1,141 @@
+"""Simultaneous duplicate checkouts with the same idempotency key.
+
+    python -m loadtest.duplicate_checkout --buyers 20 --copies 8
+
+Gives `--buyers` buyers one unit of an in-stock listing in their cart,
+then sends `--copies` identical checkout requests per buyer, all at the
+same instant and all with the same Idempotency-Key header, through the
+app's real /cart/<id>/checkout route (Flask's test client).  Afterwards
+each buyer's key is replayed once more.  Checks that every buyer ended up
+with exactly one new order and that every response carried that order's
+id, and reports latencies of the checkouts, the duplicates and the
+replays.  It places real orders, so use a disposable database.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .clients import InProcessClient
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.duplicate_checkout',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--buyers', type=int, default=20, help='buyers checking out (default: 20)')
+    parser.add_argument('--copies', type=int, default=8, help='identical requests per buyer (default: 8)')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.cart import Cart
+    from app.models.user import User
+    app = create_app()
+
+    with app.app_context():
+        listings = app.db.execute('''
+SELECT id, seller_id FROM ProductSeller
+WHERE is_active AND NOT flash_sale AND quantity - reserved >= :n
+ORDER BY id
+LIMIT 20
+''', n=args.buyers)
+        if not listings:
+            print('no listing has enough stock; load db/generated first', file=sys.stderr)
+            return 1
+        sellers = {seller_id for _, seller_id in listings}
+        buyers = [r[0] for r in app.db.execute('''
+SELECT id FROM Users WHERE id <> ALL(:sellers) ORDER BY id LIMIT :n
+''', sellers=list(sellers), n=args.buyers)]
+        for i, buyer in enumerate(buyers):
+            Cart.clear(buyer)
+            Cart.add_item(buyer, listings[i % len(listings)][0], 1)
+            User.add_balance(buyer, 10000)
+        first_order = app.db.execute('SELECT COALESCE(MAX(id), 0) FROM Orders')[0][0]
+    print(f'{len(buyers)} buyers x {args.copies} simultaneous checkouts with the same key', flush=True)
+
+    keys = {buyer: uuid.uuid4().hex for buyer in buyers}
+    lock = threading.Lock()
+    results = {buyer: [] for buyer in buyers}
+    start = threading.Barrier(len(buyers) * args.copies)
+
+    def submit(buyer):
+        client = InProcessClient(app)
+        client.login({"id": buyer})
+        start.wait()
+        started = time.perf_counter()
+        response = client.request('POST', f'/cart/{buyer}/checkout', json_body={},
+                                  headers={'Idempotency-Key': keys[buyer]})
+        elapsed = time.perf_counter() - started
+        order_id = None
+        if response.status == 200:
+            order_id = json.loads(response.body).get('order_id')
+        with lock:
+            results[buyer].append((response.status, order_id, elapsed))
+
+    threads = [threading.Thread(target=submit, args=(buyer,))
+               for buyer in buyers for _ in range(args.copies)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    replays = []
+    for buyer in buyers:
+        client = InProcessClient(app)
+        client.login({"id": buyer})
+        started = time.perf_counter()
+        response = client.request('POST', f'/cart/{buyer}/checkout', json_body={},
+                                  headers={'Idempotency-Key': keys[buyer]})
+        replays.append((buyer, response, time.perf_counter() - started))
+
+    with app.app_context():
+        placed = {}
+        for user_id, order_id in app.db.execute('''
+SELECT user_id, id FROM Orders WHERE id > :first_order AND user_id = ANY(:buyers)
+''', first_order=first_order, buyers=buyers):
+            placed.setdefault(user_id, []).append(order_id)
+
+    failed = []
+    first, duplicates = [], []
+    for buyer in buyers:
+        orders = placed.get(buyer, [])
+        if len(orders) != 1:
+            failed.append(f'buyer {buyer}: {len(orders)} orders placed')
+            continue
+        latencies = sorted(elapsed for _, _, elapsed in results[buyer])
+        first.append(latencies[0])
+        duplicates.extend(latencies[1:])
+        for status, order_id, _ in results[buyer]:
+            if status != 200 or order_id != orders[0]:
+                failed.append(f'buyer {buyer}: response {status} with order {order_id}, expected {orders[0]}')
+    replay_latency = []
+    replay_queries = []
+    for buyer, response, elapsed in replays:
+        replay_latency.append(elapsed)
+        replay_queries.append(response.queries or 0)
+        if response.status != 200:
+            failed.append(f'buyer {buyer}: replay answered {response.status}')
+
+    for name, latencies in (('fastest copy', first), ('other copies', duplicates), ('replay', replay_latency)):
+        latencies.sort()
+        print(f'{name} latency ms: ' + ', '.join(
+            f'p{p} {1000 * percentile(latencies, p):.1f}' for p in (50, 90, 99)))
+    print(f'replays ran {max(replay_queries, default=0)} queries at most')
+    for failure in failed:
+        print('FAIL: ' + failure)
+    if failed:
+        return 1
+    print(f'OK: {len(buyers)} orders for {len(buyers) * args.copies} submissions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""A flash sale: many buyers at once for one listing's limited stock.
+
+    python -m loadtest.flash_sale --buyers 1000 --stock 100
+    python -m loadtest.flash_sale --buyers 1000 --stock 100 --slots 1000
+
+Puts one listing into flash-sale mode with `--stock` units, releases
+`--buyers` buyer threads at the same instant, and has each Buy now one
+unit with Cart.buy_now.  `--slots` overrides FLASH_SALE_SLOTS; setting it
+to the number of buyers effectively turns admission queuing off, for
+comparison.  Reports how many bought, how many were told the listing was
+sold out (and how many of those never reached the database), latency
+percentiles for both, whether orders were admitted in arrival order,
+and checks that exactly min(stock, buyers) units were sold.  It places
+real orders, so use a disposable database.
+"""
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.flash_sale',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--buyers', type=int, default=1000, help='concurrent buyers (default: 1000)')
+    parser.add_argument('--stock', type=int, default=100, help='units on sale (default: 100)')
+    parser.add_argument('--slots', type=int, help='purchases admitted at once (default: FLASH_SALE_SLOTS)')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.cart import Cart
+    from app.models.user import User
+    app = create_app()
+    if args.slots:
+        app.flash_sales.slots = args.slots
+    gate = app.flash_sales
+
+    with app.app_context():
+        row = app.db.execute('''
+SELECT id, seller_id FROM ProductSeller
+WHERE is_active
+ORDER BY id
+LIMIT 1
+''')
+        if not row:
+            print('no active listings; load db/generated first', file=sys.stderr)
+            return 1
+        listing_id, seller_id = row[0]
+        app.db.execute('''
+UPDATE ProductSeller SET quantity = reserved + :stock, flash_sale = TRUE WHERE id = :listing_id
+''', stock=args.stock, listing_id=listing_id)
+        buyers = [r[0] for r in app.db.execute('''
+SELECT id FROM Users WHERE id <> :seller_id ORDER BY id LIMIT :n
+''', seller_id=seller_id, n=args.buyers)]
+        for buyer in buyers:
+            User.add_balance(buyer, 10000)
+        first_item = app.db.execute('SELECT COALESCE(MAX(id), 0) FROM OrderItems')[0][0]
+    gate.restocked(listing_id)
+    print(f'{len(buyers)} buyers, {args.stock} units of listing {listing_id}, '
+          f'{gate.slots} admitted at a time', flush=True)
+
+    lock = threading.Lock()
+    bought = []
+    sold_out = []
+    fast_rejects = 0
+    errors = {}
+    arrivals = {}
+    start = threading.Barrier(len(buyers))
+
+    def buyer(user_id):
+        nonlocal fast_rejects
+        with app.app_context():
+            start.wait()
+            started = time.perf_counter()
+            was_sold_out = gate.is_sold_out(listing_id)
+            with lock:
+                arrivals[user_id] = len(arrivals)
+            try:
+                Cart.buy_now(user_id, listing_id, 1)
+            except ValueError as exc:
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if str(exc) == 'Sold out.':
+                        sold_out.append(elapsed)
+                        fast_rejects += was_sold_out
+                    else:
+                        errors[str(exc)] = errors.get(str(exc), 0) + 1
+                return
+            except Exception as exc:
+                with lock:
+                    errors[repr(exc)] = errors.get(repr(exc), 0) + 1
+                return
+            with lock:
+                bought.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=buyer, args=(user_id,)) for user_id in buyers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        orders = app.db.execute('''
+SELECT o.user_id, oi.quantity
+FROM OrderItems oi
+JOIN Orders o ON o.id = oi.order_id
+WHERE oi.listing_id = :listing_id AND oi.id > :first_item
+ORDER BY oi.id
+''', listing_id=listing_id, first_item=first_item)
+        left = app.db.execute('SELECT quantity - reserved FROM ProductSeller WHERE id = :id',
+                              id=listing_id)[0][0]
+        app.db.execute('UPDATE ProductSeller SET flash_sale = FALSE WHERE id = :id', id=listing_id)
+
+    print(f'{len(bought)} bought, {len(sold_out)} sold out ({fast_rejects} turned away before '
+          f'the database), {sum(errors.values())} other failures in {elapsed:.2f}s')
+    for message, count in sorted(errors.items(), key=lambda kv: -kv[1]):
+        print(f'  {count} x {message}')
+    for name, latencies in (('buy', bought), ('sold out', sold_out)):
+        latencies.sort()
+        print(f'{name} latency ms: ' + ', '.join(
+            f'p{p} {1000 * percentile(latencies, p):.1f}' for p in (50, 90, 99)))
+
+    # buyers that arrived earlier should have been served earlier
+    order = [arrivals[user_id] for user_id, _ in orders if user_id in arrivals]
+    inversions = sum(1 for a, b in zip(order, order[1:]) if a > b)
+    print(f'admission order: {inversions} of {max(len(order) - 1, 0)} consecutive orders out of arrival order')
+
+    units = sum(qty for _, qty in orders)
+    expected = min(args.stock, len(buyers))
+    print(f'{units} units sold, {left} left')
+    if units != expected or units + left != args.stock or units != len(bought):
+        print(f'FAIL: expected {expected} units sold and {args.stock - expected} left')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
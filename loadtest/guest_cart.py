@@ -0,0 +1,135 @@
+"""Add-to-cart throughput for guests (cart store) vs logged-in buyers.
+
+    python -m loadtest.guest_cart --clients 16 --duration 10
+
+Runs `--clients` threads for `--duration` seconds each, first as
+logged-out visitors adding random in-stock listings to their guest cart
+(POST /cart/guest/add, served from the cart store), then as logged-in
+buyers doing the same against their database cart (POST
+/cart/<id>/add), all through the app's real routes with Flask's test
+client.  Reports adds per second and latency percentiles for both, then
+merges each guest cart into a buyer's cart the way logging in does and
+times that.  The logged-in half holds stock and the merge fills real
+carts; they are emptied afterwards, but use a disposable database.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .clients import InProcessClient
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.guest_cart',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients (default: 16)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per phase (default: 10)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.cart import Cart
+    app = create_app()
+    # the phase adds far more than a shopper would; keep the caps out of the way
+    app.cart_store.max_lines = app.cart_store.max_quantity = 10 ** 9
+
+    with app.app_context():
+        listings = [r[0] for r in app.db.execute('''
+SELECT id FROM ProductSeller
+WHERE is_active AND NOT flash_sale AND quantity - reserved >= 1000
+ORDER BY id
+LIMIT 200
+''')]
+        if not listings:
+            print('no listings with 1000+ units; load db/generated first', file=sys.stderr)
+            return 1
+        buyers = [r[0] for r in app.db.execute('''
+SELECT id FROM Users
+WHERE id NOT IN (SELECT seller_id FROM ProductSeller WHERE id = ANY(:listings))
+ORDER BY id
+LIMIT :n
+''', listings=listings, n=args.clients)]
+        for buyer in buyers:
+            Cart.clear(buyer)
+
+    def phase(make_client, path):
+        lock = threading.Lock()
+        latencies = []
+        failures = [0]
+        stop = threading.Event()
+        clients = [make_client(i) for i in range(len(buyers))]
+
+        def loop(i, rng):
+            client = clients[i]
+            done = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = client.request('POST', path(i), json_body={"listing_id": rng.choice(listings),
+                                                                      "quantity": 1})
+                if response.status != 200:
+                    with lock:
+                        failures[0] += 1
+                    continue
+                done.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(done)
+
+        threads = [threading.Thread(target=loop, args=(i, random.Random(args.seed * 7919 + i)))
+                   for i in range(len(buyers))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return clients, len(latencies) / elapsed, latencies, failures[0]
+
+    def guest(_):
+        return InProcessClient(app)
+
+    def member(i):
+        client = InProcessClient(app)
+        client.login({"id": buyers[i]})
+        return client
+
+    print(f'{len(buyers)} clients, {args.duration:g}s per phase, {len(listings)} listings', flush=True)
+    guests, *guest_stats = phase(guest, lambda i: '/cart/guest/add')
+    _, *member_stats = phase(member, lambda i: f'/cart/{buyers[i]}/add')
+    for name, (rate, latencies, failures) in (('guest', guest_stats), ('logged in', member_stats)):
+        print(f'{name:>9}: {rate:8.1f} adds/s, {failures} failed; latency ms ' + ', '.join(
+            f'p{p} {1000 * percentile(latencies, p):.2f}' for p in (50, 90, 99)))
+
+    merge_times = []
+    merged_lines = 0
+    with app.app_context():
+        for buyer in buyers:
+            Cart.clear(buyer)
+        for buyer, client in zip(buyers, guests):
+            token = app.guest_cart_cookie.serializer.loads(client.client.get_cookie('guest_cart').value)
+            lines = app.cart_store.pop(token)
+            started = time.perf_counter()
+            merged, _ = Cart.merge_guest_lines(buyer, lines)
+            merge_times.append(time.perf_counter() - started)
+            merged_lines += merged
+        for buyer in buyers:
+            Cart.clear(buyer)
+    merge_times.sort()
+    print(f'merge at login: {merged_lines / max(len(buyers), 1):.0f} lines per cart, latency ms ' + ', '.join(
+        f'p{p} {1000 * percentile(merge_times, p):.1f}' for p in (50, 90, 99)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
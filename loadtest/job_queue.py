@@ -0,0 +1,71 @@
+"""Throughput of the background job queue.
+
+    python -m loadtest.job_queue --jobs 20000 --threads 1 8 32
+
+Queues `--jobs` recompute_availability jobs (cheap, so the queue itself
+is what is measured), then drains them with an in-process JobWorker per
+thread count, as `python worker.py --threads N` would.  Reports jobs per
+second and the worker's own per-kind metrics (run and wait percentiles).
+Run it with no other worker attached to the database, or they will take
+some of the jobs.
+"""
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.job_queue',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--jobs', type=int, default=20000, help='jobs per run (default: 20000)')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32], help='thread counts (default: 1 8 32)')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.jobs import JobWorker
+    app = create_app()
+
+    with app.app_context():
+        products = [r[0] for r in app.db.execute('SELECT id FROM Products ORDER BY id LIMIT 1000')]
+        if not products:
+            print('no products; load db/generated first', file=sys.stderr)
+            return 1
+
+    print(f'{args.jobs} recompute_availability jobs per run', flush=True)
+    print(f'{"threads":>7} {"jobs/s":>8} {"run p50/p99 ms":>16} {"wait p50/p99 ms":>17}')
+    for threads in args.threads:
+        with app.app_context():
+            app.db.execute('''
+INSERT INTO jobs (kind, payload, max_attempts)
+SELECT 'recompute_availability', jsonb_build_object('product_id', p), 1
+FROM unnest(CAST(:products AS INT[])) AS p, generate_series(1, :copies)
+LIMIT :n
+''', products=products, copies=-(-args.jobs // len(products)), n=args.jobs)
+
+        worker = JobWorker(app, threads, ['recompute_availability'])
+        runner = threading.Thread(target=worker.run)
+        started = time.perf_counter()
+        runner.start()
+        while True:
+            time.sleep(0.05)
+            stats = worker.metrics.snapshot().get('recompute_availability')
+            if stats and stats['done'] + stats['dead'] >= args.jobs:
+                break
+        elapsed = time.perf_counter() - started
+        worker.stop()
+        runner.join()
+        print(f'{threads:>7} {stats["done"] / elapsed:>8.0f} '
+              f'{stats["run_ms"]["p50"]:>7.1f} / {stats["run_ms"]["p99"]:<6.1f}'
+              f'{stats["wait_ms"]["p50"]:>8.1f} / {stats["wait_ms"]["p99"]:.1f}', flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
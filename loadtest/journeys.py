@@ -0,0 +1,117 @@
+"""User journeys and the database sample they draw ids from.
+
+A journey is a function (session, data, rng) that makes the requests one
+visitor would make in a row.  session.get/post record each request under
+the endpoint name passed in, and raise StepFailed when the response is
+not what a real visitor would get, which ends the journey.
+"""
+
+SHIPPING = {"street": "1 Main St", "city": "Durham", "state": "NC", "zip_code": "27708", "apt": ""}
+PAYMENT = dict(SHIPPING, card_number="4111 1111 1111 1111", expiration="12/30", cvv="123")
+
+
+def browse(session, data, rng):
+    """Home page, a later page of it, then a couple of product pages."""
+    session.get('index.index', '/')
+    session.get('index.index', f'/?page={rng.randint(2, 10)}')
+    for product_id in rng.sample(data['product_ids'], k=min(2, len(data['product_ids']))):
+        session.get('products.detail', f'/products/{product_id}')
+
+
+def search(session, data, rng):
+    """Keyword search, optionally filtered by rating, then one result."""
+    term = rng.choice(data['terms'])
+    session.get('index.index (search)', f'/?q={term}')
+    if rng.random() < 0.3:
+        session.get('index.index (search)', f'/?q={term}&rating_threshold=4&sort=price_desc')
+    session.get('products.detail', f"/products/{rng.choice(data['product_ids'])}")
+
+
+def buy(session, data, rng):
+    """Look at a listing, add it to the cart and pay for the cart."""
+    buyer = session.login('buyer')
+    listing = rng.choice(data['listings'])
+    session.get('products.detail', f"/products/{listing['product_id']}")
+    session.post('cart.add_item', f"/cart/{buyer['id']}/add",
+                 json_body={"listing_id": listing['id'], "quantity": 1})
+    session.get('cart.payment', f"/cart/{buyer['id']}/payment")
+    # a successful payment redirects to the new order; a failed one re-renders the form
+    session.post('cart.payment', f"/cart/{buyer['id']}/payment", form=PAYMENT, expect=(302,))
+
+
+def seller(session, data, rng):
+    """Open the fulfillment queue and move one item along."""
+    seller_user = session.login('seller')
+    items = data['order_items'].get(seller_user['id'])
+    session.get('cart.seller_orders_view', f"/cart/seller/{seller_user['id']}/fulfillment")
+    if items:
+        item_id = rng.choice(items)
+        status = rng.choice(['Shipped', 'Delivered'])
+        session.post('cart.update_item_status',
+                     f"/cart/seller/{seller_user['id']}/fulfillment/{item_id}/status",
+                     form={"status": status}, expect=(302,))
+
+
+JOURNEYS = {
+    "browse": browse,
+    "search": search,
+    "buy": buy,
+    "seller": seller,
+}
+DEFAULT_MIX = {"browse": 50, "search": 30, "buy": 15, "seller": 5}
+
+
+def sample_data(app, users, password, verify=False):
+    """Pick products, search terms, in-stock listings, buyers who can afford
+    a few orders and sellers with order items.  verify=True marks the
+    sampled accounts' emails as verified so they can log in over HTTP."""
+    db = app.db
+    with app.app_context():
+        product_ids = [r[0] for r in db.execute('''
+SELECT DISTINCT product_id
+FROM ProductSeller
+WHERE is_active AND quantity > 0
+LIMIT 5000
+''')]
+        names = db.execute('''
+SELECT name FROM Products WHERE id = ANY(:ids)
+''', ids=product_ids[:500])
+        listings = [{"id": r[0], "product_id": r[1]} for r in db.execute('''
+SELECT id, product_id
+FROM ProductSeller
+WHERE is_active AND quantity >= 100
+ORDER BY quantity DESC
+LIMIT 2000
+''')]
+        buyers = [{"id": r[0], "email": r[1]} for r in db.execute('''
+SELECT id, email
+FROM Users
+WHERE balance >= 10000
+ORDER BY balance DESC
+LIMIT :n
+''', n=users)]
+        seller_rows = db.execute('''
+SELECT s.id, s.email, ARRAY(SELECT oi.id FROM OrderItems oi
+                            WHERE oi.seller_id = s.id
+                            ORDER BY oi.id DESC
+                            LIMIT 50)
+FROM (SELECT DISTINCT seller_id FROM ProductSeller LIMIT :n) ps
+JOIN Users s ON s.id = ps.seller_id
+''', n=users)
+        if verify:
+            db.execute('''
+UPDATE Users SET email_verified = TRUE WHERE id = ANY(:ids)
+''', ids=[b['id'] for b in buyers] + [r[0] for r in seller_rows])
+
+    terms = sorted({word.lower() for (name,) in names for word in name.split() if len(word) > 3 and word.isalpha()})
+    sellers = [{"id": r[0], "email": r[1]} for r in seller_rows]
+    for user in buyers + sellers:
+        user['password'] = password
+    return {
+        "product_ids": product_ids,
+        "terms": terms or ['a'],
+        "listings": listings,
+        "buyers": buyers,
+        "sellers": sellers,
+        "order_items": {r[0]: list(r[2]) for r in seller_rows if r[2]},
+    }
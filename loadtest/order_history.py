@@ -0,0 +1,157 @@
+"""Order list latency for a buyer with thousands of orders.
+
+    python -m loadtest.order_history --orders 5000 --requests 50
+
+Seeds one buyer with `--orders` orders of one to three items each (with
+the item summaries on Orders filled in, as checkout writes them), then
+times, through the app's real routes with Flask's test client:
+
+  home panel  GET /home/orders?page=N (index.orders_panel), first and
+              last page, with the per-user page cache cleared before each
+              request so every one is rendered
+  my orders   GET /cart/<id>/orders?page=N (cart.orders), first and last page
+  legacy      the order list query before the summaries were stored: every
+              order LEFT JOINed to its items and grouped
+
+and prints p50/p99 and the queries per request.  The seeded orders are
+deleted afterwards unless --keep is given.
+"""
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .clients import InProcessClient
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LEGACY_SQL = '''
+SELECT o.id, o.user_id, o.created_at, o.status, o.total_amount,
+       COALESCE(COUNT(oi.id), 0) AS item_count,
+       COALESCE(SUM(CASE WHEN oi.fulfilled THEN 1 ELSE 0 END), 0) AS fulfilled_count,
+       MAX(oi.fulfillment_status) AS primary_fulfillment_status
+FROM Orders o
+LEFT JOIN OrderItems oi ON o.id = oi.order_id
+WHERE o.user_id = :user_id
+GROUP BY o.id, o.user_id, o.created_at, o.status, o.total_amount
+ORDER BY o.created_at DESC
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.order_history',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--orders', type=int, default=5000, help='orders to seed (default: 5000)')
+    parser.add_argument('--requests', type=int, default=50, help='requests per measurement (default: 50)')
+    parser.add_argument('--keep', action='store_true', help='keep the seeded orders')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    app = create_app()
+
+    with app.app_context():
+        listings = app.db.execute('''
+SELECT id, seller_id, product_id, price FROM ProductSeller WHERE is_active ORDER BY id LIMIT 50
+''')
+        if not listings:
+            print('no listings; load db/generated first', file=sys.stderr)
+            return 1
+        buyer = app.db.execute('''
+SELECT id FROM Users WHERE id <> ALL(:sellers) ORDER BY id LIMIT 1
+''', sellers=sorted({row[1] for row in listings}))[0][0]
+        first_order = app.db.execute('SELECT COALESCE(MAX(id), 0) FROM Orders')[0][0]
+        started = time.perf_counter()
+        app.db.execute('''
+WITH lines AS (
+    SELECT n, k, l.id AS listing_id, l.seller_id, l.product_id, l.price,
+           k <= n % 3 AS fulfilled
+    FROM generate_series(1, :orders) AS n
+    CROSS JOIN LATERAL generate_series(1, 1 + n % 3) AS k
+    JOIN unnest(CAST(:listing_ids AS INT[]), CAST(:seller_ids AS INT[]), CAST(:product_ids AS INT[]),
+                CAST(:prices AS DECIMAL[])) WITH ORDINALITY AS l(id, seller_id, product_id, price, i)
+      ON l.i = 1 + (n * 7 + k) % :listing_count
+),
+orders AS (
+    INSERT INTO Orders (user_id, created_at, status, total_amount, shipping_street,
+                        item_count, fulfilled_count, fulfillment_status)
+    SELECT :buyer, now() - n * INTERVAL '1 hour', 'pending', SUM(price), 'Benchmark St',
+           COUNT(*), COUNT(*) FILTER (WHERE fulfilled),
+           CASE WHEN bool_and(fulfilled) THEN 'Delivered'
+                WHEN bool_or(fulfilled) THEN 'Shipped' ELSE 'Order Placed' END
+    FROM lines
+    GROUP BY n
+    RETURNING id, created_at
+)
+INSERT INTO OrderItems (order_id, listing_id, seller_id, product_id, unit_price, quantity, subtotal,
+                        fulfilled, fulfilled_at, fulfillment_status)
+SELECT o.id, l.listing_id, l.seller_id, l.product_id, l.price, 1, l.price,
+       l.fulfilled, CASE WHEN l.fulfilled THEN now() END,
+       CASE WHEN l.fulfilled THEN 'Delivered' ELSE 'Order Placed' END
+FROM lines l
+JOIN orders o ON o.created_at = now() - l.n * INTERVAL '1 hour'
+''', orders=args.orders, buyer=buyer, listing_count=len(listings),
+                       listing_ids=[r[0] for r in listings], seller_ids=[r[1] for r in listings],
+                       product_ids=[r[2] for r in listings], prices=[r[3] for r in listings])
+        app.db.execute('ANALYZE Orders')
+        app.db.execute('ANALYZE OrderItems')
+        total = app.db.execute('SELECT COUNT(*) FROM Orders WHERE user_id = :buyer', buyer=buyer)[0][0]
+    print(f'buyer {buyer} has {total} orders (seeded in {time.perf_counter() - started:.1f}s); '
+          f'{args.requests} requests per row', flush=True)
+
+    client = InProcessClient(app)
+    client.login({"id": buyer})
+
+    def measure(path, before=None):
+        latencies, queries = [], []
+        for _ in range(args.requests):
+            if before:
+                before()
+            started = time.perf_counter()
+            response = client.request('GET', path)
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200:
+                raise RuntimeError(f'GET {path}: HTTP {response.status}')
+            queries.append(response.queries or 0)
+        latencies.sort()
+        return latencies, max(queries)
+
+    def legacy():
+        with app.app_context():
+            app.db.execute(LEGACY_SQL, user_id=buyer)
+
+    def uncached():
+        app.user_cache.invalidate(buyer)
+
+    rows = []
+    for label, path, per_page, before in (('home panel', '/home/orders', 10, uncached),
+                                          ('my orders', f'/cart/{buyer}/orders', 20, None)):
+        last = math.ceil(total / per_page)
+        for page in (1, last):
+            rows.append((f'{label} p{page}', *measure(f'{path}?page={page}', before)))
+    latencies = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        legacy()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    rows.append(('legacy query (all orders)', latencies, 1))
+
+    print(f'{"":<26} {"p50 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    for label, latencies, queries in rows:
+        print(f'{label:<26} {1000 * percentile(latencies, 50):>8.1f} {1000 * percentile(latencies, 99):>8.1f} '
+              f'{queries:>8}')
+
+    if not args.keep:
+        with app.app_context():
+            app.db.execute('DELETE FROM Orders WHERE id > :first_order AND user_id = :buyer',
+                           first_order=first_order, buyer=buyer)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
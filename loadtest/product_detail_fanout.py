@@ -0,0 +1,113 @@
+"""Product detail latency with query fan-out on and off.
+
+    python -m loadtest.product_detail_fanout --clients 4 --duration 20
+
+Requests the detail pages (GET /products/<id>) of the `--products` most
+reviewed products from `--clients` concurrent clients, logged in as
+buyers so the subscription and purchase lookups run too, for `--duration`
+seconds per mode: once with the page's independent queries fanned out
+over QUERY_FANOUT_WORKERS threads, once with them run one after another
+(as with QUERY_FANOUT_WORKERS=0).  Reports p50/p90/p99 latency for both,
+and the median per-query times from the Server-Timing header.  Read-only.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .clients import InProcessClient
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.product_detail_fanout',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients (default: 4)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per mode (default: 20)')
+    parser.add_argument('--warmup', type=float, default=3, help='unrecorded seconds per mode (default: 3)')
+    parser.add_argument('--products', type=int, default=50, help='products requested (default: 50)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    fanned = create_app()
+    sequential = create_app()
+    # what QUERY_FANOUT_WORKERS=0 does: QueryFanout runs each call inline
+    sequential.db.fanout_pool = None
+
+    with fanned.app_context():
+        products = [r[0] for r in fanned.db.execute('''
+SELECT product_id FROM product_reviews
+GROUP BY product_id
+ORDER BY COUNT(*) DESC
+LIMIT :n
+''', n=args.products)]
+        buyers = [r[0] for r in fanned.db.execute('SELECT id FROM Users ORDER BY id LIMIT :n', n=args.clients)]
+    if not products or not buyers:
+        print('no reviewed products; load db/generated first', file=sys.stderr)
+        return 1
+
+    def measure(app):
+        lock = threading.Lock()
+        latencies = []
+        timings = {}
+        recording = threading.Event()
+        stop = threading.Event()
+
+        def loop(i):
+            rng = random.Random(args.seed * 7919 + i)
+            client = InProcessClient(app)
+            client.login({"id": buyers[i % len(buyers)]})
+            done, spans = [], []
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = client.request('GET', f'/products/{rng.choice(products)}')
+                elapsed = time.perf_counter() - started
+                if response.status != 200:
+                    raise RuntimeError(f'HTTP {response.status}')
+                if recording.is_set():
+                    done.append(elapsed)
+                    spans.append(response.headers.get('Server-Timing', ''))
+            with lock:
+                latencies.extend(done)
+                for header in spans:
+                    for part in filter(None, header.split(', ')):
+                        name, _, duration = part.partition(';dur=')
+                        timings.setdefault(name, []).append(float(duration))
+
+        threads = [threading.Thread(target=loop, args=(i,)) for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        recording.set()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        latencies.sort()
+        return latencies, {name: sorted(values) for name, values in timings.items()}
+
+    print(f'{args.clients} clients, {len(products)} products, {args.duration:g}s per mode', flush=True)
+    results = {}
+    for name, app in (('fan-out', fanned), ('sequential', sequential)):
+        latencies, timings = results[name] = measure(app)
+        print(f'{name:>10}: {len(latencies) / args.duration:7.1f} req/s; latency ms ' + ', '.join(
+            f'p{p} {1000 * percentile(latencies, p):.1f}' for p in (50, 90, 99)), flush=True)
+        print(' ' * 12 + 'median ms: ' + ', '.join(
+            f'{span} {percentile(values, 50):.1f}' for span, values in sorted(timings.items())))
+    on, off = results['fan-out'][0], results['sequential'][0]
+    if on and off:
+        print('latency with fan-out vs sequential: ' + ', '.join(
+            f'p{p} {100 * (percentile(on, p) / percentile(off, p) - 1):+.0f}%' for p in (50, 99)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Many buyers racing for a few units of the same listings.
+
+    python -m loadtest.reservation_race --buyers 200 --listings 3 --stock 10
+
+Sets `--listings` in-stock listings to `--stock` units each, then starts
+`--buyers` buyers at once; each adds one unit of a random one of those
+listings to their cart and checks out, except for an `--abandon` share
+of them that leave the unit in their cart.  Holds are given a
+`--ttl`-second lifetime, so once the run is over the script waits for
+the abandoned holds to expire, sweeps them and checks that
+
+  * no listing sold more units than it had (and orders match the stock
+    that was taken),
+  * every checkout of a unit that was held succeeded,
+  * reserved is back to zero on every listing.
+
+Prints the counts and add/checkout latencies and exits non-zero if a
+check fails.  It changes stock and places real orders, so use a
+disposable database.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.reservation_race',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--buyers', type=int, default=200, help='concurrent buyers (default: 200)')
+    parser.add_argument('--listings', type=int, default=3, help='low-stock listings to fight over (default: 3)')
+    parser.add_argument('--stock', type=int, default=10, help='units per listing (default: 10)')
+    parser.add_argument('--abandon', type=float, default=0.2,
+                        help='share of buyers that never check out (default: 0.2)')
+    parser.add_argument('--ttl', type=int, default=3, help='hold lifetime in seconds (default: 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.cart import Cart
+    from app.models.user import User
+    app = create_app()
+    app.config['HOLD_TTL'] = args.ttl
+
+    with app.app_context():
+        listings = [r[0] for r in app.db.execute('''
+SELECT id FROM ProductSeller
+WHERE is_active AND quantity > 0
+ORDER BY id
+LIMIT :n
+''', n=args.listings)]
+        if len(listings) < args.listings:
+            print('not enough in-stock listings; load db/generated first', file=sys.stderr)
+            return 1
+        app.db.execute('''
+UPDATE ProductSeller SET quantity = :stock WHERE id = ANY(:listings)
+''', stock=args.stock, listings=listings)
+        buyers = [r[0] for r in app.db.execute('''
+SELECT id FROM Users
+WHERE id NOT IN (SELECT seller_id FROM ProductSeller WHERE id = ANY(:listings))
+ORDER BY id
+LIMIT :n
+''', listings=listings, n=args.buyers)]
+        for buyer in buyers:
+            Cart.clear(buyer)
+            User.add_balance(buyer, 10000)
+        first_item = app.db.execute('SELECT COALESCE(MAX(id), 0) FROM OrderItems')[0][0]
+    print(f'{len(buyers)} buyers racing for {args.stock} units of each of listings {listings}', flush=True)
+
+    lock = threading.Lock()
+    counts = {"held": 0, "sold_out": 0, "bought": 0, "abandoned": 0, "checkout_failed": 0, "error": 0}
+    add_latency = []
+    checkout_latency = []
+    start = threading.Barrier(len(buyers))
+
+    def buyer(user_id, rng):
+        listing_id = rng.choice(listings)
+        abandon = rng.random() < args.abandon
+        with app.app_context():
+            start.wait()
+            try:
+                started = time.perf_counter()
+                try:
+                    Cart.add_item(user_id, listing_id, 1)
+                except ValueError:
+                    with lock:
+                        counts['sold_out'] += 1
+                    return
+                with lock:
+                    counts['held'] += 1
+                    add_latency.append(time.perf_counter() - started)
+                if abandon:
+                    with lock:
+                        counts['abandoned'] += 1
+                    return
+                started = time.perf_counter()
+                try:
+                    Cart.checkout(user_id)
+                except ValueError as exc:
+                    print(f'buyer {user_id}: checkout failed: {exc}', file=sys.stderr)
+                    with lock:
+                        counts['checkout_failed'] += 1
+                    Cart.clear(user_id)
+                    return
+                with lock:
+                    counts['bought'] += 1
+                    checkout_latency.append(time.perf_counter() - started)
+            except Exception as exc:
+                print(f'buyer {user_id}: {exc!r}', file=sys.stderr)
+                with lock:
+                    counts['error'] += 1
+
+    threads = [threading.Thread(target=buyer, args=(user_id, random.Random(args.seed * 7919 + i)))
+               for i, user_id in enumerate(buyers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(', '.join(f'{k} {v}' for k, v in counts.items()) + f' in {elapsed:.2f}s')
+    for name, latencies in (('add', add_latency), ('checkout', checkout_latency)):
+        latencies.sort()
+        print(f'{name} latency ms: ' + ', '.join(
+            f'p{p} {1000 * percentile(latencies, p):.1f}' for p in (50, 90, 99)))
+
+    time.sleep(args.ttl + 1)
+    released = app.holds.sweep()
+    with app.app_context():
+        rows = app.db.execute('''
+SELECT ps.id, ps.quantity, ps.reserved,
+       (SELECT COALESCE(SUM(oi.quantity), 0) FROM OrderItems oi
+        WHERE oi.listing_id = ps.id AND oi.id > :first_item) AS ordered
+FROM ProductSeller ps
+WHERE ps.id = ANY(:listings)
+ORDER BY ps.id
+''', listings=listings, first_item=first_item)
+        for buyer_id in buyers:
+            Cart.clear(buyer_id)
+    print(f'released {released} expired holds')
+
+    failed = []
+    for listing_id, quantity, reserved, ordered in rows:
+        print(f'listing {listing_id}: {ordered} sold, {quantity} left, {reserved} reserved')
+        if quantity < 0 or ordered > args.stock:
+            failed.append(f'listing {listing_id} oversold')
+        if quantity + ordered != args.stock:
+            failed.append(f'listing {listing_id}: orders do not match stock taken')
+        if reserved != 0:
+            failed.append(f'listing {listing_id}: {reserved} units still reserved')
+    if counts['checkout_failed'] or counts['error']:
+        failed.append('checkouts of held units failed')
+    if sum(row[3] for row in rows) != counts['bought']:
+        failed.append('units ordered do not match successful checkouts')
+    for failure in failed:
+        print('FAIL: ' + failure)
+    if not failed:
+        print('OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Review page latency at 1M reviews: keyset vs OFFSET pagination.
+
+    python -m loadtest.review_pages --reviews 1000000 --products 10 --pages 1 10 100 1000
+
+Generates `--reviews` product reviews spread over `--products` products
+(one review per user and product, so each product needs reviews/products
+users; grow the dataset with db/generated/gen.py --users if it has
+fewer), with skewed helpful counts, a verified flag and creation times
+over two years, then ANALYZEs the table.  For the product with the most
+reviews and each ordering, times fetching page N (8 reviews, as the
+product page shows) three ways:
+
+  keyset  ProductReview.get_for_product with the cursor of page N-1
+  offset  ProductReview.get_for_product with page=N (LIMIT/OFFSET over
+          the same index)
+  legacy  the listing query before stored helpful counts: aggregate
+          review_votes, probe Purchases per row, rank every review, then
+          LIMIT/OFFSET
+
+and prints the median over `--rounds`.  No votes are generated, so
+legacy is a lower bound.  The generated reviews are deleted afterwards
+unless --keep is given.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+PER_PAGE = 8
+
+LEGACY_SQL = '''
+WITH aggregated AS (
+    SELECT pr.product_review_id, pr.product_id, pr.user_id, pr.rating, pr.body, pr.created_at,
+           u.firstname, u.lastname,
+           COALESCE(SUM(rv.vote), 0) AS helpful_count,
+           MAX(CASE WHEN rv.user_id = 0 THEN 1 ELSE 0 END) AS user_voted,
+           MAX(CASE WHEN EXISTS (
+                     SELECT 1 FROM Purchases pu
+                     WHERE pu.uid = pr.user_id AND pu.pid = pr.product_id
+                   ) THEN 1 ELSE 0 END) AS verified
+    FROM product_reviews pr
+    JOIN Users u ON u.id = pr.user_id
+    LEFT JOIN review_votes rv
+           ON rv.review_type = 'product'
+          AND rv.review_id = pr.product_review_id
+    WHERE pr.product_id = :product_id
+    GROUP BY pr.product_review_id, u.firstname, u.lastname
+),
+ranked AS (
+    SELECT *, ROW_NUMBER() OVER (ORDER BY helpful_count DESC, created_at DESC) AS helpful_rank
+    FROM aggregated
+)
+SELECT * FROM ranked
+{order}
+LIMIT :limit OFFSET :offset
+'''
+
+LEGACY_ORDER = {
+    'helpful': 'ORDER BY CASE WHEN helpful_rank <= 3 THEN 0 ELSE 1 END, helpful_rank, created_at DESC',
+    'recent': 'ORDER BY created_at DESC',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.review_pages',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--reviews', type=int, default=1000000, help='reviews to generate (default: 1000000)')
+    parser.add_argument('--products', type=int, default=10, help='products they go to (default: 10)')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='pages to time (default: 1 10 100 1000)')
+    parser.add_argument('--rounds', type=int, default=5, help='timings per measurement (default: 5)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated reviews')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.models.product_review import ProductReview
+    app = create_app()
+
+    per_product = -(-args.reviews // args.products)
+    with app.app_context():
+        users = app.db.execute('SELECT COUNT(*) FROM Users')[0][0]
+        if users < per_product:
+            print(f'{args.reviews} reviews over {args.products} products need {per_product} users, '
+                  f'the database has {users}; add products or users', file=sys.stderr)
+            return 1
+        # the products with the fewest reviews, so the unique (product, user) key leaves room
+        products = [r[0] for r in app.db.execute('''
+SELECT p.id FROM Products p
+LEFT JOIN product_reviews pr ON pr.product_id = p.id
+GROUP BY p.id
+ORDER BY COUNT(pr.product_review_id), p.id
+LIMIT :n
+''', n=args.products)]
+        first_id = app.db.execute('SELECT COALESCE(MAX(product_review_id), 0) FROM product_reviews')[0][0]
+        started = time.perf_counter()
+        app.db.execute('''
+INSERT INTO product_reviews (product_id, user_id, rating, body, created_at, helpful_count, verified)
+SELECT p, u.id, 1 + floor(random() * 5)::int, 'Generated review ' || u.id,
+       now() - random() * INTERVAL '730 days', floor(power(random(), 8) * 500)::int, random() < 0.6
+FROM unnest(CAST(:products AS INT[])) AS p
+CROSS JOIN LATERAL (SELECT id FROM Users ORDER BY id LIMIT :per_product) u
+ON CONFLICT (product_id, user_id) DO NOTHING
+''', products=products, per_product=per_product)
+        app.db.execute('ANALYZE product_reviews')
+        generated = app.db.execute('SELECT COUNT(*) FROM product_reviews WHERE product_review_id > :first_id',
+                                   first_id=first_id)[0][0]
+        product_id, total = app.db.execute('''
+SELECT product_id, COUNT(*) FROM product_reviews
+WHERE product_id = ANY(:products)
+GROUP BY product_id
+ORDER BY COUNT(*) DESC
+LIMIT 1
+''', products=products)[0]
+    print(f'generated {generated} reviews in {time.perf_counter() - started:.0f}s; '
+          f'timing product {product_id} ({total} reviews), {PER_PAGE} per page, median of {args.rounds}',
+          flush=True)
+
+    def median_ms(run):
+        times = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - started)
+        return 1000 * statistics.median(times)
+
+    try:
+        with app.app_context():
+            print(f'{"ordering":<8} {"page":>6} {"keyset ms":>10} {"offset ms":>10} {"legacy ms":>10}')
+            for sort in ('helpful', 'recent'):
+                for page in args.pages:
+                    cursor = None
+                    if page > 1:
+                        before = ProductReview.get_for_product(product_id, per_page=PER_PAGE, page=page - 1, sort=sort)
+                        if len(before) < PER_PAGE:
+                            continue
+                        cursor = ProductReview.cursor_for(before[-1], sort)
+                    keyset = median_ms(lambda: ProductReview.get_for_product(
+                        product_id, per_page=PER_PAGE, sort=sort, cursor=cursor))
+                    offset = median_ms(lambda: ProductReview.get_for_product(
+                        product_id, per_page=PER_PAGE, page=page, sort=sort))
+                    legacy = median_ms(lambda: app.db.execute(
+                        LEGACY_SQL.format(order=LEGACY_ORDER[sort]), product_id=product_id,
+                        limit=PER_PAGE, offset=(page - 1) * PER_PAGE))
+                    print(f'{sort:<8} {page:>6} {keyset:>10.1f} {offset:>10.1f} {legacy:>10.1f}', flush=True)
+    finally:
+        if not args.keep:
+            with app.app_context():
+                app.db.execute('DELETE FROM product_reviews WHERE product_review_id > :first_id', first_id=first_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import json
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+PERCENTILES = (50, 90, 95, 99)
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Recorder:
+    """Thread-safe per-endpoint samples: latencies, statement counts, errors."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.journeys = {}
+        self.recording = False
+
+    def add(self, route, seconds, queries, error):
+        if not self.recording:
+            return
+        with self._lock:
+            entry = self.routes.setdefault(route, {"latencies": [], "queries": [], "errors": 0})
+            entry['latencies'].append(seconds)
+            if queries is not None:
+                entry['queries'].append(queries)
+            entry['errors'] += bool(error)
+
+    def finish_journey(self, name, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            entry = self.journeys.setdefault(name, {"completed": 0, "failed": 0})
+            entry['completed' if ok else 'failed'] += 1
+
+
+class Session:
+    """One virtual user's view of the app: a logged-in client per role,
+    created on first use and kept for the rest of the run."""
+    def __init__(self, make_client, recorder, identities):
+        self.make_client = make_client
+        self.recorder = recorder
+        self.identities = identities
+        self.anonymous = make_client()
+        self.clients = {}
+        self.client = self.anonymous
+
+    def login(self, role):
+        user = self.identities.get(role)
+        if user is None:
+            raise StepFailed(f'no {role} account available')
+        if role not in self.clients:
+            client = self.make_client()
+            client.login(user)
+            self.clients[role] = client
+        self.client = self.clients[role]
+        return user
+
+    def get(self, route, path, expect=(200,)):
+        return self._request(route, 'GET', path, expect=expect)
+
+    def post(self, route, path, form=None, json_body=None, expect=(200,)):
+        return self._request(route, 'POST', path, form=form, json_body=json_body, expect=expect)
+
+    def _request(self, route, method, path, expect, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.client.request(method, path, **kwargs)
+        except Exception as exc:
+            self.recorder.add(route, time.perf_counter() - started, None, True)
+            raise StepFailed(f'{method} {path}: {exc}') from exc
+        elapsed = time.perf_counter() - started
+        error = response.status not in expect
+        self.recorder.add(route, elapsed, response.queries, error)
+        if error:
+            raise StepFailed(f'{method} {path}: HTTP {response.status}')
+        return response
+
+
+def run(make_client, data, journeys, mix, users, duration, warmup=0, seed=0, think=0.0):
+    """Run `users` virtual users for warmup + duration seconds and return the
+    recorder; only requests after the warmup are recorded."""
+    recorder = Recorder()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stop = threading.Event()
+    failures = []
+
+    def virtual_user(index):
+        rng = random.Random(seed * 100003 + index)
+        identities = {
+            "buyer": data['buyers'][index % len(data['buyers'])] if data['buyers'] else None,
+            "seller": data['sellers'][index % len(data['sellers'])] if data['sellers'] else None,
+        }
+        session = Session(make_client, recorder, identities)
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            session.client = session.anonymous
+            try:
+                journeys[name](session, data, rng)
+            except StepFailed as exc:
+                recorder.finish_journey(name, False)
+                if len(failures) < 20:
+                    failures.append(f'{name}: {exc}')
+            else:
+                recorder.finish_journey(name, True)
+            if think:
+                stop.wait(rng.expovariate(1 / think))
+
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(duration)
+    recorder.recording = False
+    recorder.elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    recorder.failures = failures
+    return recorder
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, config):
+    routes = {}
+    for route, entry in sorted(recorder.routes.items()):
+        latencies = sorted(entry['latencies'])
+        queries = entry['queries']
+        count = len(latencies)
+        routes[route] = {
+            "requests": count,
+            "rps": count / recorder.elapsed,
+            "error_rate": entry['errors'] / count if count else 0.0,
+            "mean_ms": 1000 * sum(latencies) / count if count else 0.0,
+            **{f"p{p}_ms": 1000 * percentile(latencies, p) for p in PERCENTILES},
+            "max_ms": 1000 * latencies[-1] if latencies else 0.0,
+            "queries_mean": sum(queries) / len(queries) if queries else None,
+            "queries_max": max(queries) if queries else None,
+        }
+    total = sum(r['requests'] for r in routes.values())
+    errors = sum(r['error_rate'] * r['requests'] for r in routes.values())
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "commit": _git_commit(),
+        "config": config,
+        "elapsed_s": recorder.elapsed,
+        "total": {"requests": total, "rps": total / recorder.elapsed,
+                  "error_rate": errors / total if total else 0.0},
+        "journeys": recorder.journeys,
+        "routes": routes,
+    }
+
+
+def format_report(result):
+    lines = [f"{'endpoint':28} {'reqs':>7} {'req/s':>8} {'err%':>6} {'mean':>8} "
+             + ' '.join(f'{"p" + str(p):>8}' for p in PERCENTILES) + f" {'queries':>8}"]
+    for route, r in result['routes'].items():
+        queries = f"{r['queries_mean']:.1f}" if r['queries_mean'] is not None else '-'
+        lines.append(f"{route:28} {r['requests']:>7} {r['rps']:>8.1f} {100 * r['error_rate']:>6.1f} "
+                     f"{r['mean_ms']:>8.1f} " + ' '.join(f"{r[f'p{p}_ms']:>8.1f}" for p in PERCENTILES)
+                     + f" {queries:>8}")
+    total = result['total']
+    lines.append(f"{'total':28} {total['requests']:>7} {total['rps']:>8.1f} {100 * total['error_rate']:>6.1f}")
+    lines.append('journeys: ' + ', '.join(f"{name} {j['completed']} ok / {j['failed']} failed"
+                                          for name, j in sorted(result['journeys'].items())))
+    lines.append('(latencies in ms; queries = database statements per request)')
+    return '\n'.join(lines)
+
+
+def save(result, name):
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f'{name}.json'
+    path.write_text(json.dumps(result, indent=2) + '\n')
+    return path
+
+
+def load(name):
+    path = Path(name)
+    if not path.exists():
+        path = RESULTS_DIR / f'{name}.json'
+    return json.loads(path.read_text())
+
+
+def compare(baseline, result, threshold):
+    """Report per-endpoint changes against a saved run.  Returns the lines
+    and the endpoints whose p95 latency or statement count grew by more
+    than `threshold` (a fraction), or whose error rate went up."""
+    lines = [f"{'endpoint':28} {'p95 before':>11} {'p95 now':>9} {'change':>8} "
+             f"{'req/s change':>13} {'queries':>13}"]
+    regressions = []
+    for route, now in result['routes'].items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            lines.append(f'{route:28} (new)')
+            continue
+        p95_change = _change(before['p95_ms'], now['p95_ms'])
+        rps_change = _change(before['rps'], now['rps'])
+        queries = f"{_fmt(before['queries_mean'])} -> {_fmt(now['queries_mean'])}"
+        flag = ''
+        if (p95_change > threshold
+                or now['error_rate'] > before['error_rate'] + 0.01
+                or (before['queries_mean'] and now['queries_mean']
+                    and _change(before['queries_mean'], now['queries_mean']) > threshold)):
+            regressions.append(route)
+            flag = '  REGRESSION'
+        lines.append(f"{route:28} {before['p95_ms']:>11.1f} {now['p95_ms']:>9.1f} {100 * p95_change:>+7.0f}% "
+                     f"{100 * rps_change:>+12.0f}% {queries:>13}{flag}")
+    return lines, regressions
+
+
+def _change(before, now):
+    return (now - before) / before if before else 0.0
+
+
+def _fmt(value):
+    return f'{value:.1f}' if value is not None else '-'
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=RESULTS_DIR.parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
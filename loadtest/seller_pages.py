@@ -0,0 +1,187 @@
+"""Queries and latency of the seller review pages as reviews pile up.
+
+    python -m loadtest.seller_pages --reviews 10000 --requests 50
+
+For one seller, requests through the app's real routes (Flask's test
+client, which reports each request's statement count in X-DB-Queries):
+
+  public reviews  GET /sellers/<id>/reviews (social.public_seller_reviews),
+                  first and last page, logged out
+  review form     GET /sellers/<id>/review (social.seller_review), as a
+                  buyer who is not the seller
+  profile         GET /user/<id> (users.public_profile)
+  inventory       GET /sellers/<id>/inventory (seller_inventory), as the seller
+
+once with the seller's existing reviews and again after adding up to
+`--reviews` more (one per user, as the unique key allows).  Every route
+must issue the same number of queries both times and on every page; any
+that does not is reported and the exit status is 1.  Latency p50/p99 of
+the second round is printed next to the seller review query the pages ran
+before stored helpful counts and verified flags (aggregate review_votes,
+probe Purchases per row, rank every review).  The added reviews are
+deleted afterwards unless --keep is given.
+"""
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .clients import InProcessClient
+from .runner import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+PER_PAGE = 10
+
+LEGACY_SQL = '''
+WITH aggregated AS (
+    SELECT sr.seller_review_id, sr.seller_id, sr.user_id, sr.rating, sr.body, sr.created_at,
+           u.firstname, u.lastname,
+           COALESCE(SUM(rv.vote), 0) AS helpful_count,
+           MAX(CASE WHEN rv.user_id = 0 THEN 1 ELSE 0 END) AS user_voted,
+           MAX(CASE WHEN EXISTS (
+                     SELECT 1
+                     FROM Purchases pu
+                     JOIN ProductSeller ps ON pu.pid = ps.product_id
+                     WHERE pu.uid = sr.user_id AND ps.seller_id = sr.seller_id
+                   ) THEN 1 ELSE 0 END) AS verified
+    FROM seller_reviews sr
+    JOIN Users u ON sr.user_id = u.id
+    LEFT JOIN review_votes rv
+           ON rv.review_type = 'seller'
+          AND rv.review_id = sr.seller_review_id
+    WHERE sr.seller_id = :seller_id
+    GROUP BY sr.seller_review_id, u.firstname, u.lastname
+),
+ranked AS (
+    SELECT *, ROW_NUMBER() OVER (ORDER BY helpful_count DESC, created_at DESC) AS helpful_rank
+    FROM aggregated
+)
+SELECT * FROM ranked
+ORDER BY CASE WHEN helpful_rank <= 3 THEN 0 ELSE 1 END, helpful_rank, created_at DESC
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.seller_pages',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--reviews', type=int, default=10000, help='seller reviews to add (default: 10000)')
+    parser.add_argument('--requests', type=int, default=50, help='requests per measurement (default: 50)')
+    parser.add_argument('--keep', action='store_true', help='keep the added reviews')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    app = create_app()
+
+    with app.app_context():
+        rows = app.db.execute('''
+SELECT u.id, COUNT(ps.id)
+FROM Users u
+JOIN ProductSeller ps ON ps.seller_id = u.id
+WHERE u.is_seller
+GROUP BY u.id
+ORDER BY COUNT(ps.id) DESC, u.id
+LIMIT 1
+''')
+        if not rows:
+            print('no sellers with listings; load db/generated first', file=sys.stderr)
+            return 1
+        seller = rows[0][0]
+        buyer = app.db.execute('SELECT id FROM Users WHERE id <> :seller ORDER BY id LIMIT 1',
+                               seller=seller)[0][0]
+        first_id = app.db.execute('SELECT COALESCE(MAX(seller_review_id), 0) FROM seller_reviews')[0][0]
+
+    anonymous = InProcessClient(app)
+    as_buyer = InProcessClient(app)
+    as_buyer.login({"id": buyer})
+    as_seller = InProcessClient(app)
+    as_seller.login({"id": seller})
+
+    def review_count():
+        with app.app_context():
+            return app.db.execute('SELECT COUNT(*) FROM seller_reviews WHERE seller_id = :seller',
+                                  seller=seller)[0][0]
+
+    def measure(client, path, requests):
+        latencies, queries = [], set()
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.request('GET', path)
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200:
+                raise RuntimeError(f'GET {path}: HTTP {response.status}')
+            queries.add(response.queries)
+        latencies.sort()
+        return latencies, queries
+
+    def round_of(requests):
+        """{route: (latencies, query counts)}, the first and last review
+        page counting as one route."""
+        last = max(1, math.ceil(review_count() / PER_PAGE))
+        routes = {}
+        for route, client, paths in (
+                ('public reviews', anonymous, [f'/sellers/{seller}/reviews?page=1',
+                                               f'/sellers/{seller}/reviews?page={last}']),
+                ('review form', as_buyer, [f'/sellers/{seller}/review']),
+                ('profile', anonymous, [f'/user/{seller}']),
+                ('inventory', as_seller, [f'/sellers/{seller}/inventory'])):
+            latencies, queries = [], set()
+            for path in paths:
+                page_latencies, page_queries = measure(client, path, requests)
+                latencies += page_latencies
+                queries |= page_queries
+            routes[route] = (sorted(latencies), queries)
+        return routes
+
+    try:
+        before_reviews = review_count()
+        before = round_of(3)
+        started = time.perf_counter()
+        with app.app_context():
+            app.db.execute('''
+INSERT INTO seller_reviews (seller_id, user_id, rating, body, created_at, helpful_count, verified)
+SELECT :seller, id, 1 + floor(random() * 5)::int, 'Generated review ' || id,
+       now() - random() * INTERVAL '730 days', floor(power(random(), 8) * 500)::int, random() < 0.6
+FROM Users
+WHERE id <> :seller
+ORDER BY id
+LIMIT :reviews
+ON CONFLICT (seller_id, user_id) DO NOTHING
+''', seller=seller, reviews=args.reviews)
+            app.db.execute('ANALYZE seller_reviews')
+        after_reviews = review_count()
+        print(f'seller {seller}: {before_reviews} reviews, then {after_reviews} '
+              f'(added in {time.perf_counter() - started:.1f}s); {args.requests} requests per page', flush=True)
+        after = round_of(args.requests)
+
+        legacy = []
+        with app.app_context():
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                app.db.execute(LEGACY_SQL, seller_id=seller)
+                legacy.append(time.perf_counter() - started)
+        legacy.sort()
+
+        failed = False
+        print(f'{"":<16} {"p50 ms":>8} {"p99 ms":>8} {"queries":>16}')
+        for route, (latencies, queries) in after.items():
+            counts = before[route][1] | queries
+            fixed = len(counts) == 1
+            failed |= not fixed
+            print(f'{route:<16} {1000 * percentile(latencies, 50):>8.1f} {1000 * percentile(latencies, 99):>8.1f} '
+                  f'{"/".join(str(q) for q in sorted(counts)):>16}{"" if fixed else "  NOT FIXED"}')
+        print(f'{"legacy query":<16} {1000 * percentile(legacy, 50):>8.1f} {1000 * percentile(legacy, 99):>8.1f} '
+              f'{1:>16}')
+    finally:
+        if not args.keep:
+            with app.app_context():
+                app.db.execute('DELETE FROM seller_reviews WHERE seller_review_id > :first_id AND seller_id = :seller',
+                               first_id=first_id, seller=seller)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
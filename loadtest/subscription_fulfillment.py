@@ -0,0 +1,116 @@
+"""Throughput of the subscription fulfillment scheduler.
+
+    python -m loadtest.subscription_fulfillment --subscriptions 100000 --workers 1 4 8
+
+Makes `--subscriptions` weekly subscriptions due (creating them over the
+first in-stock products and enough users), tops up those users' balances
+and the listings' stock so every delivery can be ordered, then times
+`flask subscriptions fulfill` (SubscriptionFulfiller) draining them with
+each worker count.  Reports deliveries per second, orders placed and
+deliveries deferred, and checks that no subscription was ordered twice
+in a run.  It places real orders and moves stock and balances; use a
+disposable database.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest.subscription_fulfillment',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('--subscriptions', type=int, default=100000, help='due subscriptions (default: 100000)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8], help='worker counts (default: 1 4 8)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='subscriptions per batch (default: 1000)')
+    parser.add_argument('--products', type=int, default=200, help='products subscribed to (default: 200)')
+    args = parser.parse_args()
+
+    load_dotenv(ROOT / '.flaskenv')
+    from app import create_app
+    from app.subscriptions import SubscriptionFulfiller
+    app = create_app()
+
+    with app.app_context():
+        products = [r[0] for r in app.db.execute('''
+SELECT DISTINCT product_id FROM ProductSeller
+WHERE is_active AND NOT flash_sale
+ORDER BY product_id
+LIMIT :n
+''', n=args.products)]
+        if not products:
+            print('no listed products; load db/generated first', file=sys.stderr)
+            return 1
+        users_needed = -(-args.subscriptions // len(products))
+        users = [r[0] for r in app.db.execute('SELECT id FROM Users ORDER BY id LIMIT :n', n=users_needed)]
+        if len(users) * len(products) < args.subscriptions:
+            print(f'need {users_needed} users for {args.subscriptions} subscriptions', file=sys.stderr)
+            return 1
+        app.db.execute('''
+INSERT INTO Subscriptions (user_id, product_id, frequency, active)
+SELECT u, p, 'weekly', TRUE
+FROM unnest(CAST(:users AS INT[])) AS u, unnest(CAST(:products AS INT[])) AS p
+ORDER BY u, p
+LIMIT :n
+ON CONFLICT (user_id, product_id) DO NOTHING
+''', users=users, products=products, n=args.subscriptions)
+        subscriptions = [r[0] for r in app.db.execute('''
+SELECT id FROM Subscriptions
+WHERE user_id = ANY(:users) AND product_id = ANY(:products)
+ORDER BY id
+LIMIT :n
+''', users=users, products=products, n=args.subscriptions)]
+        # nothing else due, so each run times exactly these subscriptions
+        app.db.execute('''
+UPDATE Subscriptions SET next_due_at = now() + INTERVAL '1 day'
+WHERE active AND next_due_at <= now() AND id <> ALL(:ids)
+''', ids=subscriptions)
+
+    print(f'{len(subscriptions)} due subscriptions over {len(products)} products, '
+          f'batches of {args.batch_size}', flush=True)
+    print(f'{"workers":>7} {"deliveries/s":>13} {"orders":>8} {"deferred":>9} {"seconds":>8}')
+    failed = False
+    for workers in args.workers:
+        with app.app_context():
+            app.db.execute('''
+UPDATE Subscriptions SET active = TRUE, next_due_at = now() - INTERVAL '1 day', last_error = NULL
+WHERE id = ANY(:ids)
+''', ids=subscriptions)
+            app.db.execute('''
+UPDATE ProductSeller SET quantity = quantity + :n
+WHERE product_id = ANY(:products) AND is_active AND NOT flash_sale
+''', n=len(subscriptions), products=products)
+            app.db.execute('''
+INSERT INTO balance_ledger (user_id, amount, kind)
+SELECT u, 100000, 'deposit' FROM unnest(CAST(:users AS INT[])) AS u
+''', users=users)
+            first_order = app.db.execute('SELECT COALESCE(MAX(id), 0) FROM Orders')[0][0]
+
+        started = time.perf_counter()
+        fulfilled, deferred, orders = SubscriptionFulfiller(app, args.batch_size).run(workers)
+        elapsed = time.perf_counter() - started
+        print(f'{workers:>7} {fulfilled / elapsed:>13.0f} {orders:>8} {deferred:>9} {elapsed:>8.1f}', flush=True)
+
+        with app.app_context():
+            twice = app.db.execute('''
+SELECT COUNT(*) FROM (
+    SELECT o.user_id, i.product_id
+    FROM Orders o JOIN OrderItems i ON i.order_id = o.id
+    WHERE o.id > :first_order
+    GROUP BY o.user_id, i.product_id
+    HAVING SUM(i.quantity) > 1
+) d
+''', first_order=first_order)[0][0]
+        if twice or fulfilled + deferred != len(subscriptions):
+            print(f'FAIL: {fulfilled + deferred} of {len(subscriptions)} handled, '
+                  f'{twice} subscriptions ordered more than once')
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+-- One page of each list on the My Reviews page, newest first:
+--   'product'  - product reviews written by the user
+--   'seller'   - seller reviews written by the user
+--   'feedback' - reviews other users wrote about the user as a seller
+-- Each list continues after its own (created_at, review_id) cursor when one
+-- is given, and review totals come from review_counts, so the cost depends
+-- on the page size rather than on how many reviews the user has written.
+WITH product_page AS (
+    SELECT 'product' AS list,
+           pr.product_review_id AS review_id,
+           pr.product_id AS target_id,
+           p.name AS name,
+           pr.rating,
+           pr.body,
+           pr.created_at
+    FROM product_reviews pr
+    JOIN Products p ON p.id = pr.product_id
+    WHERE pr.user_id = :user_id
+      AND :type IN ('all', 'product')
+      AND (:min_rating IS NULL OR pr.rating >= :min_rating)
+      AND (:product_after IS NULL OR (pr.created_at, pr.product_review_id) < (:product_after, :product_after_id))
+    ORDER BY pr.created_at DESC, pr.product_review_id DESC
+    LIMIT :limit
+),
+seller_page AS (
+    SELECT 'seller' AS list,
+           sr.seller_review_id AS review_id,
+           sr.seller_id AS target_id,
+           u.firstname || ' ' || u.lastname AS name,
+           sr.rating,
+           sr.body,
+           sr.created_at
+    FROM seller_reviews sr
+    JOIN Users u ON u.id = sr.seller_id
+    WHERE sr.user_id = :user_id
+      AND :type IN ('all', 'seller')
+      AND (:min_rating IS NULL OR sr.rating >= :min_rating)
+      AND (:seller_after IS NULL OR (sr.created_at, sr.seller_review_id) < (:seller_after, :seller_after_id))
+    ORDER BY sr.created_at DESC, sr.seller_review_id DESC
+    LIMIT :limit
+),
+feedback_page AS (
+    SELECT 'feedback' AS list,
+           sr.seller_review_id AS review_id,
+           sr.user_id AS target_id,
+           u.firstname || ' ' || u.lastname AS name,
+           sr.rating,
+           sr.body,
+           sr.created_at
+    FROM seller_reviews sr
+    JOIN Users u ON u.id = sr.user_id
+    WHERE sr.seller_id = :user_id
+      AND :include_feedback
+      AND (:feedback_after IS NULL OR (sr.created_at, sr.seller_review_id) < (:feedback_after, :feedback_after_id))
+    ORDER BY sr.created_at DESC, sr.seller_review_id DESC
+    LIMIT :limit
+)
+SELECT pg.list,
+       pg.review_id,
+       pg.target_id,
+       pg.name,
+       COALESCE(rc.review_count, 0) AS review_count,
+       pg.rating,
+       pg.body,
+       pg.created_at
+FROM (
+    SELECT * FROM product_page
+    UNION ALL
+    SELECT * FROM seller_page
+    UNION ALL
+    SELECT * FROM feedback_page
+) pg
+LEFT JOIN review_counts rc
+       ON rc.review_type = CASE pg.list WHEN 'product' THEN 'product' ELSE 'seller' END
+      AND rc.target_id = CASE pg.list WHEN 'feedback' THEN :user_id ELSE pg.target_id END
+ORDER BY pg.list, pg.created_at DESC, pg.review_id DESC
@@ -1,31 +1,43 @@
-SELECT *
-FROM (
-    SELECT 'product' AS type,
-           pr.product_review_id AS review_id,
-           pr.product_id        AS target_id,
-           p.name               AS target_name,
-           (SELECT COUNT(*) FROM product_reviews pr2 WHERE pr2.product_id = pr.product_id) AS target_review_count,
-           pr.rating,
-           pr.body,
-           pr.created_at
-    FROM product_reviews pr
-    JOIN products p ON p.id = pr.product_id
-    WHERE pr.user_id = :user_id
+-- A user's most recent product and seller reviews, newest first, each with
+-- the total number of reviews its product/seller has (from review_counts).
+WITH recent AS (
+    SELECT *
+    FROM (
+        SELECT 'product' AS type,
+               pr.product_review_id AS review_id,
+               pr.product_id        AS target_id,
+               pr.rating,
+               pr.body,
+               pr.created_at
+        FROM product_reviews pr
+        WHERE pr.user_id = :user_id
+          AND :type IN ('all', 'product')
 
-    UNION ALL
+        UNION ALL
 
-    SELECT 'seller' AS type,
-           sr.seller_review_id AS review_id,
-           sr.seller_id        AS target_id,
-           (u.firstname || ' ' || u.lastname) AS target_name,
-           (SELECT COUNT(*) FROM seller_reviews sr2 WHERE sr2.seller_id = sr.seller_id) AS target_review_count,
-           sr.rating,
-           sr.body,
-           sr.created_at
-    FROM seller_reviews sr
-    JOIN users u ON u.id = sr.seller_id
-    WHERE sr.user_id = :user_id
-) AS all_feedback
-WHERE (:type = 'all' OR type = :type) 
-ORDER BY created_at DESC
-LIMIT :limit;
+        SELECT 'seller' AS type,
+               sr.seller_review_id AS review_id,
+               sr.seller_id        AS target_id,
+               sr.rating,
+               sr.body,
+               sr.created_at
+        FROM seller_reviews sr
+        WHERE sr.user_id = :user_id
+          AND :type IN ('all', 'seller')
+    ) AS all_feedback
+    ORDER BY created_at DESC
+    LIMIT :limit
+)
+SELECT r.type,
+       r.review_id,
+       r.target_id,
+       COALESCE(p.name, u.firstname || ' ' || u.lastname) AS target_name,
+       COALESCE(rc.review_count, 0) AS target_review_count,
+       r.rating,
+       r.body,
+       r.created_at
+FROM recent r
+LEFT JOIN review_counts rc ON rc.review_type = r.type AND rc.target_id = r.target_id
+LEFT JOIN products p ON r.type = 'product' AND p.id = r.target_id
+LEFT JOIN users u ON r.type = 'seller' AND u.id = r.target_id
+ORDER BY r.created_at DESC
@@ -0,0 +1,66 @@
+"""Runs background jobs from the jobs table (see app/jobs.py).
+
+    python worker.py --threads 4 --processes 2
+
+Starts `--processes` worker processes (default 1) with `--threads`
+threads each (default JOB_WORKER_THREADS), working the queue until
+interrupted.  `--kind` limits a worker to some job kinds, e.g. to give
+email its own pool.  Any number of workers, on any number of hosts, can
+share the queue.
+"""
+import argparse
+import logging
+import multiprocessing
+import signal
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parent
+# before app is imported: app.config reads the environment at import
+load_dotenv(ROOT / '.flaskenv')
+
+
+def work(threads, kinds):
+    from app import create_app
+    from app.jobs import JobWorker
+    app = create_app()
+    app.logger.setLevel(logging.INFO)
+    worker = JobWorker(app, threads, kinds)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    app.logger.info("Job worker running %s on %s threads", ', '.join(worker.kinds), worker.threads)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+def main():
+    from app.jobs import JOB_HANDLERS
+    parser = argparse.ArgumentParser(prog='python worker.py', description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, help='threads per process (default: JOB_WORKER_THREADS)')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes (default: 1)')
+    parser.add_argument('--kind', action='append', choices=sorted(JOB_HANDLERS),
+                        help='only run jobs of this kind (repeatable; default: all)')
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        work(args.threads, args.kind)
+        return 0
+    processes = [multiprocessing.Process(target=work, args=(args.threads, args.kind), name=f'job-worker-{i}')
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())